@@ -10,22 +10,33 @@ from collections import Counter, defaultdict
 from datetime import datetime, timedelta
 import openai
 from backend.config.settings import settings
-from ai.learning.learning_engine import LearningEngine
+from ai.learning.learning_engine import LearningEngine, get_learning_engine
+from ai.learning.columnar import ColumnarInteractions
+from ai.llm_client import get_llm_client
+from ai.llm_governor import llm_governor
 
 
 class FeedbackProcessor:
     def __init__(self, learning_engine: Optional[LearningEngine] = None):
-        self.learning_engine = learning_engine or LearningEngine()
+        self.learning_engine = learning_engine or get_learning_engine()
         openai.api_key = settings.OPENAI_API_KEY
 
-    def get_feedback_data(self) -> List[Dict[str, Any]]:
-        """Get all interactions with feedback"""
-        interactions = self.learning_engine.get_interactions()
-        return [i for i in interactions if i.get("feedback")]
+    def get_feedback_data(self, since: Optional[str] = None, until: Optional[str] = None,
+                          include_archive: bool = False) -> List[Dict[str, Any]]:
+        """Get interactions with feedback.
 
-    def analyze_feedback_patterns(self) -> Dict[str, Any]:
+        Without a time range only the hot learning data is read. A range
+        (ISO timestamps) or ``include_archive`` also reads the archive
+        segments overlapping that range.
+        """
+        if since is None and until is None and not include_archive:
+            return self.learning_engine.get_interactions(has_feedback=True)
+        return list(self.learning_engine.iter_interaction_history(since, until, has_feedback=True))
+
+    def analyze_feedback_patterns(self, since: Optional[str] = None, until: Optional[str] = None,
+                                  include_archive: bool = False) -> Dict[str, Any]:
         """Analyze feedback data for common patterns and themes"""
-        feedback_data = self.get_feedback_data()
+        feedback_data = self.get_feedback_data(since, until, include_archive)
 
         if not feedback_data:
             return {"message": "No feedback data available for analysis"}
@@ -40,7 +51,12 @@ class FeedbackProcessor:
         error_patterns = self._analyze_error_patterns(feedback_data)
 
         # Success rates over time
-        success_trends = self._analyze_success_trends(feedback_data)
+        interactions = self.learning_engine.learning_data.get("interactions")
+        if since is None and until is None and not include_archive and isinstance(interactions, ColumnarInteractions):
+            # Aggregate the timestamp and success columns directly
+            success_trends = self._format_success_trends(interactions.daily_success(has_feedback=True))
+        else:
+            success_trends = self._analyze_success_trends(feedback_data)
 
         # Query type analysis
         query_types = self._analyze_query_types(feedback_data)
@@ -96,20 +112,24 @@ class FeedbackProcessor:
 
     def _analyze_success_trends(self, feedback_data: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Analyze success rates over time"""
-        # Group by date
-        daily_stats = defaultdict(lambda: {"total": 0, "success": 0})
+        # Group by date; ISO timestamps start with the date, so no parsing is needed
+        daily_stats = defaultdict(lambda: [0, 0])
 
         for item in feedback_data:
-            date = datetime.fromisoformat(item["timestamp"]).date()
-            daily_stats[date]["total"] += 1
+            stats = daily_stats[item["timestamp"][:10]]
+            stats[0] += 1
             if item.get("success", False):
-                daily_stats[date]["success"] += 1
+                stats[1] += 1
+
+        return self._format_success_trends(daily_stats)
 
+    def _format_success_trends(self, daily_stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Turn per-date (total, success) counts into success rates"""
         trends = {}
-        for date, stats in sorted(daily_stats.items()):
-            success_rate = stats["success"] / stats["total"] if stats["total"] > 0 else 0
-            trends[str(date)] = {
-                "total_queries": stats["total"],
+        for date, (total, success) in sorted(daily_stats.items()):
+            success_rate = success / total if total > 0 else 0
+            trends[date] = {
+                "total_queries": total,
                 "success_rate": round(success_rate, 2)
             }
 
@@ -199,8 +219,9 @@ Focus on actionable improvements that can enhance accuracy and user satisfaction
 """
 
         try:
-            client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-            response = client.chat.completions.create(
+            client = get_llm_client()
+            response = llm_governor.call(
+                client.chat.completions.create,
                 model=settings.AI_MODEL,
                 messages=[{"role": "user", "content": prompt}],
                 temperature=0.3,  # Lower temperature for more focused analysis
@@ -0,0 +1,260 @@
+"""
+ABIET Columnar History
+Compact column-oriented storage for interaction history
+
+Instead of one dict per interaction, :class:`ColumnarInteractions` keeps
+one typed array per field: timestamps as int64 microseconds, success as a
+byte, and the query, SQL, feedback and error strings dictionary-encoded
+into a shared string table, so repeated queries and errors are stored
+once. Rows are materialized as dicts only when they are read, and
+``interactions[i]`` returns a live view whose writes go to the columns.
+
+Timestamps are naive ISO strings (as produced by ``datetime.now()``) and
+are converted without time zone arithmetic, so they round-trip exactly.
+Fields or timestamps that do not fit the columns are kept per row in a
+small overflow dict.
+"""
+
+from array import array
+from collections.abc import MutableMapping, Sequence
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import numpy as np
+
+_EPOCH = datetime(1970, 1, 1)
+_DAY_US = 86400 * 1000000
+# Timestamp column value for a missing or unparseable timestamp
+_NO_TIMESTAMP = -(2 ** 63)
+
+_STRING_FIELDS = ("natural_query", "generated_sql", "feedback", "error")
+FIELDS = ("id", "natural_query", "generated_sql", "success", "feedback", "error", "timestamp")
+
+
+def _to_micros(timestamp: Any) -> Optional[int]:
+    if not isinstance(timestamp, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        return None
+    delta = parsed - _EPOCH
+    micros = (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+    # Only store timestamps that format back to the same string
+    return micros if _from_micros(micros) == timestamp else None
+
+
+def _from_micros(micros: int) -> str:
+    return (_EPOCH + timedelta(microseconds=micros)).isoformat()
+
+
+class StringTable:
+    """Interns strings and hands out integer codes; code 0 is None"""
+
+    def __init__(self):
+        self._strings: List[Optional[str]] = [None]
+        self._codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._strings) - 1
+
+    def encode(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._strings)
+            self._strings.append(value)
+        return code
+
+    def decode(self, code: int) -> Optional[str]:
+        return self._strings[code]
+
+
+class _Row(MutableMapping):
+    """Live view of one row; reads and writes go to the columns"""
+
+    __slots__ = ("_columns", "_index")
+
+    def __init__(self, columns: "ColumnarInteractions", index: int):
+        self._columns = columns
+        self._index = index
+
+    def __getitem__(self, key: str) -> Any:
+        return self._columns._get(self._index, key)
+
+    def __setitem__(self, key: str, value: Any):
+        self._columns._set(self._index, key, value)
+
+    def __delitem__(self, key: str):
+        raise TypeError("Interaction fields cannot be deleted")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns._keys(self._index))
+
+    def __len__(self) -> int:
+        return len(self._columns._keys(self._index))
+
+    def __eq__(self, other: Any) -> bool:
+        return dict(self) == other
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class _IdIndex:
+    """Dict-like ID -> row view lookup; rows index themselves on append"""
+
+    def __init__(self, columns: "ColumnarInteractions"):
+        self._columns = columns
+
+    def __contains__(self, interaction_id: str) -> bool:
+        return self._columns.row_of(interaction_id) is not None
+
+    def get(self, interaction_id: str, default=None):
+        index = self._columns.row_of(interaction_id)
+        return _Row(self._columns, index) if index is not None else default
+
+    def __setitem__(self, interaction_id: str, record: Dict[str, Any]):
+        pass
+
+    def pop(self, interaction_id: str, default=None):
+        # Rows are removed by ColumnarInteractions.prune
+        return default
+
+
+class ColumnarInteractions(Sequence):
+    """List-like interaction history stored column by column"""
+
+    def __init__(self, records=()):
+        self.strings = StringTable()
+        self._clear()
+        for record in records:
+            self.append(record)
+
+    def _clear(self):
+        self._ids: List[str] = []
+        self._rows_by_id: Dict[str, int] = {}
+        self._timestamps = array("q")
+        self._success = array("b")
+        self._codes = {field: array("I") for field in _STRING_FIELDS}
+        self._overflow: Dict[int, Dict[str, Any]] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.materialize(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("interaction index out of range")
+        return _Row(self, index)
+
+    def __iter__(self) -> Iterator[_Row]:
+        for index in range(len(self)):
+            yield _Row(self, index)
+
+    def append(self, record: Dict[str, Any]):
+        index = len(self._ids)
+        self._ids.append(record.get("id"))
+        if record.get("id") is not None:
+            self._rows_by_id[record["id"]] = index
+        self._timestamps.append(_NO_TIMESTAMP)
+        self._success.append(0)
+        for field in _STRING_FIELDS:
+            self._codes[field].append(0)
+        for key, value in record.items():
+            if key != "id":
+                self._set(index, key, value)
+
+    def materialize(self, index: int) -> Dict[str, Any]:
+        """Decode one row into a plain dict"""
+        return {key: self._get(index, key) for key in self._keys(index)}
+
+    def row_of(self, interaction_id: str) -> Optional[int]:
+        return self._rows_by_id.get(interaction_id)
+
+    def id_index(self) -> "_IdIndex":
+        """Interaction ID index over the rows, for the learning store"""
+        return _IdIndex(self)
+
+    def _keys(self, index: int) -> List[str]:
+        overflow = self._overflow.get(index, {})
+        keys = list(FIELDS)
+        if self._timestamps[index] == _NO_TIMESTAMP and "timestamp" not in overflow:
+            keys.remove("timestamp")
+        return keys + [key for key in overflow if key not in FIELDS]
+
+    def _get(self, index: int, key: str) -> Any:
+        if key == "id":
+            return self._ids[index]
+        overflow = self._overflow.get(index)
+        if overflow and key in overflow:
+            return overflow[key]
+        if key in self._codes:
+            return self.strings.decode(self._codes[key][index])
+        if key == "success":
+            return bool(self._success[index])
+        if key == "timestamp" and self._timestamps[index] != _NO_TIMESTAMP:
+            return _from_micros(self._timestamps[index])
+        raise KeyError(key)
+
+    def _set(self, index: int, key: str, value: Any):
+        if key == "id":
+            raise TypeError("Interaction IDs cannot be changed")
+        stored = True
+        if key in self._codes and (value is None or isinstance(value, str)):
+            self._codes[key][index] = self.strings.encode(value)
+        elif key == "success" and isinstance(value, bool):
+            self._success[index] = int(value)
+        elif key == "timestamp" and _to_micros(value) is not None:
+            self._timestamps[index] = _to_micros(value)
+        else:
+            # Anything the typed columns cannot represent exactly
+            stored = False
+        overflow = self._overflow.get(index)
+        if stored:
+            if overflow:
+                overflow.pop(key, None)
+        else:
+            self._overflow.setdefault(index, {})[key] = value
+
+    def _timestamp(self, index: int) -> str:
+        try:
+            return self._get(index, "timestamp")
+        except KeyError:
+            return ""
+
+    def prune(self, until: str):
+        """Drop rows with a timestamp before ``until``"""
+        cutoff = _to_micros(until)
+        if cutoff is None or any("timestamp" in overflow for overflow in self._overflow.values()):
+            keep = [index for index in range(len(self)) if self._timestamp(index) >= until]
+        else:
+            # Rows without a timestamp hold the smallest int64, like "" sorts first
+            keep = np.flatnonzero(np.frombuffer(self._timestamps, dtype=np.int64) >= cutoff).tolist()
+        rows = [self.materialize(index) for index in keep]
+        # Keep the string table: most surviving strings are already in it
+        self._clear()
+        for record in rows:
+            self.append(record)
+
+    def daily_success(self, has_feedback: Optional[bool] = None) -> Dict[str, Tuple[int, int]]:
+        """Per-day (total, successful) counts, computed on the columns"""
+        if not len(self):
+            return {}
+        timestamps = np.frombuffer(self._timestamps, dtype=np.int64)
+        success = np.frombuffer(self._success, dtype=np.int8)
+        mask = timestamps != _NO_TIMESTAMP
+        if has_feedback is not None:
+            # Code 0 is None; an empty feedback string has a code but is falsy
+            feedback = np.frombuffer(self._codes["feedback"], dtype=np.uint32)
+            mask &= ((feedback != 0) & (feedback != self.strings.encode(""))) == has_feedback
+        days = timestamps[mask] // _DAY_US
+        unique_days, inverse, totals = np.unique(days, return_inverse=True, return_counts=True)
+        successes = np.bincount(inverse, weights=success[mask], minlength=len(unique_days))
+        return {(_EPOCH + timedelta(days=int(day))).date().isoformat(): (int(total), int(ok))
+                for day, total, ok in zip(unique_days, totals, successes)}
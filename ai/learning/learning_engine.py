@@ -3,46 +3,123 @@ ABIET Learning Engine
 Continuous learning from user interactions
 """
 
-from typing import Dict, Any, List
-import json
-import os
+from typing import Dict, Any, Iterator, List, Optional
+from collections import Counter
 from datetime import datetime
+import logging
+import threading
+import time
+import uuid
+from backend.config.settings import settings
+from ai.learning.storage import LearningStore, JSONFileStore, JournalStore, create_store, pattern_key, _matches
+from ai.learning.write_behind import WriteBehindBuffer
+from ai.learning.retention import LearningArchive, RetentionManager, RetentionPolicy
+from ai.learning.similarity import SimilarityIndex
+from ai.learning.suggestions import SuggestionIndex
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = ".archive"
+SIMILARITY_SUFFIX = ".similarity"
 
 class LearningEngine:
-    def __init__(self, storage_path: str = "learning_data.json"):
+    def __init__(self, storage_path: str = "learning_data.json", storage_format: Optional[str] = None,
+                 write_behind: Optional[bool] = None):
         self.storage_path = storage_path
+        self.store = self._create_store(storage_format or settings.LEARNING_STORAGE_FORMAT)
         self.learning_data = self._load_learning_data()
+        self.archive = LearningArchive(settings.LEARNING_ARCHIVE_DIR or storage_path + ARCHIVE_SUFFIX)
+        # Built on first use by find_similar_patterns, then kept up to date incrementally
+        self.similarity_index: Optional[SimilarityIndex] = None
+        self._similarity_lock = threading.Lock()
+        # Persists the similarity index after a segment is sealed, off the request path
+        self._similarity_sync: Optional[threading.Thread] = None
+        self._similarity_sync_lock = threading.Lock()
+        self.suggestion_index: Optional[SuggestionIndex] = None
+        self._suggestion_lock = threading.Lock()
+        self._suggestions_refreshed = 0.0
+
+        self.write_buffer = None
+        if settings.LEARNING_WRITE_BEHIND if write_behind is None else write_behind:
+            self.write_buffer = WriteBehindBuffer(
+                self.store.persist,
+                max_queue=settings.LEARNING_WRITE_BEHIND_MAX_QUEUE,
+                batch_size=settings.LEARNING_WRITE_BEHIND_BATCH_SIZE,
+                flush_interval=settings.LEARNING_WRITE_BEHIND_FLUSH_INTERVAL,
+            )
+            self.store.write_buffer = self.write_buffer
+
+    def _create_store(self, storage_format: str) -> LearningStore:
+        """Create the persistence backend for the configured storage format"""
+        options = {
+            "fsync": settings.LEARNING_FSYNC,
+            "fsync_interval": settings.LEARNING_FSYNC_INTERVAL,
+            "refresh_interval": settings.LEARNING_REFRESH_INTERVAL,
+        }
+        if storage_format == JournalStore.format:
+            options["compact_every"] = settings.LEARNING_JOURNAL_COMPACT_EVERY
+        if storage_format in (JSONFileStore.format, JournalStore.format):
+            options["columnar"] = settings.LEARNING_COLUMNAR_HISTORY
+        return create_store(self.storage_path, storage_format, **options)
+
+    def flush(self):
+        """Wait until all queued writes have reached storage"""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
+    def close(self):
+        """Flush queued writes and release storage resources"""
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+        if self._similarity_sync is not None:
+            self._similarity_sync.join()
+        if self.similarity_index is not None:
+            self.similarity_index.sync(self._similarity_source)
+        self.store.close()
+
+    def get_write_metrics(self) -> Dict[str, Any]:
+        """Write-behind queue depth and flush latency"""
+        if self.write_buffer is None:
+            return {"write_behind": False}
+        return {"write_behind": True, **self.write_buffer.metrics()}
         
     def _load_learning_data(self) -> Dict[str, Any]:
         """Load learning data from storage"""
-        default_data = {"patterns": [], "corrections": [], "interactions": [], "usage_stats": {}}
-        if os.path.exists(self.storage_path):
-            with open(self.storage_path, 'r') as f:
-                loaded = json.load(f)
-            # Merge with defaults to ensure all keys exist
-            for key, value in default_data.items():
-                if key not in loaded:
-                    loaded[key] = value
-            return loaded
-        return default_data
+        return self.store.load()
     
     def save_learning_data(self):
-        """Save learning data to storage"""
-        with open(self.storage_path, 'w') as f:
-            json.dump(self.learning_data, f, indent=2)
+        """Save the full learning data to storage"""
+        self.store.save(self.learning_data)
     
     def record_query_pattern(self, natural_query: str, generated_sql: str, success: bool):
-        """Record a query pattern for learning"""
+        """Record a query pattern for learning.
+
+        Patterns are keyed by their normalized natural query and SQL; using a
+        known pattern again increments its counters instead of adding a
+        record. ``timestamp`` is the last time the pattern was used and
+        ``success`` its latest outcome.
+        """
+        now = datetime.now().isoformat()
         pattern = {
+            "key": pattern_key(natural_query, generated_sql),
             "natural_query": natural_query,
             "generated_sql": generated_sql,
             "success": success,
-            "timestamp": datetime.now().isoformat(),
-            "usage_count": 1
+            "timestamp": now,
+            "first_seen": now,
+            "usage_count": 1,
+            "success_count": 1 if success else 0,
+            "failure_count": 0 if success else 1
         }
         
-        self.learning_data["patterns"].append(pattern)
-        self.save_learning_data()
+        self.store.merge_pattern(pattern)
+        if success:
+            self._index_query(pattern)
+
+    def get_pattern(self, natural_query: str, generated_sql: str) -> Optional[Dict[str, Any]]:
+        """Get the aggregated pattern for a (natural query, SQL) pair"""
+        self.store.refresh()
+        return self.store.get_pattern(pattern_key(natural_query, generated_sql))
     
     def record_correction(self, original_query: str, corrected_query: str):
         """Record a user correction for learning"""
@@ -52,12 +129,33 @@ class LearningEngine:
             "timestamp": datetime.now().isoformat()
         }
         
-        self.learning_data["corrections"].append(correction)
-        self.save_learning_data()
+        self.store.append("corrections", correction)
     
-    def record_interaction(self, natural_query: str, generated_sql: str = None, success: bool = True, feedback: str = None, error: str = None):
-        """Record an interaction with OpenAI responses"""
-        interaction = {
+    def record_interaction(self, natural_query: str, generated_sql: str = None, success: bool = True, feedback: str = None, error: str = None) -> str:
+        """Record an interaction with OpenAI responses and return its ID"""
+        interaction = self._new_interaction(natural_query, generated_sql, success, feedback, error)
+        self.store.append("interactions", interaction)
+        self._index_interaction(interaction)
+        return interaction["id"]
+
+    def record_interactions(self, interactions: List[Dict[str, Any]]) -> List[str]:
+        """Record several interactions in a single storage write and return their IDs.
+
+        Each item takes the arguments of :meth:`record_interaction`, plus an
+        optional ``interaction_id`` for callers that hand out IDs before the
+        write.
+        """
+        records = [self._new_interaction(**interaction) for interaction in interactions]
+        self.store.append_many("interactions", records)
+        for record in records:
+            self._index_interaction(record)
+        return [record["id"] for record in records]
+
+    def _new_interaction(self, natural_query: str, generated_sql: str = None, success: bool = True,
+                         feedback: str = None, error: str = None,
+                         interaction_id: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "id": interaction_id or uuid.uuid4().hex,
             "natural_query": natural_query,
             "generated_sql": generated_sql,
             "success": success,
@@ -65,29 +163,187 @@ class LearningEngine:
             "error": error,
             "timestamp": datetime.now().isoformat()
         }
-        
-        self.learning_data["interactions"].append(interaction)
-        self.save_learning_data()
+
+    def _index_interaction(self, interaction: Dict[str, Any]):
+        """Feed a recorded interaction to the similarity and suggestion indexes"""
+        if interaction["success"] and interaction["generated_sql"]:
+            self._index_query(interaction)
+        if interaction["success"] and self.suggestion_index is not None:
+            self.suggestion_index.record(interaction["natural_query"], interaction["timestamp"], interaction["id"])
     
     def add_feedback_to_interaction(self, interaction_index: int, feedback: str):
-        """Add user feedback to an existing interaction"""
+        """Add user feedback to an existing interaction by list position.
+
+        Positions shift as other workers append; prefer ``add_feedback``.
+        """
+        self.store.refresh()
         if 0 <= interaction_index < len(self.learning_data["interactions"]):
-            self.learning_data["interactions"][interaction_index]["feedback"] = feedback
-            self.save_learning_data()
+            self.store.update("interactions", interaction_index, {"feedback": feedback})
+
+    def add_feedback(self, interaction_id: str, feedback: str) -> bool:
+        """Add user feedback to the interaction with the given ID"""
+        return not self.add_feedback_bulk({interaction_id: feedback})["missing"]
+
+    def add_feedback_bulk(self, feedback_by_id: Dict[str, str]) -> Dict[str, List[str]]:
+        """Attach feedback to several interactions in a single storage write"""
+        self.store.refresh()
+        updated, missing = [], []
+        for interaction_id in feedback_by_id:
+            (updated if self.store.has_interaction(interaction_id) else missing).append(interaction_id)
+        if updated:
+            self.store.update_interactions({interaction_id: {"feedback": feedback_by_id[interaction_id]}
+                                            for interaction_id in updated})
+        return {"updated": updated, "missing": missing}
     
-    def get_interactions(self, limit: int = None) -> List[Dict[str, Any]]:
-        """Get recorded interactions, optionally limited"""
-        interactions = self.learning_data["interactions"]
-        if limit:
-            interactions = interactions[-limit:]
+    def get_interactions(self, limit: int = None, **filters) -> List[Dict[str, Any]]:
+        """Get recorded interactions, optionally limited and filtered.
+
+        Supported filters are ``success``, ``has_feedback``, ``since`` and
+        ``until`` (ISO timestamps); they are evaluated by the storage backend.
+        """
+        self.store.refresh()
+        interactions, _ = self.store.page_interactions(limit, **filters)
         return interactions
+
+    def get_interaction_page(self, limit: int, before: Optional[int] = None, **filters) -> Dict[str, Any]:
+        """Get one page of interactions using keyset paging.
+
+        Pass the returned ``next_cursor`` as ``before`` to fetch the next,
+        older page.
+        """
+        self.store.refresh()
+        interactions, next_cursor = self.store.page_interactions(limit, before, **filters)
+        return {"interactions": interactions, "next_cursor": next_cursor}
+
+    def count_interactions(self, **filters) -> int:
+        """Count recorded interactions matching the given filters"""
+        self.store.refresh()
+        return self.store.count_interactions(**filters)
     
-    def find_similar_patterns(self, query: str, threshold: float = 0.8) -> List[Dict[str, Any]]:
-        """Find similar query patterns"""
-        # Implement similarity search (placeholder)
-        return []
+    def get_query_counts(self) -> Dict[str, int]:
+        """How often each natural query succeeded, across the hot interaction history"""
+        self.store.refresh()
+        counts = Counter()
+        for interaction in self.store.iter_interactions(success=True):
+            if interaction.get("generated_sql"):
+                counts[interaction["natural_query"]] += 1
+        return dict(counts)
+
+    def iter_interaction_history(self, since: Optional[str] = None, until: Optional[str] = None,
+                                 include_archive: bool = True, **filters) -> Iterator[Dict[str, Any]]:
+        """Stream interactions in ``[since, until)``, oldest first.
+
+        Archived segments are only opened when they overlap the requested
+        range, so recent ranges never touch the archive.
+        """
+        seen = set()
+        if include_archive:
+            for interaction in self.archive.iter_records("interactions", since, until):
+                if _matches(interaction, **filters):
+                    seen.add(interaction.get("id"))
+                    yield interaction
+        self.store.refresh()
+        for interaction in self.store.iter_interactions(since=since, until=until, **filters):
+            # Records archived just before a crash may still be in the hot store
+            if not seen or interaction.get("id") not in seen:
+                yield interaction
+
+    def apply_retention(self, max_age_days: Optional[float] = None,
+                        max_records: Optional[int] = None) -> Dict[str, int]:
+        """Move records outside the retention policy to the archive"""
+        policy = RetentionPolicy(
+            settings.LEARNING_RETENTION_MAX_AGE_DAYS if max_age_days is None else max_age_days,
+            settings.LEARNING_RETENTION_MAX_RECORDS if max_records is None else max_records,
+        )
+        return RetentionManager(self, self.archive, policy).run()
+
+    def _similarity_source(self, since: str) -> Iterator[Dict[str, Any]]:
+        """Successful queries recorded at or after ``since``, for the similarity index"""
+        for pattern in list(self.learning_data["patterns"]):
+            if pattern.get("success") and pattern.get("timestamp", "") >= since:
+                yield pattern
+        for interaction in self.store.iter_interactions(since=since or None, success=True):
+            if interaction.get("generated_sql"):
+                yield interaction
+
+    def _get_similarity_index(self) -> SimilarityIndex:
+        with self._similarity_lock:
+            if self.similarity_index is None:
+                index = SimilarityIndex(settings.LEARNING_SIMILARITY_DIR or self.storage_path + SIMILARITY_SUFFIX)
+                # Loads the persisted index and vectorizes only what was recorded since
+                self.store.refresh()
+                index.sync(self._similarity_source)
+                self.similarity_index = index
+            return self.similarity_index
+
+    def _index_query(self, record: Dict[str, Any]):
+        index = self.similarity_index
+        if index is not None and index.add(record["natural_query"], record.get("generated_sql"),
+                                           record.get("timestamp", "")):
+            self._sync_similarity_in_background(index)
+
+    def _sync_similarity_in_background(self, index: SimilarityIndex):
+        """Write a newly sealed segment to disk on a daemon thread.
+
+        While a sync is running, further seals are left to the next one (at
+        the latest on :meth:`close`); the watermark catch-up on open covers a
+        crash in between.
+        """
+        with self._similarity_sync_lock:
+            if self._similarity_sync is not None and self._similarity_sync.is_alive():
+                return
+
+            def run():
+                try:
+                    index.sync(self._similarity_source)
+                except Exception as e:
+                    logger.error(f"Failed to save the similarity index: {str(e)}")
+
+            self._similarity_sync = threading.Thread(target=run, name="similarity-sync", daemon=True)
+            self._similarity_sync.start()
+
+    def find_similar_patterns(self, query: str, threshold: float = 0.8, limit: int = 10) -> List[Dict[str, Any]]:
+        """Find previously successful queries similar to ``query``.
+
+        Returns up to ``limit`` records (natural query, generated SQL and a
+        ``similarity`` score between 0 and 1), most similar first.
+        """
+        matches = self._get_similarity_index().search(query, k=limit, threshold=threshold)
+        return [{**document, "similarity": score} for document, score in matches]
     
-    def get_query_suggestions(self, partial_query: str) -> List[str]:
-        """Get query suggestions based on partial input"""
-        # Implement suggestion engine
-        return []
+    def _get_suggestion_index(self) -> SuggestionIndex:
+        with self._suggestion_lock:
+            index = self.suggestion_index
+            if index is None:
+                index = SuggestionIndex(max_entries=settings.LEARNING_SUGGESTION_MAX_ENTRIES,
+                                        half_life_days=settings.LEARNING_SUGGESTION_HALF_LIFE_DAYS)
+            elif time.monotonic() - self._suggestions_refreshed < settings.LEARNING_SUGGESTION_REFRESH_INTERVAL:
+                return index
+            # Built from history once, then only queries recorded since are read
+            self.store.refresh()
+            index.catch_up(self.store.iter_interactions(success=True, since=index.catch_up_since()))
+            self._suggestions_refreshed = time.monotonic()
+            self.suggestion_index = index
+            return index
+
+    def get_query_suggestions(self, partial_query: str, limit: int = 5) -> List[str]:
+        """Get completions for a partial query from successful past queries,
+        ranked by how often and how recently they were used"""
+        return self._get_suggestion_index().suggest(partial_query, limit)
+
+
+_shared_engine: Optional[LearningEngine] = None
+_shared_engine_lock = threading.Lock()
+
+
+def get_learning_engine() -> LearningEngine:
+    """Get the process-wide learning engine.
+
+    The query processor, the learning routes and the feedback processor all
+    share this instance so they never hold diverging copies of the data.
+    """
+    global _shared_engine
+    with _shared_engine_lock:
+        if _shared_engine is None:
+            _shared_engine = LearningEngine(settings.LEARNING_STORAGE_PATH)
+        return _shared_engine
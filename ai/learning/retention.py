@@ -0,0 +1,182 @@
+"""
+ABIET Learning Retention
+Age and count based retention with compressed archive segments
+
+Records that fall outside the retention policy are written to a gzipped
+JSONL segment in the archive directory and then pruned from the learning
+store, so the hot data loaded on startup stays small. Segment file names
+carry the collection and the timestamp range they cover, which lets
+readers open only the segments that overlap the range they ask for.
+
+A segment is written before the records are pruned. A crash in between
+leaves the records in both places; archive readers drop interactions they
+have already seen by ID.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional
+import glob
+import gzip
+import json
+import logging
+import os
+import threading
+import uuid
+from ai.learning.storage import _file_lock
+
+logger = logging.getLogger(__name__)
+
+RETAINED_COLLECTIONS = ("interactions", "patterns", "corrections")
+SEGMENT_SUFFIX = ".jsonl.gz"
+
+
+def _segment_key(timestamp: str) -> str:
+    """File-name safe form of an ISO timestamp that sorts the same way"""
+    return timestamp.replace(":", "")
+
+
+class LearningArchive:
+    """Directory of compressed, immutable archive segments"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.lock_path = os.path.join(directory, ".lock")
+
+    def write_segment(self, collection: str, records: List[Dict[str, Any]]) -> Optional[str]:
+        """Write records to a new segment and return its path"""
+        if not records:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        timestamps = [record.get("timestamp", "") for record in records]
+        name = (f"{collection}_{_segment_key(min(timestamps))}_{_segment_key(max(timestamps))}"
+                f"_{uuid.uuid4().hex[:8]}{SEGMENT_SUFFIX}")
+        path = os.path.join(self.directory, name)
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, 'wt') as f:
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        # Make the segment durable before the records leave the hot store
+        with open(tmp_path, 'rb') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return path
+
+    def segments(self, collection: str, since: Optional[str] = None, until: Optional[str] = None) -> List[str]:
+        """Paths of the segments overlapping ``[since, until)``, oldest first"""
+        matching = []
+        for path in glob.glob(os.path.join(self.directory, f"{collection}_*{SEGMENT_SUFFIX}")):
+            name = os.path.basename(path)[len(collection) + 1:-len(SEGMENT_SUFFIX)]
+            parts = name.rsplit("_", 2)
+            if len(parts) != 3:
+                logger.warning(f"Skipping unrecognized archive file {path}")
+                continue
+            first, last, _ = parts
+            if since is not None and last < _segment_key(since):
+                continue
+            if until is not None and first >= _segment_key(until):
+                continue
+            matching.append((first, path))
+        return [path for _, path in sorted(matching)]
+
+    def iter_records(self, collection: str, since: Optional[str] = None,
+                     until: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Lazily stream archived records in ``[since, until)``"""
+        for path in self.segments(collection, since, until):
+            with gzip.open(path, 'rt') as f:
+                for line in f:
+                    record = json.loads(line)
+                    timestamp = record.get("timestamp", "")
+                    if since is not None and timestamp < since:
+                        continue
+                    if until is not None and timestamp >= until:
+                        continue
+                    yield record
+
+
+class RetentionPolicy:
+    """Keep records newer than ``max_age_days`` and at most ``max_records``
+    per collection; 0 disables either limit"""
+
+    def __init__(self, max_age_days: float = 0, max_records: int = 0):
+        self.max_age_days = max_age_days
+        self.max_records = max_records
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_age_days > 0 or self.max_records > 0
+
+    def cutoff(self, store, collection: str, now: Optional[datetime] = None) -> Optional[str]:
+        """Timestamp before which records of ``collection`` expire"""
+        cutoffs = []
+        if self.max_age_days > 0:
+            cutoffs.append(((now or datetime.now()) - timedelta(days=self.max_age_days)).isoformat())
+        if self.max_records > 0:
+            newest_kept = store.newest_timestamp(collection, self.max_records)
+            if newest_kept is not None and store.count_records(collection) > self.max_records:
+                cutoffs.append(newest_kept)
+        return max(cutoffs) if cutoffs else None
+
+
+class RetentionManager:
+    """Moves expired learning records from the hot store to the archive"""
+
+    def __init__(self, learning_engine, archive: LearningArchive, policy: RetentionPolicy,
+                 collections=RETAINED_COLLECTIONS):
+        self.learning_engine = learning_engine
+        self.archive = archive
+        self.policy = policy
+        self.collections = collections
+
+    def run(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Archive and prune expired records; returns the number moved per collection"""
+        archived = {collection: 0 for collection in self.collections}
+        if not self.policy.enabled:
+            return archived
+        store = self.learning_engine.store
+        os.makedirs(self.archive.directory, exist_ok=True)
+        # One worker at a time, so records are never archived twice
+        with _file_lock(self.archive.lock_path):
+            self.learning_engine.flush()
+            store.refresh(force=True)
+            for collection in self.collections:
+                until = self.policy.cutoff(store, collection, now)
+                if until is None:
+                    continue
+                records = list(store.iter_records_before(collection, until))
+                if not records:
+                    continue
+                self.archive.write_segment(collection, records)
+                store.prune(collection, until)
+                archived[collection] = len(records)
+                logger.info(f"Archived {len(records)} {collection} older than {until}")
+            self.learning_engine.flush()
+            if any(archived.values()):
+                store.compact()
+        return archived
+
+
+class RetentionJob:
+    """Runs a retention manager periodically on a daemon thread"""
+
+    def __init__(self, manager: RetentionManager, interval: float):
+        self.manager = manager
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="learning-retention", daemon=True)
+
+    def start(self) -> "RetentionJob":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.manager.run()
+            except Exception as e:
+                logger.error(f"Learning retention run failed: {str(e)}")
+            self._stop.wait(self.interval)
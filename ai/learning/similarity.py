@@ -0,0 +1,455 @@
+"""
+ABIET Similarity Index
+Incremental n-gram TF-IDF index over recorded natural language queries
+
+Queries are vectorized into hashed word (unigram and bigram) and character
+trigram features, so new documents never change the feature space and can
+be indexed without touching existing ones. Postings are kept feature-major
+(one sorted run of ``(doc, weight)`` per feature) in immutable segments;
+a search only reads the postings of the features present in the query.
+
+New documents go to a small in-memory delta that is sealed into a segment
+every ``merge_every`` documents. Segments are weighted with the IDF known
+when they are sealed and re-weighted when they are consolidated, which
+happens once more than ``max_segments`` exist.
+
+On disk the index is a directory of ``.npy`` arrays opened with
+``mmap_mode="r"``, a ``documents.jsonl`` file and a ``meta.json``
+manifest, so loading does not re-vectorize the history. Updated documents
+are appended to ``documents.jsonl``, which is rewritten with one line per
+document whenever a new segment is saved. The manifest
+records a timestamp watermark; :meth:`SimilarityIndex.open` and
+:meth:`SimilarityIndex.sync` index any learning records newer than it.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, Iterable, List, Optional, Tuple
+import json
+import logging
+import math
+import os
+import re
+import threading
+import uuid
+import zlib
+import numpy as np
+from ai.learning.storage import _file_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEATURES = 2 ** 18
+INDEX_VERSION = 1
+# Re-scan this many seconds before the watermark on catch-up, for records
+# other workers persisted late; re-indexing a known query is a no-op
+WATERMARK_OVERLAP_SECONDS = 60
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase and collapse whitespace and punctuation"""
+    return " ".join(_WORD_RE.findall((query or "").lower()))
+
+
+def _hash(feature: str, n_features: int) -> int:
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(feature.encode()) % n_features
+
+
+def vectorize(query: str, n_features: int = DEFAULT_FEATURES) -> Dict[int, float]:
+    """Hashed feature -> sublinear term frequency (1 + log tf)"""
+    normalized = normalize_query(query)
+    words = normalized.split()
+    counts: Dict[int, int] = {}
+    grams = [f"w:{word}" for word in words]
+    grams += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+    padded = f" {normalized} "
+    grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    for gram in grams:
+        feature = _hash(gram, n_features)
+        counts[feature] = counts.get(feature, 0) + 1
+    return {feature: 1.0 + math.log(count) for feature, count in counts.items()}
+
+
+class _Segment:
+    """Immutable feature-major postings for a range of documents"""
+
+    def __init__(self, indptr: np.ndarray, docs: np.ndarray, ltf: np.ndarray, weights: np.ndarray,
+                 name: Optional[str] = None):
+        self.indptr = indptr
+        self.docs = docs
+        self.ltf = ltf
+        self.weights = weights
+        # Set once the segment's arrays are on disk
+        self.name = name
+
+    @classmethod
+    def build(cls, vectors: List[Tuple[int, Dict[int, float]]], idf: np.ndarray, n_features: int) -> "_Segment":
+        features, docs, ltf = [], [], []
+        for doc, vector in vectors:
+            features.extend(vector.keys())
+            docs.extend([doc] * len(vector))
+            ltf.extend(vector.values())
+        return cls._from_postings(np.asarray(features, dtype=np.int64), np.asarray(docs, dtype=np.int32),
+                                  np.asarray(ltf, dtype=np.float32), idf, n_features)
+
+    @classmethod
+    def _from_postings(cls, features: np.ndarray, docs: np.ndarray, ltf: np.ndarray, idf: np.ndarray,
+                       n_features: int) -> "_Segment":
+        order = np.lexsort((docs, features))
+        features, docs, ltf = features[order], docs[order], ltf[order]
+        # L2-normalize each document's TF-IDF vector
+        weights = ltf * idf[features]
+        norms = np.sqrt(np.bincount(docs, weights=weights * weights))
+        weights = (weights / norms[docs]).astype(np.float32)
+        indptr = np.zeros(n_features + 1, dtype=np.int64)
+        np.cumsum(np.bincount(features, minlength=n_features), out=indptr[1:])
+        return cls(indptr, docs, ltf, weights)
+
+    @classmethod
+    def merge(cls, segments: List["_Segment"], idf: np.ndarray, n_features: int) -> "_Segment":
+        """Consolidate segments, re-weighting them with the current IDF"""
+        features = np.concatenate([np.repeat(np.arange(n_features), np.diff(s.indptr)) for s in segments])
+        docs = np.concatenate([np.asarray(s.docs) for s in segments])
+        ltf = np.concatenate([np.asarray(s.ltf) for s in segments])
+        return cls._from_postings(features, docs, ltf, idf, n_features)
+
+    def save(self, directory: str):
+        name = f"seg-{uuid.uuid4().hex[:12]}"
+        for field in ("indptr", "docs", "ltf", "weights"):
+            np.save(os.path.join(directory, f"{name}.{field}.npy"), getattr(self, field))
+        self.name = name
+
+    @classmethod
+    def open(cls, directory: str, name: str) -> "_Segment":
+        arrays = [np.load(os.path.join(directory, f"{name}.{field}.npy"), mmap_mode="r")
+                  for field in ("indptr", "docs", "ltf", "weights")]
+        return cls(*arrays, name=name)
+
+
+class SimilarityIndex:
+    """Top-k cosine similarity search over recorded queries"""
+
+    def __init__(self, directory: str, n_features: int = DEFAULT_FEATURES, merge_every: int = 1000,
+                 max_segments: int = 8):
+        self.directory = directory
+        self.lock_path = os.path.join(directory, ".lock")
+        self.n_features = n_features
+        self.merge_every = merge_every
+        self.max_segments = max_segments
+        self._lock = threading.RLock()
+        # Serializes syncs, which only take ``_lock`` to snapshot and swap state
+        self._sync_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.documents: List[Dict[str, Any]] = []
+        self._doc_ids: Dict[str, int] = {}
+        self._df = np.zeros(self.n_features, dtype=np.int32)
+        self._segments: List[_Segment] = []
+        # Unsealed documents: (doc, vector), plus feature -> [(doc, ltf)]
+        self._delta: List[Tuple[int, Dict[int, float]]] = []
+        self._delta_postings: Dict[int, List[Tuple[int, float]]] = {}
+        self._dirty_docs: List[int] = []
+        # Scratch scores reused across searches; all zero between searches
+        self._scores = np.zeros(0, dtype=np.float32)
+        self._generation: Optional[str] = None
+        self.watermark = ""
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def _idf(self) -> np.ndarray:
+        return (np.log((1.0 + len(self.documents)) / (1.0 + self._df)) + 1.0).astype(np.float32)
+
+    def add(self, natural_query: str, generated_sql: Optional[str] = None, timestamp: str = "") -> bool:
+        """Index a query; a known query only has its SQL updated.
+
+        Returns True when the delta was sealed into a new segment, i.e. when
+        it is a good moment to :meth:`sync` the index to disk.
+        """
+        key = normalize_query(natural_query)
+        if not key:
+            return False
+        with self._lock:
+            doc = self._doc_ids.get(key)
+            if doc is not None:
+                document = self.documents[doc]
+                if generated_sql and generated_sql != document.get("generated_sql"):
+                    document["generated_sql"] = generated_sql
+                    self._dirty_docs.append(doc)
+                return False
+            doc = len(self.documents)
+            self.documents.append({"natural_query": natural_query, "generated_sql": generated_sql,
+                                   "timestamp": timestamp})
+            self._doc_ids[key] = doc
+            self._dirty_docs.append(doc)
+            vector = vectorize(natural_query, self.n_features)
+            self._df[list(vector)] += 1
+            self._delta.append((doc, vector))
+            for feature, ltf in vector.items():
+                self._delta_postings.setdefault(feature, []).append((doc, ltf))
+            if len(self._delta) < self.merge_every:
+                return False
+            self._seal()
+            return True
+
+    def _seal(self):
+        """Turn the delta into a segment. Caller holds ``_lock``."""
+        if self._delta:
+            self._segments.append(_Segment.build(self._delta, self._idf(), self.n_features))
+            self._delta = []
+            self._delta_postings = {}
+        if len(self._segments) > self.max_segments:
+            self._segments = [_Segment.merge(self._segments, self._idf(), self.n_features)]
+
+    def search(self, query: str, k: int = 10, threshold: float = 0.0) -> List[Tuple[Dict[str, Any], float]]:
+        """Return up to ``k`` (document, cosine similarity) pairs scoring at least ``threshold``"""
+        vector = vectorize(query, self.n_features)
+        with self._lock:
+            if not vector or not self.documents:
+                return []
+            idf = self._idf()
+            features = np.fromiter(vector.keys(), dtype=np.int64, count=len(vector))
+            query_weights = np.fromiter(vector.values(), dtype=np.float32, count=len(vector)) * idf[features]
+            query_weights /= np.linalg.norm(query_weights)
+
+            scores = self._score_buffer()
+            touched = []
+            for segment in self._segments:
+                for feature, weight in zip(features, query_weights):
+                    start, end = segment.indptr[feature], segment.indptr[feature + 1]
+                    if start != end:
+                        # A document appears at most once per feature
+                        docs = segment.docs[start:end]
+                        scores[docs] += weight * segment.weights[start:end]
+                        touched.append(docs)
+            if self._delta:
+                touched.append(self._score_delta(scores, dict(zip(features.tolist(), query_weights.tolist())), idf))
+            if not touched:
+                return []
+
+            # Only documents sharing a feature with the query have a score
+            candidates = np.unique(np.concatenate(touched))
+            candidate_scores = scores[candidates]
+            scores[candidates] = 0
+            keep = candidate_scores >= max(threshold, 1e-6)
+            candidates, candidate_scores = candidates[keep], candidate_scores[keep]
+            if len(candidates) > k:
+                top = np.argpartition(-candidate_scores, k - 1)[:k]
+                candidates, candidate_scores = candidates[top], candidate_scores[top]
+            order = np.argsort(-candidate_scores, kind="stable")
+            return [(dict(self.documents[doc]), round(float(score), 4))
+                    for doc, score in zip(candidates[order], candidate_scores[order])]
+
+    def _score_buffer(self) -> np.ndarray:
+        """Zeroed scores with a slot per document. Caller holds ``_lock``."""
+        if len(self._scores) < len(self.documents):
+            self._scores = np.zeros(max(len(self.documents), 2 * len(self._scores)), dtype=np.float32)
+        return self._scores
+
+    def _score_delta(self, scores: np.ndarray, query_weights: Dict[int, float], idf: np.ndarray) -> np.ndarray:
+        """Score unsealed documents with the current IDF and return the scored
+        ones. Caller holds ``_lock``."""
+        dots: Dict[int, float] = {}
+        for feature, weight in query_weights.items():
+            for doc, ltf in self._delta_postings.get(feature, ()):
+                dots[doc] = dots.get(doc, 0.0) + weight * ltf * float(idf[feature])
+        for doc, vector in self._delta:
+            if doc in dots:
+                norm = math.sqrt(sum((ltf * float(idf[feature])) ** 2 for feature, ltf in vector.items()))
+                scores[doc] = dots[doc] / norm
+        return np.fromiter(dots.keys(), dtype=np.int64, count=len(dots))
+
+    def catch_up(self, source: Callable[[str], Iterable[Dict[str, Any]]]):
+        """Index records newer than the watermark.
+
+        ``source(since)`` yields learning records (``natural_query``,
+        ``generated_sql``, ``timestamp``) with a timestamp of at least ``since``.
+        """
+        since = ""
+        if self.watermark:
+            try:
+                since = (datetime.fromisoformat(self.watermark)
+                         - timedelta(seconds=WATERMARK_OVERLAP_SECONDS)).isoformat()
+            except ValueError:
+                since = ""
+        watermark = self.watermark
+        for record in source(since):
+            self.add(record.get("natural_query", ""), record.get("generated_sql"), record.get("timestamp", ""))
+            watermark = max(watermark, record.get("timestamp", ""))
+        self.watermark = watermark
+
+    def open(self, source: Optional[Callable[[str], Iterable[Dict[str, Any]]]] = None) -> "SimilarityIndex":
+        """Load the persisted index, then index newer records from ``source``"""
+        with self._lock:
+            with _file_lock(self.lock_path, shared=True, create=False):
+                self._read()
+            if source is not None:
+                self.catch_up(source)
+        return self
+
+    def sync(self, source: Optional[Callable[[str], Iterable[Dict[str, Any]]]] = None):
+        """Write unsaved segments and documents to disk.
+
+        If another worker saved the index since we loaded it, its version is
+        loaded instead and our records are re-indexed from ``source``. Loading,
+        sealing and writing happen outside ``_lock``, so :meth:`add` and
+        :meth:`search` only wait while the results are swapped in.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with self._sync_lock, _file_lock(self.lock_path):
+            if self._disk_generation() != self._generation:
+                self._reload(source)
+            elif source is not None:
+                self.catch_up(source)
+            self._seal_unlocked()
+            self._write()
+
+    def _reload(self, source: Optional[Callable[[str], Iterable[Dict[str, Any]]]]):
+        """Load the persisted index next to this one and swap it in, keeping
+        documents added in the meantime. Caller holds the file lock."""
+        with self._lock:
+            start = len(self.documents)
+        fresh = SimilarityIndex(self.directory, self.n_features, self.merge_every, self.max_segments)
+        fresh._read()
+        if source is not None:
+            fresh.catch_up(source)
+        with self._lock:
+            added = self.documents[start:]
+            for name in ("documents", "_doc_ids", "_df", "_segments", "_delta", "_delta_postings",
+                         "_dirty_docs", "_generation", "watermark"):
+                setattr(self, name, getattr(fresh, name))
+            for document in added:
+                self.add(document["natural_query"], document.get("generated_sql"), document.get("timestamp", ""))
+
+    def _seal_unlocked(self):
+        """Like :meth:`_seal`, but builds segments from a snapshot outside ``_lock``"""
+        with self._lock:
+            delta, idf = list(self._delta), self._idf()
+        if delta:
+            segment = _Segment.build(delta, idf, self.n_features)
+            with self._lock:
+                # add() seals a full delta itself; then these documents have a segment already
+                if self._delta[:len(delta)] == delta:
+                    self._segments.append(segment)
+                    self._delta = self._delta[len(delta):]
+                    self._delta_postings = {}
+                    for doc, vector in self._delta:
+                        for feature, ltf in vector.items():
+                            self._delta_postings.setdefault(feature, []).append((doc, ltf))
+        with self._lock:
+            segments, idf = list(self._segments), self._idf()
+        if len(segments) > self.max_segments:
+            merged = _Segment.merge(segments, idf, self.n_features)
+            with self._lock:
+                if self._segments[:len(segments)] == segments:
+                    self._segments = [merged] + self._segments[len(segments):]
+
+    def _disk_generation(self) -> Optional[str]:
+        meta = self._read_meta()
+        return meta["generation"] if meta else None
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.directory, "meta.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION or meta.get("n_features") != self.n_features:
+            logger.warning(f"Ignoring incompatible similarity index in {self.directory}")
+            return None
+        return meta
+
+    def _read(self):
+        """Replace the in-memory index with the persisted one. Caller holds ``_lock``."""
+        self._reset()
+        meta = self._read_meta()
+        if meta is None:
+            return
+        documents: Dict[int, Dict[str, Any]] = {}
+        with open(os.path.join(self.directory, "documents.jsonl"), 'r') as f:
+            for line in f:
+                try:
+                    document = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # Later lines update earlier ones; lines past n_docs are from an interrupted save
+                if document["id"] < meta["n_docs"]:
+                    documents[document.pop("id")] = document
+        self.documents = [documents[doc] for doc in range(meta["n_docs"])]
+        self._doc_ids = {normalize_query(document["natural_query"]): doc
+                         for doc, document in enumerate(self.documents)}
+        self._df = np.array(np.load(os.path.join(self.directory, f"df-{meta['generation']}.npy")))
+        self._segments = [_Segment.open(self.directory, name) for name in meta["segments"]]
+        self._generation = meta["generation"]
+        self.watermark = meta.get("watermark", "")
+
+    def _write(self):
+        """Save a snapshot of the sealed documents. Caller holds the file lock.
+
+        Documents added since the delta was sealed are left out (and stay
+        dirty) so that every saved document is in a saved segment.
+        """
+        with self._lock:
+            n_docs = self._delta[0][0] if self._delta else len(self.documents)
+            segments = list(self._segments)
+            documents = self.documents[:n_docs]
+            dirty = sorted({doc for doc in self._dirty_docs if doc < n_docs})
+            self._dirty_docs = [doc for doc in self._dirty_docs if doc >= n_docs]
+            updates = [(doc, dict(documents[doc])) for doc in dirty]
+            df = self._df.copy()
+            for _, vector in self._delta:
+                df[list(vector)] -= 1
+            watermark = self.watermark
+        try:
+            generation = self._save(segments, documents, updates, df, watermark)
+        except Exception:
+            with self._lock:
+                self._dirty_docs.extend(dirty)
+            raise
+        with self._lock:
+            self._generation = generation
+
+    def _save(self, segments: List[_Segment], documents: List[Dict[str, Any]],
+              updates: List[Tuple[int, Dict[str, Any]]], df: np.ndarray, watermark: str) -> str:
+        """Write a snapshot taken by :meth:`_write` and return its generation"""
+        sealed = False
+        for segment in segments:
+            if segment.name is None:
+                segment.save(self.directory)
+                sealed = True
+        path = os.path.join(self.directory, "documents.jsonl")
+        if sealed:
+            # Compact: drop the superseded lines of updated documents. Until the
+            # manifest below is replaced, lines past its n_docs are ignored.
+            with open(path + ".tmp", 'w') as f:
+                for doc, document in enumerate(documents):
+                    f.write(json.dumps({"id": doc, **document}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+        else:
+            with open(path, 'a') as f:
+                for doc, document in updates:
+                    f.write(json.dumps({"id": doc, **document}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        # Document frequencies belong to one generation so they always match its manifest
+        generation = uuid.uuid4().hex
+        np.save(os.path.join(self.directory, f"df-{generation}.npy"), df)
+
+        meta = {"version": INDEX_VERSION, "n_features": self.n_features, "generation": generation,
+                "n_docs": len(documents), "watermark": watermark,
+                "segments": [segment.name for segment in segments]}
+        meta_tmp = os.path.join(self.directory, "meta.json.tmp")
+        with open(meta_tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_tmp, os.path.join(self.directory, "meta.json"))
+
+        # Drop consolidated segments and older document frequencies
+        live = set(meta["segments"]) | {f"df-{generation}"}
+        for name in os.listdir(self.directory):
+            if name.startswith(("seg-", "df-")) and name.split(".", 1)[0] not in live:
+                os.remove(os.path.join(self.directory, name))
+        return generation
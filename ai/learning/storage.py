@@ -0,0 +1,1138 @@
+"""
+ABIET Learning Storage
+Persistence backends for the learning engine
+
+Three on-disk formats are supported:
+
+- ``json``: the original format, one JSON document rewritten on every change.
+- ``journal``: the same JSON document used as a snapshot, plus an append-only
+  JSONL journal (``<storage_path>.journal``). Each change is a single small
+  append; the journal is folded back into the snapshot every
+  ``compact_every`` entries.
+- ``sqlite``: an indexed SQLite database in WAL mode. Interactions stay in
+  the database and are filtered, counted and paged there instead of being
+  loaded into memory.
+
+Because the journal snapshot *is* the JSON document, an existing
+``learning_data.json`` can be switched to the journal format without
+conversion, and the JSON store replays a leftover journal on load so the
+migration works in both directions. The SQLite store imports the JSON
+document the first time it creates its database.
+
+All formats can be shared by several worker processes. The file formats
+serialize writers with an advisory lock on ``<storage_path>.lock`` and
+merge changes made by other workers before writing; SQLite relies on its
+own locking. Readers pick up other workers' changes on :meth:`refresh`,
+which checks storage at most once per ``refresh_interval`` seconds.
+
+Records older than a retention cutoff are removed with :meth:`prune`; see
+``ai/learning/retention.py`` for the archive they are moved to.
+"""
+
+from collections import deque
+from collections.abc import Sequence
+from contextlib import contextmanager
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from ai.learning.columnar import ColumnarInteractions
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: single worker only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_COLLECTIONS = {"patterns": [], "corrections": [], "interactions": [], "usage_stats": {}}
+
+JOURNAL_SUFFIX = ".journal"
+LOCK_SUFFIX = ".lock"
+
+# Snapshot key holding the journal generation; journal lines from older
+# generations are already folded into the snapshot
+JOURNAL_GENERATION_KEY = "journal_generation"
+
+# "never": leave flushing to the OS, "always": fsync after every write,
+# "interval": fsync at most once per ``fsync_interval`` seconds
+FSYNC_POLICIES = ("never", "always", "interval")
+
+
+def _with_defaults(loaded: Dict[str, Any]) -> Dict[str, Any]:
+    """Merge loaded data with defaults to ensure all keys exist"""
+    for key, value in DEFAULT_COLLECTIONS.items():
+        if key not in loaded:
+            loaded[key] = type(value)()
+    return loaded
+
+
+def _matches(interaction: Dict[str, Any], success: Optional[bool] = None, has_feedback: Optional[bool] = None,
+             since: Optional[str] = None, until: Optional[str] = None) -> bool:
+    """Check an interaction against the history filters"""
+    if success is not None and bool(interaction.get("success")) != success:
+        return False
+    if has_feedback is not None and bool(interaction.get("feedback")) != has_feedback:
+        return False
+    if since is not None and interaction.get("timestamp", "") < since:
+        return False
+    if until is not None and interaction.get("timestamp", "") >= until:
+        return False
+    return True
+
+
+def _legacy_interaction_id(interaction: Dict[str, Any]) -> str:
+    """Deterministic ID for interactions recorded before IDs existed, so
+    every worker derives the same one"""
+    key = f"{interaction.get('timestamp', '')}|{interaction.get('natural_query', '')}"
+    return hashlib.sha1(key.encode()).hexdigest()[:32]
+
+
+def _index_interactions(interactions: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Map interaction IDs to records, assigning IDs to legacy records"""
+    if isinstance(interactions, ColumnarInteractions):
+        return interactions.id_index()
+    by_id = {}
+    for interaction in interactions:
+        if not interaction.get("id"):
+            interaction["id"] = _legacy_interaction_id(interaction)
+        by_id[interaction["id"]] = interaction
+    return by_id
+
+
+def pattern_key(natural_query: str, generated_sql: Optional[str]) -> str:
+    """Hash of a normalized (natural query, SQL) pair identifying a pattern"""
+    query = " ".join((natural_query or "").lower().split())
+    sql = " ".join((generated_sql or "").split()).rstrip(";").rstrip()
+    return hashlib.sha1(f"{query}\x00{sql}".encode()).hexdigest()[:32]
+
+
+def _merge_pattern(pattern: Dict[str, Any], other: Dict[str, Any]):
+    """Fold the counters of ``other`` into ``pattern`` in place"""
+    for counter in ("usage_count", "success_count", "failure_count"):
+        pattern[counter] = pattern.get(counter, 0) + other.get(counter, 0)
+    if other.get("timestamp", "") >= pattern.get("timestamp", ""):
+        # The most recent use decides the current outcome and SQL
+        pattern["timestamp"] = other.get("timestamp", "")
+        pattern["success"] = other.get("success")
+        pattern["generated_sql"] = other.get("generated_sql")
+    first_seen = [timestamp for timestamp in (pattern.get("first_seen"), other.get("first_seen")) if timestamp]
+    pattern["first_seen"] = min(first_seen) if first_seen else ""
+
+
+def _as_pattern(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Give a pattern recorded before deduplication its key and counters"""
+    if "key" not in record:
+        record["key"] = pattern_key(record["natural_query"], record.get("generated_sql"))
+        record.setdefault("usage_count", 1)
+        record.setdefault("success_count", record["usage_count"] if record.get("success") else 0)
+        record.setdefault("failure_count", record["usage_count"] - record["success_count"])
+        record.setdefault("first_seen", record.get("timestamp", ""))
+    return record
+
+
+def _fold_patterns(patterns: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """Merge duplicate patterns in place and map pattern keys to records.
+
+    Records without a ``natural_query`` are left untouched.
+    """
+    by_key: Dict[str, Dict[str, Any]] = {}
+    folded = []
+    for record in patterns:
+        if "natural_query" not in record:
+            folded.append(record)
+            continue
+        record = _as_pattern(record)
+        if record["key"] in by_key:
+            _merge_pattern(by_key[record["key"]], record)
+            continue
+        by_key[record["key"]] = record
+        folded.append(record)
+    if len(folded) != len(patterns):
+        patterns[:] = folded
+    return by_key
+
+
+def _build_indexes(data: Dict[str, Any]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    """Lookup indexes kept alongside the in-memory data: interaction IDs and pattern keys"""
+    return {"interactions": _index_interactions(data["interactions"]), "patterns": _fold_patterns(data["patterns"])}
+
+
+def _apply_entry(data: Dict[str, Any], entry: Dict[str, Any], indexes: Dict[str, Dict[str, Dict[str, Any]]]):
+    """Apply a single journal entry to in-memory learning data.
+
+    ``indexes`` are the lookup indexes for ``data`` (see :func:`_build_indexes`)
+    and are kept up to date.
+    """
+    collection = data[entry["collection"]]
+    by_id = indexes["interactions"]
+    if entry["op"] == "append":
+        record = entry["record"]
+        collection.append(record)
+        if entry["collection"] == "interactions" and record.get("id"):
+            by_id[record["id"]] = record
+    elif entry["op"] == "merge":
+        # Counters change later, so never share the record with the entry
+        existing = indexes["patterns"].get(entry["key"])
+        if existing is not None:
+            _merge_pattern(existing, entry["record"])
+        else:
+            record = dict(entry["record"])
+            collection.append(record)
+            indexes["patterns"][entry["key"]] = record
+    elif entry["op"] == "update":
+        if "id" in entry:
+            record = by_id.get(entry["id"])
+        else:
+            index = entry["index"]
+            record = collection[index] if 0 <= index < len(collection) else None
+        if record is not None:
+            record.update(entry["changes"])
+    elif entry["op"] == "prune":
+        # Drop records older than the retention cutoff (they were archived first)
+        until = entry["until"]
+        if isinstance(collection, ColumnarInteractions):
+            collection.prune(until)
+            return
+        if entry["collection"] in indexes:
+            index = indexes[entry["collection"]]
+            for record in collection:
+                if record.get("timestamp", "") < until:
+                    index.pop(record.get("id" if entry["collection"] == "interactions" else "key"), None)
+        collection[:] = [record for record in collection if record.get("timestamp", "") >= until]
+
+
+def _serializable(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Learning data with columnar history decoded back to a list of dicts"""
+    if isinstance(data["interactions"], ColumnarInteractions):
+        return dict(data, interactions=data["interactions"][:])
+    return data
+
+
+def _signature(path: str) -> Optional[Tuple[int, int, int]]:
+    """Cheap change detector for a file written by another process"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+@contextmanager
+def _file_lock(path: str, shared: bool = False, create: bool = True):
+    """Advisory inter-process lock held for the duration of the block.
+
+    With ``create=False`` no lock file is created if none exists yet, so
+    opening an empty store leaves nothing behind on disk.
+    """
+    if fcntl is None or (not create and not os.path.exists(path)):
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class LearningStore:
+    """Base class for learning data persistence backends.
+
+    A store owns the in-memory ``data`` dict returned by :meth:`load`; the
+    learning engine mutates it only through :meth:`append` and :meth:`update`
+    so every backend can persist changes in its own way.
+
+    Each change is an entry dict (``{"op": "append", ...}``) that is first
+    applied in memory and then handed to :meth:`persist`, either directly or,
+    when ``write_buffer`` is set, in batches from a write-behind buffer.
+    Entries are numbered in the order they were applied; entries that are
+    not persisted yet are re-applied whenever the in-memory data is reloaded
+    with changes from other workers.
+    """
+
+    format: str = ""
+
+    def __init__(self, storage_path: str, fsync: str = "never", fsync_interval: float = 1.0,
+                 refresh_interval: float = 1.0, columnar: bool = False):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unsupported fsync policy '{fsync}'. Use one of {', '.join(FSYNC_POLICIES)}.")
+        self.storage_path = storage_path
+        self.lock_path = storage_path + LOCK_SUFFIX
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.refresh_interval = refresh_interval
+        # Keep in-memory interactions in a ColumnarInteractions instead of a list of dicts
+        self.columnar = columnar
+        self.data: Dict[str, Any] = _with_defaults({})
+        self.write_buffer = None
+        # Guards ``data``; held only briefly by writers and while serializing
+        self._lock = threading.RLock()
+        # Keeps persisted order identical to the in-memory order of changes
+        self._write_lock = threading.Lock()
+        # Serializes file writes so an older snapshot never replaces a newer one
+        self._io_lock = threading.Lock()
+        self._last_fsync = 0.0
+        self._last_refresh = 0.0
+        self._seq = 0
+        self._persisted_seq = 0
+        self._unpersisted: deque = deque()
+        self._indexes = _build_indexes(self.data)
+
+    def _read_document(self, path: str) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def _sync(self, f):
+        """Apply the fsync policy to a file that has just been written"""
+        now = time.monotonic()
+        if self.fsync == "always" or (self.fsync == "interval" and now - self._last_fsync >= self.fsync_interval):
+            f.flush()
+            os.fsync(f.fileno())
+            self._last_fsync = now
+
+    def _write_document(self, path: str, document: str):
+        """Atomically replace ``path`` with the serialized ``document``"""
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(document)
+            self._sync(f)
+        os.replace(tmp_path, path)
+
+    def _reload(self, document: Dict[str, Any]):
+        """Replace the in-memory data in place and re-apply local changes
+        that have not been persisted yet. Caller holds ``_lock``."""
+        self.data.clear()
+        self.data.update(_with_defaults(document))
+        if self.columnar and not isinstance(self.data["interactions"], ColumnarInteractions):
+            # Assign legacy IDs while the records are still dicts
+            _index_interactions(self.data["interactions"])
+            self.data["interactions"] = ColumnarInteractions(self.data["interactions"])
+        self._indexes = _build_indexes(self.data)
+        for entry in self._unpersisted:
+            self._apply(entry)
+
+    def _refresh_due(self, force: bool = False) -> bool:
+        now = time.monotonic()
+        if not force and now - self._last_refresh < self.refresh_interval:
+            return False
+        self._last_refresh = now
+        return True
+
+    def load(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def refresh(self, force: bool = False):
+        """Pick up changes written by other workers, at most once per
+        ``refresh_interval`` unless ``force`` is set"""
+
+    def save(self, data: Optional[Dict[str, Any]] = None):
+        """Write the full learning data"""
+        raise NotImplementedError
+
+    def append(self, collection: str, record: Dict[str, Any]):
+        self.write({"op": "append", "collection": collection, "record": record})
+
+    def append_many(self, collection: str, records: List[Dict[str, Any]]):
+        """Append several records, persisted together as one batch"""
+        if records:
+            self.write(*({"op": "append", "collection": collection, "record": record} for record in records))
+
+    def update(self, collection: str, index: int, changes: Dict[str, Any]):
+        self.write({"op": "update", "collection": collection, "index": index, "changes": changes})
+
+    def update_interactions(self, changes_by_id: Dict[str, Dict[str, Any]]):
+        """Update interactions by ID, persisted together as one batch"""
+        self.write(*({"op": "update", "collection": "interactions", "id": interaction_id, "changes": changes}
+                     for interaction_id, changes in changes_by_id.items()))
+
+    def merge_pattern(self, pattern: Dict[str, Any]):
+        """Add a pattern, or fold its counters into the pattern with the same key"""
+        self.write({"op": "merge", "collection": "patterns", "key": pattern["key"], "record": pattern})
+
+    def get_pattern(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            pattern = self._indexes["patterns"].get(key)
+            return dict(pattern) if pattern is not None else None
+
+    def prune(self, collection: str, until: str):
+        """Remove records with a timestamp older than ``until``"""
+        self.write({"op": "prune", "collection": collection, "until": until})
+
+    def has_interaction(self, interaction_id: str) -> bool:
+        return interaction_id in self._indexes["interactions"]
+
+    def write(self, *entries: Dict[str, Any]):
+        """Apply changes in memory, then persist them or queue them for the write-behind buffer"""
+        with self._write_lock:
+            with self._lock:
+                for entry in entries:
+                    self._seq += 1
+                    entry["seq"] = self._seq
+                    self._apply(entry)
+                    self._unpersisted.append(entry)
+            if self.write_buffer is not None:
+                self.write_buffer.submit_many(entries)
+            else:
+                self.persist(list(entries))
+
+    def _apply(self, entry: Dict[str, Any]):
+        _apply_entry(self.data, entry, self._indexes)
+
+    def persist(self, entries: List[Dict[str, Any]]):
+        """Durably record entries that were already applied in memory"""
+        with self._lock:
+            # A snapshot taken while these were queued may already cover them
+            entries = [entry for entry in entries if entry["seq"] > self._persisted_seq]
+        if entries:
+            self._persist(entries)
+            with self._lock:
+                self._mark_persisted(entries[-1]["seq"])
+
+    def _persist(self, entries: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def _mark_persisted(self, seq: int):
+        """Record that all local changes up to ``seq`` are on disk. Caller holds ``_lock``."""
+        self._persisted_seq = max(self._persisted_seq, seq)
+        while self._unpersisted and self._unpersisted[0]["seq"] <= self._persisted_seq:
+            self._unpersisted.popleft()
+
+    def page_interactions(self, limit: Optional[int] = None, before: Optional[int] = None,
+                          **filters) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        """Return the newest matching interactions older than ``before``.
+
+        The page is in chronological order. The returned cursor is passed as
+        ``before`` to fetch the next (older) page, and is None on the last page.
+        """
+        interactions = self.data["interactions"]
+        end = len(interactions) if before is None else min(before, len(interactions))
+        if not any(value is not None for value in filters.values()):
+            start = max(end - limit, 0) if limit else 0
+            return interactions[start:end], (start if start > 0 else None)
+
+        page = []
+        index = end
+        while index > 0:
+            index -= 1
+            if _matches(interactions[index], **filters):
+                if limit and len(page) == limit:
+                    # One more match exists beyond this page
+                    page.reverse()
+                    return [self._record_at(i) for i in page], index + 1
+                page.append(index)
+        page.reverse()
+        return [self._record_at(i) for i in page], None
+
+    def _record_at(self, index: int) -> Dict[str, Any]:
+        """The interaction at ``index`` as a dict, decoding columnar history"""
+        interactions = self.data["interactions"]
+        if isinstance(interactions, ColumnarInteractions):
+            return interactions.materialize(index)
+        return interactions[index]
+
+    def count_interactions(self, **filters) -> int:
+        """Count interactions matching the history filters"""
+        interactions = self.data["interactions"]
+        if not any(value is not None for value in filters.values()):
+            return len(interactions)
+        return sum(1 for interaction in interactions if _matches(interaction, **filters))
+
+    def iter_interactions(self, **filters) -> Iterator[Dict[str, Any]]:
+        """Iterate over matching interactions in chronological order"""
+        for index, interaction in enumerate(self.data["interactions"]):
+            if _matches(interaction, **filters):
+                yield self._record_at(index)
+
+    def iter_records_before(self, collection: str, until: str) -> Iterator[Dict[str, Any]]:
+        """Iterate over records older than ``until``, i.e. what :meth:`prune` would remove"""
+        if collection == "interactions":
+            return self.iter_interactions(until=until)
+        return iter([record for record in self.data[collection] if record.get("timestamp", "") < until])
+
+    def count_records(self, collection: str) -> int:
+        if collection == "interactions":
+            return self.count_interactions()
+        return len(self.data[collection])
+
+    def newest_timestamp(self, collection: str, rank: int) -> Optional[str]:
+        """Timestamp of the ``rank``-th newest record (1-based), or None if there are fewer"""
+        if collection == "interactions":
+            timestamps = [interaction.get("timestamp", "") for interaction in self.iter_interactions()]
+        else:
+            timestamps = [record.get("timestamp", "") for record in self.data[collection]]
+        if rank < 1 or rank > len(timestamps):
+            return None
+        return sorted(timestamps, reverse=True)[rank - 1]
+
+    def compact(self):
+        """Reclaim space left behind by pruned records"""
+
+    def close(self):
+        """Release any resources held by the store"""
+
+
+class JSONFileStore(LearningStore):
+    """Single JSON document, rewritten in full on every change.
+
+    Every write re-reads the document first if another worker changed it,
+    which keeps multi-worker deployments correct but makes each write cost
+    O(history). Prefer ``journal`` or ``sqlite`` for more than one worker.
+    """
+
+    format = "json"
+
+    def __init__(self, storage_path: str, **options):
+        super().__init__(storage_path, **options)
+        self._signature = None
+
+    def load(self) -> Dict[str, Any]:
+        journal = JournalStore(self.storage_path)
+        exists = os.path.exists(self.storage_path) or os.path.exists(journal.journal_path)
+        with _file_lock(self.lock_path, create=exists):
+            # Fold in a journal left behind by the journal format
+            if os.path.exists(journal.journal_path):
+                document, _ = journal._read_state()
+                self._write_document(self.storage_path, json.dumps(document, indent=2))
+                os.remove(journal.journal_path)
+            document = self._read_document(self.storage_path) or {}
+            document.pop(JOURNAL_GENERATION_KEY, None)
+            self._signature = _signature(self.storage_path)
+        with self._lock:
+            self._reload(document)
+        self._last_refresh = time.monotonic()
+        return self.data
+
+    def _catch_up(self):
+        """Reload the document if another worker replaced it. Caller holds the file lock."""
+        signature = _signature(self.storage_path)
+        if signature == self._signature:
+            return
+        document = self._read_document(self.storage_path) or {}
+        document.pop(JOURNAL_GENERATION_KEY, None)
+        with self._lock:
+            self._reload(document)
+        self._signature = signature
+
+    def refresh(self, force: bool = False):
+        if not self._refresh_due(force) or _signature(self.storage_path) == self._signature:
+            return
+        with self._io_lock, _file_lock(self.lock_path, shared=True):
+            self._catch_up()
+
+    def save(self, data: Optional[Dict[str, Any]] = None):
+        with self._io_lock, _file_lock(self.lock_path):
+            if data is not None and data is not self.data:
+                with self._lock:
+                    self.data.clear()
+                    self.data.update(data)
+            else:
+                self._catch_up()
+            self._write()
+
+    def _write(self):
+        with self._lock:
+            document = json.dumps(_serializable(self.data), indent=2)
+        self._write_document(self.storage_path, document)
+        self._signature = _signature(self.storage_path)
+
+    def _persist(self, entries: List[Dict[str, Any]]):
+        # The whole document is rewritten once per batch, on top of any
+        # changes other workers made since we last read it
+        with self._io_lock, _file_lock(self.lock_path):
+            self._catch_up()
+            self._write()
+
+
+class JournalStore(LearningStore):
+    """JSON snapshot plus an append-only JSONL journal of changes.
+
+    Journal lines carry the snapshot generation they apply to and the ID of
+    the worker that wrote them. Compaction bumps the generation, so lines
+    that were already folded into the snapshot are skipped on replay even if
+    a crash left the old journal in place, and workers skip their own lines
+    when catching up with the journal.
+    """
+
+    format = "journal"
+
+    def __init__(self, storage_path: str, compact_every: int = 1000, **options):
+        super().__init__(storage_path, **options)
+        self.journal_path = storage_path + JOURNAL_SUFFIX
+        self.compact_every = compact_every
+        self.writer_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._generation = 0
+        self._offset = 0
+        self._pending = 0
+        self._snapshot_signature = None
+
+    def load(self) -> Dict[str, Any]:
+        exists = os.path.exists(self.storage_path) or os.path.exists(self.journal_path)
+        with self._io_lock, _file_lock(self.lock_path, create=exists):
+            document, torn = self._read_state()
+            with self._lock:
+                self._reload(document)
+            if torn or self._pending >= self.compact_every:
+                self._compact()
+        self._last_refresh = time.monotonic()
+        return self.data
+
+    def _read_state(self) -> Tuple[Dict[str, Any], bool]:
+        """Read the snapshot and replay its journal. Caller holds the file lock.
+
+        Returns the data and whether the journal contained a damaged line.
+        """
+        self._snapshot_signature = _signature(self.storage_path)
+        document = _with_defaults(self._read_document(self.storage_path) or {})
+        self._generation = document.pop(JOURNAL_GENERATION_KEY, 0)
+        self._offset = 0
+        self._pending = 0
+        entries, torn = self._read_journal()
+        indexes = _build_indexes(document)
+        for entry in entries:
+            _apply_entry(document, entry, indexes)
+        return document, torn
+
+    def _read_journal(self) -> Tuple[List[Dict[str, Any]], bool]:
+        """Read complete journal lines past ``_offset`` for the current generation"""
+        if not os.path.exists(self.journal_path):
+            return [], False
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._offset)
+            chunk = f.read()
+        end = chunk.rfind(b"\n") + 1
+        # Anything after the last newline is the torn tail of an interrupted append
+        torn = end < len(chunk)
+        entries = []
+        for line in chunk[:end].splitlines():
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping damaged line in {self.journal_path}")
+                torn = True
+                continue
+            if entry.get("gen", 0) == self._generation:
+                entries.append(entry)
+        self._offset += end
+        self._pending += len(entries)
+        return entries, torn
+
+    def _catch_up(self):
+        """Apply changes written by other workers. Caller holds the file lock."""
+        if _signature(self.storage_path) != self._snapshot_signature:
+            # Another worker compacted: start over from its snapshot
+            document, _ = self._read_state()
+            with self._lock:
+                self._reload(document)
+            return
+        entries, _ = self._read_journal()
+        with self._lock:
+            for entry in entries:
+                if entry.get("writer") != self.writer_id:
+                    _apply_entry(self.data, entry, self._indexes)
+
+    def refresh(self, force: bool = False):
+        if not self._refresh_due(force):
+            return
+        journal_size = _signature(self.journal_path)
+        if (journal_size[1] if journal_size else 0) == self._offset and \
+                _signature(self.storage_path) == self._snapshot_signature:
+            return
+        with self._io_lock, _file_lock(self.lock_path, shared=True):
+            self._catch_up()
+
+    def _encode(self, entry: Dict[str, Any]) -> str:
+        line = {key: value for key, value in entry.items() if key != "seq"}
+        line["gen"] = self._generation
+        line["writer"] = self.writer_id
+        return json.dumps(line) + "\n"
+
+    def _persist(self, entries: List[Dict[str, Any]]):
+        with self._io_lock, _file_lock(self.lock_path):
+            self._catch_up()
+            with self._lock:
+                lines = "".join(self._encode(entry) for entry in entries)
+            with open(self.journal_path, 'ab+') as f:
+                # Terminate a torn tail so it cannot swallow our first line
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        lines = "\n" + lines
+                f.write(lines.encode())
+                self._sync(f)
+                # We hold the lock, so everything up to here has been read
+                self._offset = f.tell()
+            self._pending += len(entries)
+            if self._pending >= self.compact_every:
+                self._compact()
+
+    def save(self, data: Optional[Dict[str, Any]] = None):
+        with self._io_lock, _file_lock(self.lock_path):
+            if data is not None and data is not self.data:
+                with self._lock:
+                    self.data.clear()
+                    self.data.update(data)
+            else:
+                self._catch_up()
+            self._compact()
+
+    def compact(self):
+        """Fold the journal into a fresh snapshot and start a new journal"""
+        with self._io_lock, _file_lock(self.lock_path):
+            self._catch_up()
+            self._compact()
+
+    def _compact(self):
+        """Caller holds the file lock and has caught up with the journal"""
+        with self._lock:
+            snapshot = dict(_serializable(self.data))
+            snapshot[JOURNAL_GENERATION_KEY] = self._generation + 1
+            document = json.dumps(snapshot, indent=2)
+            covered_seq = self._seq
+        self._write_document(self.storage_path, document)
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._generation += 1
+        self._offset = 0
+        self._pending = 0
+        self._snapshot_signature = _signature(self.storage_path)
+        with self._lock:
+            # Queued local changes are part of the snapshot now
+            self._mark_persisted(covered_seq)
+
+
+INTERACTION_COLUMNS = ("natural_query", "generated_sql", "success", "feedback", "error", "timestamp")
+
+# Bumped whenever _initialize learns a new migration step
+SQLITE_SCHEMA_VERSION = 3
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    uid TEXT,
+    natural_query TEXT,
+    generated_sql TEXT,
+    success INTEGER NOT NULL DEFAULT 0,
+    feedback TEXT,
+    error TEXT,
+    timestamp TEXT NOT NULL DEFAULT '',
+    has_feedback INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_interactions_timestamp ON interactions (timestamp);
+CREATE INDEX IF NOT EXISTS ix_interactions_success ON interactions (success, id);
+CREATE INDEX IF NOT EXISTS ix_interactions_has_feedback ON interactions (has_feedback, id);
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    collection TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_records_collection ON records (collection, id);
+CREATE TABLE IF NOT EXISTS usage_stats (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class SQLiteInteractions(Sequence):
+    """Read-only sequence view over the interactions table"""
+
+    def __init__(self, store: "SQLiteStore"):
+        self._store = store
+
+    def __len__(self) -> int:
+        return self._store.count_interactions()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            rows = self._store._select_range(start, max(stop - start, 0))
+            return rows[::step]
+        if index < 0:
+            index += len(self)
+        rows = self._store._select_range(index, 1)
+        if not rows:
+            raise IndexError("interaction index out of range")
+        return rows[0]
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return self._store.iter_interactions()
+
+
+class SQLiteStore(LearningStore):
+    """Indexed SQLite database in WAL mode.
+
+    Interactions are only read on demand through :meth:`page_interactions`,
+    :meth:`count_interactions` and :meth:`iter_interactions`, so other
+    workers' interactions are visible immediately. These reads first wait
+    for this worker's queued writes, so it always sees its own. Patterns, corrections and
+    usage stats are small enough to keep in memory and are reloaded on
+    :meth:`refresh` when another connection has committed.
+    """
+
+    format = "sqlite"
+
+    def __init__(self, storage_path: str, batch_size: int = 1000, **options):
+        super().__init__(storage_path, **options)
+        base, ext = os.path.splitext(storage_path)
+        self.db_path = storage_path if ext in (".db", ".sqlite", ".sqlite3") else base + ".db"
+        self.batch_size = batch_size
+        self._record_ids: Dict[str, List[int]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._data_version = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute("PRAGMA journal_mode=WAL")
+            # In WAL mode NORMAL only syncs on checkpoints; FULL syncs every commit
+            conn.execute(f"PRAGMA synchronous={'FULL' if self.fsync == 'always' else 'NORMAL'}")
+            conn.executescript(SQLITE_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def load(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self._connect()
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SQLITE_SCHEMA_VERSION:
+                self._initialize(conn)
+            self.data = {"interactions": SQLiteInteractions(self)}
+            self._load_records(conn)
+        self._last_refresh = time.monotonic()
+        return self.data
+
+    def _load_records(self, conn: sqlite3.Connection):
+        """(Re)load the in-memory collections. Caller holds ``_lock``."""
+        self._data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        for collection in ("patterns", "corrections"):
+            rows = conn.execute("SELECT id, data FROM records WHERE collection = ? ORDER BY id",
+                                (collection,)).fetchall()
+            self._record_ids[collection] = [row["id"] for row in rows]
+            self.data[collection] = [json.loads(row["data"]) for row in rows]
+        # Duplicates were folded when the database was migrated
+        self._indexes["patterns"] = {pattern["key"]: pattern for pattern in self.data["patterns"] if "key" in pattern}
+        self.data["usage_stats"] = {row["key"]: json.loads(row["value"])
+                                    for row in conn.execute("SELECT key, value FROM usage_stats")}
+        for entry in self._unpersisted:
+            self._apply(entry)
+
+    def refresh(self, force: bool = False):
+        if not self._refresh_due(force):
+            return
+        with self._lock:
+            conn = self._connect()
+            # data_version only changes when another connection commits
+            if conn.execute("PRAGMA data_version").fetchone()[0] != self._data_version:
+                self._load_records(conn)
+
+    def _initialize(self, conn: sqlite3.Connection):
+        """Migrate the schema and, for a new database, import an existing
+        JSON document (and journal)"""
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another worker may have initialized the database while we waited
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version < 2:
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(interactions)")}
+                if "uid" not in columns:
+                    conn.execute("ALTER TABLE interactions ADD COLUMN uid TEXT")
+                rows = conn.execute("SELECT id, natural_query, timestamp FROM interactions WHERE uid IS NULL").fetchall()
+                conn.executemany("UPDATE interactions SET uid = ? WHERE id = ?",
+                                 [(_legacy_interaction_id(dict(row)), row["id"]) for row in rows])
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_interactions_uid ON interactions (uid)")
+            if version == 0 and self.db_path != self.storage_path and os.path.exists(self.storage_path):
+                self._import_legacy(conn)
+            if version < 3:
+                self._fold_pattern_rows(conn)
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_records_key ON records (collection, json_extract(data, '$.key'))")
+            if version < SQLITE_SCHEMA_VERSION:
+                conn.execute(f"PRAGMA user_version = {SQLITE_SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _fold_pattern_rows(self, conn: sqlite3.Connection):
+        """Merge duplicate pattern rows into the oldest row of each pattern"""
+        rows = conn.execute("SELECT id, data FROM records WHERE collection = 'patterns' ORDER BY id").fetchall()
+        patterns = [json.loads(row["data"]) for row in rows]
+        survivors = {id(pattern) for pattern in _fold_patterns(list(patterns)).values()}
+        for row, pattern in zip(rows, patterns):
+            if "natural_query" not in pattern:
+                continue
+            if id(pattern) in survivors:
+                conn.execute("UPDATE records SET data = ? WHERE id = ?", (json.dumps(pattern), row["id"]))
+            else:
+                conn.execute("DELETE FROM records WHERE id = ?", (row["id"],))
+
+    def _import_legacy(self, conn: sqlite3.Connection):
+        legacy = JSONFileStore(self.storage_path).load()
+        self._insert_interactions(conn, legacy["interactions"])
+        for collection in ("patterns", "corrections"):
+            conn.executemany("INSERT INTO records (collection, data) VALUES (?, ?)",
+                             [(collection, json.dumps(record)) for record in legacy[collection]])
+        conn.executemany("INSERT INTO usage_stats (key, value) VALUES (?, ?)",
+                         [(key, json.dumps(value)) for key, value in legacy["usage_stats"].items()])
+
+    def _insert_interactions(self, conn: sqlite3.Connection, interactions: List[Dict[str, Any]]):
+        conn.executemany(
+            "INSERT INTO interactions (uid, natural_query, generated_sql, success, feedback, error, timestamp, "
+            "has_feedback) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(i.get("id") or _legacy_interaction_id(i), i.get("natural_query"), i.get("generated_sql"),
+              int(bool(i.get("success"))), i.get("feedback"), i.get("error"), i.get("timestamp", ""),
+              int(bool(i.get("feedback")))) for i in interactions],
+        )
+
+    def save(self, data: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            if data is not None and data is not self.data:
+                for collection in ("patterns", "corrections", "usage_stats"):
+                    self.data[collection] = data[collection]
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for collection in ("patterns", "corrections"):
+                    conn.execute("DELETE FROM records WHERE collection = ?", (collection,))
+                    ids = []
+                    for record in self.data[collection]:
+                        cursor = conn.execute("INSERT INTO records (collection, data) VALUES (?, ?)",
+                                              (collection, json.dumps(record)))
+                        ids.append(cursor.lastrowid)
+                    self._record_ids[collection] = ids
+                conn.execute("DELETE FROM usage_stats")
+                conn.executemany("INSERT INTO usage_stats (key, value) VALUES (?, ?)",
+                                 [(key, json.dumps(value)) for key, value in self.data["usage_stats"].items()])
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _apply(self, entry: Dict[str, Any]):
+        # Interactions only live in the database
+        if entry["collection"] == "interactions":
+            return
+        if entry["op"] == "prune":
+            # Keep row IDs aligned with the records that survive
+            records = self.data[entry["collection"]]
+            ids = self._record_ids.get(entry["collection"], [])
+            kept = [i for i, record in enumerate(records) if record.get("timestamp", "") >= entry["until"]]
+            self._record_ids[entry["collection"]] = [ids[i] for i in kept if i < len(ids)]
+        _apply_entry(self.data, entry, self._indexes)
+
+    def _persist(self, entries: List[Dict[str, Any]]):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for entry in entries:
+                    if entry["collection"] == "interactions":
+                        self._persist_interaction(conn, entry)
+                    else:
+                        self._persist_record(conn, entry)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def _persist_interaction(self, conn: sqlite3.Connection, entry: Dict[str, Any]):
+        if entry["op"] == "append":
+            self._insert_interactions(conn, [entry["record"]])
+            return
+        if entry["op"] == "prune":
+            conn.execute("DELETE FROM interactions WHERE timestamp < ?", (entry["until"],))
+            return
+        changes = entry["changes"]
+        assignments = [f"{column} = ?" for column in changes if column in INTERACTION_COLUMNS]
+        params = [changes[column] for column in changes if column in INTERACTION_COLUMNS]
+        if "feedback" in changes:
+            assignments.append("has_feedback = ?")
+            params.append(int(bool(changes["feedback"])))
+        if "id" in entry:
+            conn.execute(f"UPDATE interactions SET {', '.join(assignments)} WHERE uid = ?",
+                         params + [entry["id"]])
+            return
+        conn.execute(
+            f"UPDATE interactions SET {', '.join(assignments)} "
+            "WHERE id = (SELECT id FROM interactions ORDER BY id LIMIT 1 OFFSET ?)",
+            params + [entry["index"]],
+        )
+
+    def _persist_merge(self, conn: sqlite3.Connection, entry: Dict[str, Any]):
+        # Another worker may have added the pattern since we loaded, so look it up in the database
+        collection = entry["collection"]
+        row = conn.execute("SELECT id, data FROM records WHERE collection = ? AND json_extract(data, '$.key') = ? "
+                           "ORDER BY id LIMIT 1", (collection, entry["key"])).fetchone()
+        if row is not None:
+            pattern = json.loads(row["data"])
+            _merge_pattern(pattern, entry["record"])
+            conn.execute("UPDATE records SET data = ? WHERE id = ?", (json.dumps(pattern), row["id"]))
+            row_id = row["id"]
+        else:
+            row_id = conn.execute("INSERT INTO records (collection, data) VALUES (?, ?)",
+                                  (collection, json.dumps(entry["record"]))).lastrowid
+        # If this entry appended the pattern in memory, it is the next record without a row ID
+        ids, records = self._record_ids[collection], self.data[collection]
+        if len(ids) < len(records) and records[len(ids)].get("key") == entry["key"]:
+            ids.append(row_id)
+
+    def _persist_record(self, conn: sqlite3.Connection, entry: Dict[str, Any]):
+        collection = entry["collection"]
+        if entry["op"] == "merge":
+            self._persist_merge(conn, entry)
+            return
+        if entry["op"] == "append":
+            cursor = conn.execute("INSERT INTO records (collection, data) VALUES (?, ?)",
+                                  (collection, json.dumps(entry["record"])))
+            self._record_ids[collection].append(cursor.lastrowid)
+            return
+        if entry["op"] == "prune":
+            conn.execute("DELETE FROM records WHERE collection = ? AND COALESCE(json_extract(data, '$.timestamp'), '') < ?",
+                         (collection, entry["until"]))
+            return
+        record = self.data[collection][entry["index"]]
+        conn.execute("UPDATE records SET data = ? WHERE id = ?",
+                     (json.dumps(record), self._record_ids[collection][entry["index"]]))
+
+    def _where(self, success: Optional[bool] = None, has_feedback: Optional[bool] = None,
+               since: Optional[str] = None, until: Optional[str] = None) -> Tuple[List[str], List[Any]]:
+        clauses, params = [], []
+        if success is not None:
+            clauses.append("success = ?")
+            params.append(int(success))
+        if has_feedback is not None:
+            clauses.append("has_feedback = ?")
+            params.append(int(has_feedback))
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        return clauses, params
+
+    def has_interaction(self, interaction_id: str) -> bool:
+        with self._lock:
+            # Appends still waiting in the write-behind buffer count too
+            for entry in self._unpersisted:
+                if entry["op"] == "append" and entry["record"].get("id") == interaction_id:
+                    return True
+            row = self._connect().execute("SELECT 1 FROM interactions WHERE uid = ?", (interaction_id,)).fetchone()
+        return row is not None
+
+    def _flush_pending(self):
+        """Wait for writes still queued in the write-behind buffer, since
+        interactions are only read back from the database"""
+        if self.write_buffer is not None and self._unpersisted:
+            self.write_buffer.flush()
+
+    @staticmethod
+    def _row_to_interaction(row: sqlite3.Row) -> Dict[str, Any]:
+        interaction = {"id": row["uid"]}
+        interaction.update((column, row[column]) for column in INTERACTION_COLUMNS)
+        interaction["success"] = bool(interaction["success"])
+        return interaction
+
+    def _select_range(self, offset: int, limit: int) -> List[Dict[str, Any]]:
+        self._flush_pending()
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT uid, {', '.join(INTERACTION_COLUMNS)} FROM interactions ORDER BY id LIMIT ? OFFSET ?",
+                (limit, offset),
+            ).fetchall()
+        return [self._row_to_interaction(row) for row in rows]
+
+    def page_interactions(self, limit: Optional[int] = None, before: Optional[int] = None,
+                          **filters) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+        clauses, params = self._where(**filters)
+        if before is not None:
+            clauses.append("id < ?")
+            params.append(before)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        sql = f"SELECT id, uid, {', '.join(INTERACTION_COLUMNS)} FROM interactions {where} ORDER BY id DESC"
+        if limit:
+            # Fetch one extra row to know whether an older page exists
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        self._flush_pending()
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+
+        next_cursor = None
+        if limit and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1]["id"]
+        rows.reverse()
+        return [self._row_to_interaction(row) for row in rows], next_cursor
+
+    def count_interactions(self, **filters) -> int:
+        clauses, params = self._where(**filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        self._flush_pending()
+        with self._lock:
+            return self._connect().execute(f"SELECT COUNT(*) FROM interactions {where}", params).fetchone()[0]
+
+    def iter_interactions(self, **filters) -> Iterator[Dict[str, Any]]:
+        """Stream matching interactions in keyset-paged batches"""
+        clauses, params = self._where(**filters)
+        self._flush_pending()
+        last_id = 0
+        while True:
+            where = " AND ".join(clauses + ["id > ?"])
+            with self._lock:
+                rows = self._connect().execute(
+                    f"SELECT id, uid, {', '.join(INTERACTION_COLUMNS)} FROM interactions WHERE {where} ORDER BY id LIMIT ?",
+                    params + [last_id, self.batch_size],
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield self._row_to_interaction(row)
+            last_id = rows[-1]["id"]
+
+    def newest_timestamp(self, collection: str, rank: int) -> Optional[str]:
+        if collection != "interactions":
+            return super().newest_timestamp(collection, rank)
+        if rank < 1:
+            return None
+        self._flush_pending()
+        with self._lock:
+            row = self._connect().execute("SELECT timestamp FROM interactions ORDER BY timestamp DESC LIMIT 1 OFFSET ?",
+                                          (rank - 1,)).fetchone()
+        return row["timestamp"] if row else None
+
+    def compact(self):
+        # Fold the WAL back into the database file after large deletes
+        with self._lock:
+            self._connect().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+STORE_FORMATS = {
+    JSONFileStore.format: JSONFileStore,
+    JournalStore.format: JournalStore,
+    SQLiteStore.format: SQLiteStore,
+}
+
+
+def create_store(storage_path: str, storage_format: str = "json", **options) -> LearningStore:
+    """Create a learning store for the given format"""
+    store_class = STORE_FORMATS.get(storage_format)
+    if store_class is None:
+        supported = ", ".join(f"'{name}'" for name in STORE_FORMATS)
+        raise ValueError(f"Unsupported learning storage format '{storage_format}'. Use {supported}.")
+    return store_class(storage_path, **options)
@@ -0,0 +1,189 @@
+"""
+ABIET Query Suggestions
+Frequency and recency ranked autocomplete over successful past queries
+
+Queries are ranked by a "frecency" score, ``log(count) + last_seen * ln 2 /
+half_life``: one extra use is worth as much as being used ``half_life``
+more recently. The score of a query only ever grows, so rankings between
+queries that were not touched never change and each trie node can cache
+its best completions.
+
+The trie only covers the first ``trie_depth`` characters, which keeps the
+node count small; longer prefixes are answered from a sorted key array with
+bisect, where few keys share the prefix. Once more than ``max_entries``
+queries are known the lowest-scoring ones are dropped.
+"""
+
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional
+import heapq
+import math
+import re
+import threading
+import time
+
+_SPACE_RE = re.compile(r"\s+")
+
+# Catch-up re-reads this many seconds before the watermark, for records other
+# workers persisted late; IDs already recorded are skipped
+WATERMARK_OVERLAP_SECONDS = 60
+# Recorded IDs kept before the first pruning by age
+_RECENT_IDS_MIN_LIMIT = 1024
+
+
+def _normalize(text: str) -> str:
+    return _SPACE_RE.sub(" ", (text or "").lower()).strip()
+
+
+def _normalize_prefix(prefix: str) -> str:
+    # Keep a trailing space: "show " should not complete to "showcase"
+    return _SPACE_RE.sub(" ", (prefix or "").lower()).lstrip()
+
+
+def _epoch(timestamp: Optional[str]) -> float:
+    if not timestamp:
+        return time.time()
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return time.time()
+
+
+class _Entry:
+    __slots__ = ("text", "count", "last_seen", "score")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.count = 0
+        self.last_seen = 0.0
+        self.score = 0.0
+
+
+class _Node:
+    __slots__ = ("children", "top")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # Keys of the best completions below this node, best first
+        self.top: List[str] = []
+
+
+class SuggestionIndex:
+    """Prefix autocomplete ranked by usage frequency and recency"""
+
+    def __init__(self, max_entries: int = 50000, top_k: int = 10, trie_depth: int = 8,
+                 half_life_days: float = 30.0):
+        self.max_entries = max_entries
+        self.top_k = top_k
+        self.trie_depth = trie_depth
+        self.half_life = half_life_days * 86400
+        self.watermark = ""
+        self._entries: Dict[str, _Entry] = {}
+        self._keys: List[str] = []
+        self._root = _Node()
+        # Interaction IDs recorded near the watermark, so catch-up skips them
+        self._recent_ids: Dict[str, str] = {}
+        # Prune by age once this many IDs are kept; doubles with what survives
+        self._recent_ids_limit = _RECENT_IDS_MIN_LIMIT
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def record(self, text: str, timestamp: Optional[str] = None, record_id: Optional[str] = None):
+        """Count one successful use of a query"""
+        key = _normalize(text)
+        if not key:
+            return
+        with self._lock:
+            if record_id is not None:
+                if record_id in self._recent_ids:
+                    return
+                self._recent_ids[record_id] = timestamp or ""
+                if len(self._recent_ids) > self._recent_ids_limit:
+                    self._prune_recent_ids()
+            if timestamp:
+                self.watermark = max(self.watermark, timestamp)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = _Entry(text.strip())
+                insort(self._keys, key)
+            entry.count += 1
+            entry.last_seen = max(entry.last_seen, _epoch(timestamp))
+            entry.score = math.log(entry.count) + entry.last_seen * math.log(2) / self.half_life
+            self._promote(key, entry.score)
+            if len(self._entries) > self.max_entries:
+                self._prune()
+
+    def catch_up_since(self) -> Optional[str]:
+        """Timestamp from which :meth:`catch_up` needs records"""
+        if not self.watermark:
+            return None
+        try:
+            return (datetime.fromisoformat(self.watermark) - timedelta(seconds=WATERMARK_OVERLAP_SECONDS)).isoformat()
+        except ValueError:
+            return None
+
+    def catch_up(self, records: Iterable[Dict[str, Any]]):
+        """Record successful interactions written elsewhere, e.g. by other workers"""
+        with self._lock:
+            for record in records:
+                self.record(record.get("natural_query", ""), record.get("timestamp"), record.get("id"))
+            self._prune_recent_ids()
+
+    def _prune_recent_ids(self):
+        """Forget IDs from before the overlap window, which can no longer come back"""
+        since = self.catch_up_since() or ""
+        self._recent_ids = {record_id: timestamp for record_id, timestamp in self._recent_ids.items()
+                            if timestamp >= since}
+        self._recent_ids_limit = max(_RECENT_IDS_MIN_LIMIT, 2 * len(self._recent_ids))
+
+    def _promote(self, key: str, score: float):
+        """Offer a key whose score grew to the top lists along its path"""
+        node = self._root
+        self._offer(node, key, score)
+        for char in key[:self.trie_depth]:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = _Node()
+            node = child
+            self._offer(node, key, score)
+
+    def _offer(self, node: _Node, key: str, score: float):
+        top = node.top
+        if key in top:
+            top.remove(key)
+        elif len(top) >= self.top_k and self._entries[top[-1]].score >= score:
+            return
+        # Top lists are short, so a linear insert is cheapest
+        position = 0
+        while position < len(top) and self._entries[top[position]].score >= score:
+            position += 1
+        top.insert(position, key)
+        del top[self.top_k:]
+
+    def _prune(self):
+        """Drop the lowest-scoring entries and rebuild the trie"""
+        keep = heapq.nlargest(int(self.max_entries * 0.9), self._entries.items(), key=lambda item: item[1].score)
+        self._entries = dict(keep)
+        self._keys = sorted(self._entries)
+        self._root = _Node()
+        for key, entry in sorted(self._entries.items(), key=lambda item: -item[1].score):
+            self._promote(key, entry.score)
+
+    def suggest(self, prefix: str, limit: int = 5) -> List[str]:
+        """Best completions for ``prefix``, most frequent and recent first"""
+        key = _normalize_prefix(prefix)
+        with self._lock:
+            if len(key) <= self.trie_depth and limit <= self.top_k:
+                node = self._root
+                for char in key:
+                    node = node.children.get(char)
+                    if node is None:
+                        return []
+                return [self._entries[k].text for k in node.top[:limit]]
+            start = bisect_left(self._keys, key)
+            end = bisect_left(self._keys, key + "\uffff", start)
+            best = heapq.nlargest(limit, self._keys[start:end], key=lambda k: self._entries[k].score)
+            return [self._entries[k].text for k in best]
@@ -0,0 +1,173 @@
+"""
+ABIET Write-Behind Buffer
+Group-commit queue that takes learning store writes off the request path
+
+Writers enqueue entries into a bounded queue and return immediately. A
+background thread drains the queue and hands entries to the store in
+batches, either when ``batch_size`` entries are waiting or when
+``flush_interval`` seconds have passed since the first one arrived. A full
+queue blocks writers until the flusher catches up (backpressure). Entries
+submitted after :meth:`close` are written synchronously by the caller.
+"""
+
+from typing import Dict, Any, Callable, List
+import atexit
+import logging
+import queue
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+# Queue markers understood by the flusher thread
+_FLUSH = object()
+_STOP = object()
+
+_buffers: "weakref.WeakSet[WriteBehindBuffer]" = weakref.WeakSet()
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_batch: Callable[[List[Dict[str, Any]]], None], max_queue: int = 10000,
+                 batch_size: int = 100, flush_interval: float = 0.5, name: str = "learning-writer"):
+        self.flush_batch = flush_batch
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._closed = False
+        # Makes the closed check and the enqueue one step, so nothing is queued after close drains
+        self._submit_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "records_flushed": 0,
+            "batches_flushed": 0,
+            "flush_errors": 0,
+            "blocked_submits": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        _buffers.add(self)
+
+    def submit(self, entry: Dict[str, Any]):
+        """Queue an entry, blocking while the queue is full"""
+        self.submit_many([entry])
+
+    def submit_many(self, entries: List[Dict[str, Any]]):
+        """Queue entries that must reach storage in the same batch"""
+        entries = list(entries)
+        with self._submit_lock:
+            if not self._closed:
+                try:
+                    self._queue.put_nowait(entries)
+                except queue.Full:
+                    with self._stats_lock:
+                        self._stats["blocked_submits"] += 1
+                    self._queue.put(entries)
+                return
+        logger.warning(f"Write-behind buffer is closed; writing {len(entries)} learning records synchronously")
+        self._write(entries)
+
+    def flush(self):
+        """Block until every entry queued so far has been written"""
+        if threading.current_thread() is self._thread:
+            return
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        """Flush pending entries and stop the flusher thread"""
+        with self._submit_lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        try:
+            # Only wakes the flusher; a full queue means it is busy and sees the stop flag after this batch
+            self._queue.put_nowait(_STOP)
+        except queue.Full:
+            pass
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return
+                continue
+            batch, markers = [], 1
+            stop = item is _FLUSH or item is _STOP
+            if not stop:
+                batch.extend(item)
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                markers += 1
+                if item is _FLUSH or item is _STOP:
+                    stop = True
+                else:
+                    batch.extend(item)
+            self._write(batch)
+            for _ in range(markers):
+                self._queue.task_done()
+            # Nothing is queued after close, so an empty queue means everything was written
+            if self._stop.is_set() and self._queue.empty():
+                return
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        if not batch:
+            return
+        start = time.perf_counter()
+        try:
+            self.flush_batch(batch)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(batch)} learning records: {str(e)}")
+            with self._stats_lock:
+                self._stats["flush_errors"] += 1
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._stats_lock:
+            self._stats["records_flushed"] += len(batch)
+            self._stats["batches_flushed"] += 1
+            self._stats["last_flush_ms"] = elapsed_ms
+            self._stats["max_flush_ms"] = max(self._stats["max_flush_ms"], elapsed_ms)
+            self._stats["total_flush_ms"] += elapsed_ms
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth and flush latency statistics"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        total_ms = stats.pop("total_flush_ms")
+        batches = stats["batches_flushed"]
+        stats.update({
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "avg_flush_ms": round(total_ms / batches, 3) if batches else 0.0,
+            "last_flush_ms": round(stats["last_flush_ms"], 3),
+            "max_flush_ms": round(stats["max_flush_ms"], 3),
+        })
+        return stats
+
+
+def close_all():
+    """Flush and stop every live write-behind buffer"""
+    for buffer in list(_buffers):
+        buffer.close()
+
+
+atexit.register(close_all)
@@ -0,0 +1,104 @@
+"""
+ABIET LLM Client
+Shared OpenAI clients with a persistent, bounded HTTP connection pool
+
+Creating an ``openai.OpenAI`` client per request builds a new httpx pool
+and pays for a TCP and TLS handshake on every call. The manager creates one
+sync and one async client on first use and hands the same instances out
+afterwards, so connections are kept alive and reused. The async client is
+tied to the event loop it was created on and is recreated if it is asked for
+from another loop. Retries are left to the governor (``ai/llm_governor.py``).
+"""
+
+from typing import Optional
+import asyncio
+import logging
+import threading
+import httpx
+import openai
+from backend.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMClientManager:
+    """Owns the process-wide OpenAI clients and their connection pools"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._client: Optional[openai.OpenAI] = None
+        self._async_client: Optional[openai.AsyncOpenAI] = None
+        self._async_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY,
+        )
+
+    def _timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(settings.LLM_TIMEOUT, connect=settings.LLM_CONNECT_TIMEOUT)
+
+    def get_client(self) -> openai.OpenAI:
+        """The shared synchronous client, created on first use"""
+        with self._lock:
+            if self._client is None:
+                self._client = openai.OpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    timeout=self._timeout(),
+                    max_retries=0,
+                    http_client=httpx.Client(limits=self._limits(), timeout=self._timeout()),
+                )
+            return self._client
+
+    def get_async_client(self) -> openai.AsyncOpenAI:
+        """The shared async client for the running event loop, created on first use"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._async_client is None or self._async_loop is not loop:
+                # Connections of a client from another (possibly closed) loop cannot be reused
+                self._async_client = openai.AsyncOpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    timeout=self._timeout(),
+                    max_retries=0,
+                    http_client=httpx.AsyncClient(limits=self._limits(), timeout=self._timeout()),
+                )
+                self._async_loop = loop
+            return self._async_client
+
+    def close(self):
+        """Close the synchronous client and forget the async one"""
+        with self._lock:
+            client, self._client = self._client, None
+            self._async_client = None
+            self._async_loop = None
+        if client is not None:
+            try:
+                client.close()
+            except Exception as e:
+                logger.warning(f"Closing the OpenAI client failed: {str(e)}")
+
+    async def aclose(self):
+        """Close both clients; call from the event loop the async client was used on"""
+        with self._lock:
+            async_client, self._async_client = self._async_client, None
+            self._async_loop = None
+        if async_client is not None:
+            try:
+                await async_client.close()
+            except Exception as e:
+                logger.warning(f"Closing the async OpenAI client failed: {str(e)}")
+        self.close()
+
+
+# Process-wide client manager shared by the query and feedback processors
+llm_clients = LLMClientManager()
+
+
+def get_llm_client() -> openai.OpenAI:
+    return llm_clients.get_client()
+
+
+def get_async_llm_client() -> openai.AsyncOpenAI:
+    return llm_clients.get_async_client()
@@ -0,0 +1,356 @@
+"""
+ABIET LLM Governor
+Rate limits, retries, circuit breaking and adaptive concurrency for OpenAI calls
+
+Every chat completion goes through the process-wide governor:
+
+- token buckets hold calls back to ``LLM_REQUESTS_PER_MINUTE`` requests and
+  ``LLM_TOKENS_PER_MINUTE`` tokens (prompt estimate plus ``max_tokens``, which
+  is what OpenAI counts against the limit) per worker
+- an AIMD limit caps the calls in flight: it grows by about one per limit's
+  worth of fast successes and halves when the API throttles, times out or
+  answers slower than ``LLM_TARGET_LATENCY``
+- retryable failures (connection errors, timeouts, 429 and 5xx answers) are
+  retried with jittered exponential backoff, honouring ``Retry-After``
+- after ``LLM_CIRCUIT_FAILURE_THRESHOLD`` consecutive retryable failures the
+  circuit opens and calls fail fast with :class:`CircuitOpenError` for
+  ``LLM_CIRCUIT_RESET_TIMEOUT`` seconds; then a single probe call decides
+  whether it closes again
+
+Other errors (bad requests, authentication, unparseable output) are raised
+at once and do not count against the circuit. The OpenAI clients are created
+with ``max_retries=0`` so that retries happen here only.
+"""
+
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+import asyncio
+import collections
+import logging
+import random
+import threading
+import time
+import openai
+from backend.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token for estimating prompt size
+CHARS_PER_TOKEN = 4
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit is open"""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether a failed call may succeed when repeated"""
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return isinstance(exc, openai.APIStatusError) and exc.status_code >= 500
+
+
+def _is_overload(exc: BaseException) -> bool:
+    return isinstance(exc, (openai.RateLimitError, openai.APITimeoutError))
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    """Seconds requested by a ``Retry-After`` header, if any"""
+    response = getattr(exc, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(kwargs: Dict[str, Any]) -> int:
+    """Tokens a chat completion request counts against the tokens-per-minute limit"""
+    characters = sum(len(str(message.get("content") or "")) for message in kwargs.get("messages", []))
+    return characters // CHARS_PER_TOKEN + int(kwargs.get("max_tokens") or 0)
+
+
+class TokenBucket:
+    """Refills ``per_minute`` tokens a minute, up to one minute's worth; 0 disables it.
+
+    :meth:`reserve` takes the tokens at once, going into debt if needed, and
+    returns how long the caller has to wait before using them, so sync and
+    async callers share one bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.per_minute = per_minute
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1) -> float:
+        if self.per_minute <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            rate = self.per_minute / 60.0
+            self._tokens = min(self.per_minute, self._tokens + (now - self._updated) * rate)
+            self._updated = now
+            # A request larger than the bucket waits for a full bucket instead of forever
+            self._tokens -= min(amount, self.per_minute)
+            return max(0.0, -self._tokens / rate)
+
+
+class CircuitBreaker:
+    """Closed, open or half open; ``failure_threshold`` 0 disables it"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise :class:`CircuitOpenError` unless a call may go ahead"""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+        raise CircuitOpenError("The AI service is temporarily unavailable. Please try again shortly.")
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """Count a retryable failure; a failed probe reopens the circuit"""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                    logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release_probe(self):
+        """End a probe that neither succeeded nor failed retryably"""
+        with self._lock:
+            self._probing = False
+
+
+class AdaptiveConcurrencyLimit:
+    """Additive-increase/multiplicative-decrease limit on calls in flight.
+
+    Sync callers block their thread and async callers await; both wait in one
+    FIFO queue and are woken as slots free up.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int, target_latency: float, enabled: bool = True):
+        self.minimum = max(minimum, 1)
+        self.maximum = max(maximum, self.minimum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.target_latency = target_latency
+        self.enabled = enabled
+        self.in_flight = 0
+        self._waiters: Deque[Callable[[], None]] = collections.deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> bool:
+        if not self.enabled or self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                event = threading.Event()
+                self._waiters.append(event.set)
+            event.wait()
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._try_acquire():
+                    return
+                future = loop.create_future()
+                waiter = lambda: loop.call_soon_threadsafe(_wake, future)
+                self._waiters.append(waiter)
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    queued = waiter in self._waiters
+                    if queued:
+                        self._waiters.remove(waiter)
+                if not queued:
+                    # The wake-up was meant for this waiter; pass it on
+                    self._wake()
+                raise
+
+    def release(self, latency: float, overloaded: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if overloaded or latency > self.target_latency:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        self._wake()
+
+    def _wake(self):
+        with self._lock:
+            free = int(self.limit) - self.in_flight if self.enabled else len(self._waiters)
+            woken = [self._waiters.popleft() for _ in range(min(max(free, 0), len(self._waiters)))]
+        for wake in woken:
+            try:
+                wake()
+            except RuntimeError:
+                # The waiter's event loop is closed
+                pass
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMGovernor:
+    """Runs OpenAI calls under the rate limits, retry policy, circuit breaker and concurrency limit"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Start over with the current settings"""
+        self.requests = TokenBucket(settings.LLM_REQUESTS_PER_MINUTE)
+        self.tokens = TokenBucket(settings.LLM_TOKENS_PER_MINUTE)
+        self.breaker = CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RESET_TIMEOUT)
+        self.concurrency = AdaptiveConcurrencyLimit(
+            settings.LLM_INITIAL_CONCURRENCY,
+            settings.LLM_MIN_CONCURRENCY,
+            settings.LLM_MAX_CONCURRENCY,
+            settings.LLM_TARGET_LATENCY,
+            enabled=settings.LLM_ADAPTIVE_CONCURRENCY,
+        )
+        self.calls = 0
+        self.retries = 0
+        self.rejected = 0
+        self.throttled_seconds = 0.0
+
+    def _admit(self, kwargs: Dict[str, Any]) -> float:
+        """Check the circuit and reserve rate budget; returns the seconds to wait"""
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self.rejected += 1
+            raise
+        wait = max(self.requests.reserve(1), self.tokens.reserve(estimate_tokens(kwargs)))
+        self.throttled_seconds += wait
+        return wait
+
+    def _backoff(self, attempt: int, exc: BaseException) -> float:
+        """Full-jitter exponential delay, or the server's ``Retry-After``"""
+        delay = random.uniform(0, min(settings.LLM_RETRY_MAX_DELAY, settings.LLM_RETRY_BASE_DELAY * 2 ** attempt))
+        retry_after = _retry_after(exc)
+        if retry_after is not None:
+            delay = min(max(delay, retry_after), settings.LLM_RETRY_MAX_DELAY)
+        return delay
+
+    def _finish(self, started: float, exc: Optional[BaseException] = None) -> bool:
+        """Record the outcome of one attempt; returns whether it may be retried"""
+        self.concurrency.release(time.monotonic() - started, overloaded=exc is not None and _is_overload(exc))
+        if exc is None:
+            self.breaker.record_success()
+            return False
+        if not is_retryable(exc):
+            self.breaker.release_probe()
+            return False
+        self.breaker.record_failure()
+        return True
+
+    def call(self, create: Callable[..., Any], **kwargs) -> Any:
+        """Call ``create(**kwargs)`` (a blocking OpenAI method) under the governor"""
+        attempt = 0
+        while True:
+            time.sleep(self._admit(kwargs))
+            self.concurrency.acquire()
+            started = time.monotonic()
+            self.calls += 1
+            try:
+                result = create(**kwargs)
+            except Exception as e:
+                if not self._finish(started, e) or attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"Retrying OpenAI call in {delay:.2f}s after: {str(e)}")
+                self.retries += 1
+                attempt += 1
+                time.sleep(delay)
+                continue
+            self._finish(started)
+            return result
+
+    async def acall(self, create: Callable[..., Awaitable[Any]], **kwargs) -> Any:
+        """Await ``create(**kwargs)`` (an async OpenAI method) under the governor"""
+        attempt = 0
+        while True:
+            wait = self._admit(kwargs)
+            try:
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                await self.concurrency.aacquire()
+            except asyncio.CancelledError:
+                # This call may have been admitted as the half-open probe
+                self.breaker.release_probe()
+                raise
+            started = time.monotonic()
+            self.calls += 1
+            try:
+                result = await create(**kwargs)
+            except asyncio.CancelledError:
+                self.concurrency.release(0.0)
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                if not self._finish(started, e) or attempt >= settings.LLM_MAX_RETRIES:
+                    raise
+                delay = self._backoff(attempt, e)
+                logger.warning(f"Retrying OpenAI call in {delay:.2f}s after: {str(e)}")
+                self.retries += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+                continue
+            self._finish(started)
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "rejected": self.rejected,
+            "throttled_seconds": round(self.throttled_seconds, 3),
+            "circuit": {"state": self.breaker.state, "failures": self.breaker.failures,
+                        "opened": self.breaker.opened},
+            "concurrency": {"limit": int(self.concurrency.limit), "in_flight": self.concurrency.in_flight},
+        }
+
+
+# Process-wide governor shared by the query and feedback processors
+llm_governor = LLMGovernor()
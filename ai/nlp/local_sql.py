@@ -0,0 +1,158 @@
+"""
+ABIET Local SQL Generator
+Deterministic fast path for trivial queries, ahead of the LLM
+
+A small grammar recognizes queries such as "show all customers", "get name
+and email from users" or "how many orders are there". Table and column
+words are resolved against the known database schema (exact names or simple
+singular/plural variants). A match is only reported when the whole query is
+consumed by a pattern and every name resolves, and its confidence drops for
+inexact names. Without a schema (e.g. a database configured in settings that
+was never introspected) only whole-table queries ("show all customers", "how
+many orders are there") are matched, taking the word as the table name at
+``UNRESOLVED_CONFIDENCE``, which is below the default threshold.
+"""
+
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+import re
+
+from ai.nlp.response_cache import normalize_query
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+_VERB = r"(?:select|show|list|get|display|give|fetch|find)"
+_PATTERNS = [
+    ("select_all", re.compile(
+        rf"^{_VERB}(?: me)?(?: all| every)?(?: of)?(?: the)? (?P<table>\w+)(?: table| records| rows)?$")),
+    ("select_columns", re.compile(
+        rf"^{_VERB}(?: me)?(?: the)? (?P<columns>\w+(?: \w+)*?) (?:from|of|for)(?: all| every)?(?: the)? (?P<table>\w+)(?: table)?$")),
+    ("count", re.compile(
+        r"^(?:count(?: all| the)?|how many) (?P<table>\w+)(?: are there| do we have| exist| there are| in total)?$")),
+]
+
+# Confidence of a name that only matched as a singular/plural variant
+VARIANT_CONFIDENCE = 0.95
+# Confidence of an answer whose names could not be checked against a schema;
+# below the default QUERY_LOCAL_MIN_CONFIDENCE, so such answers are opt-in
+UNRESOLVED_CONFIDENCE = 0.8
+# Words that refer to the database itself rather than to one of its tables
+_GENERIC_WORDS = {"tables", "table", "columns", "data", "everything", "records", "rows", "databases", "schema"}
+
+
+@dataclass
+class LocalMatch:
+    sql: str
+    confidence: float
+    pattern: str
+    table: str
+    columns: List[str] = field(default_factory=list)
+
+    def as_parsed(self) -> Dict:
+        """Same shape as a parsed LLM response"""
+        return {
+            "intent": f"{'count' if self.pattern == 'count' else 'retrieve'} {self.table}",
+            "sql": self.sql,
+            "entities": {"table": self.table, "columns": self.columns},
+            "confidence": self.confidence,
+        }
+
+
+def word_variants(word: str) -> Iterable[str]:
+    """Singular and plural forms of an English word"""
+    if word.endswith("ies"):
+        yield word[:-3] + "y"
+    if word.endswith("es"):
+        yield word[:-2]
+    if word.endswith("s"):
+        yield word[:-1]
+    if word.endswith("y"):
+        yield word[:-1] + "ies"
+    yield word + "s"
+    yield word + "es"
+
+
+def _resolve(word: str, names: Dict[str, str]) -> Tuple[Optional[str], float]:
+    """Map a word to a schema name (via its lowercase form) with a confidence"""
+    if word in names:
+        return names[word], 1.0
+    matches = {names[variant] for variant in word_variants(word) if variant in names}
+    if len(matches) == 1:
+        return matches.pop(), VARIANT_CONFIDENCE
+    return None, 0.0
+
+
+class LocalSQLGenerator:
+    """Template matcher with a schema-aware table and column resolver"""
+
+    def __init__(self, schema: Optional[Dict[str, List[str]]] = None):
+        self.set_schema(schema or {})
+
+    def set_schema(self, schema: Dict[str, List[str]]):
+        """Known tables and their columns, ``{table: [column, ...]}``"""
+        # Names that would need quoting are left to the LLM
+        self._tables = {table.lower(): table for table in schema if _IDENTIFIER_RE.match(table)}
+        self._columns = {table: {column.lower(): column for column in schema[table] if _IDENTIFIER_RE.match(column)}
+                         for table in self._tables.values()}
+
+    def generate(self, query: str) -> Optional[LocalMatch]:
+        """The best local match for ``query``, or None"""
+        text = normalize_query(query)
+        if not self._tables:
+            return self._generate_unresolved(text)
+        for name, pattern in _PATTERNS:
+            match = pattern.match(text)
+            if match is None:
+                continue
+            table, confidence = _resolve(match.group("table"), self._tables)
+            if table is None:
+                continue
+            if name == "count":
+                return LocalMatch(f"SELECT COUNT(*) FROM {table}", confidence, name, table)
+            if name == "select_all":
+                return LocalMatch(f"SELECT * FROM {table}", confidence, name, table)
+            columns = self._resolve_columns(match.group("columns"), table)
+            if columns is None:
+                continue
+            column_names = [column for column, _ in columns]
+            confidence *= min(score for _, score in columns)
+            return LocalMatch(f"SELECT {', '.join(column_names)} FROM {table}", confidence, name, table, column_names)
+        return None
+
+    def _generate_unresolved(self, text: str) -> Optional[LocalMatch]:
+        """Match without a schema, taking the table word as it is"""
+        for name, pattern in _PATTERNS:
+            # Without a schema, "find users from germany" cannot be told apart
+            # from a column list, so only whole-table queries are answered
+            if name == "select_columns":
+                continue
+            match = pattern.match(text)
+            if match is None:
+                continue
+            table = match.group("table")
+            if not _IDENTIFIER_RE.match(table) or table in _GENERIC_WORDS:
+                return None
+            if name == "count":
+                return LocalMatch(f"SELECT COUNT(*) FROM {table}", UNRESOLVED_CONFIDENCE, name, table)
+            return LocalMatch(f"SELECT * FROM {table}", UNRESOLVED_CONFIDENCE, name, table)
+        return None
+
+    def _resolve_columns(self, text: str, table: str) -> Optional[List[Tuple[str, float]]]:
+        """Resolve every word of a column list, joining word pairs like "first name" to first_name"""
+        names = self._columns.get(table, {})
+        words = [word for word in text.split() if word != "and"]
+        columns = []
+        position = 0
+        while position < len(words):
+            if position + 1 < len(words):
+                column, score = _resolve(f"{words[position]}_{words[position + 1]}", names)
+                if column is not None:
+                    columns.append((column, score))
+                    position += 2
+                    continue
+            column, score = _resolve(words[position], names)
+            if column is None:
+                return None
+            columns.append((column, score))
+            position += 1
+        return columns or None
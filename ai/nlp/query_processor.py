@@ -1,24 +1,71 @@
 """ai.nlp.query_processor
 ================================
-This module provides a lightweight NLP query processor for the ABIET project.
-It tokenizes queries and generates basic SQL for simple SELECT statements.
+This module provides the NLP query processor for the ABIET project.
+Queries are answered by the first of three tiers that can:
 
-For now, it supports patterns like:
-- "select all customers" -> "SELECT * FROM customers"
-- "show me users" -> "SELECT * FROM users"
-- "get customer names" -> "SELECT names FROM customers" (basic)
+- ``local``: deterministic templates resolved against the known schema, e.g.
+  "show all customers" -> "SELECT * FROM customers" (``ai/nlp/local_sql.py``)
+- ``cache``: a previously generated response for the same normalized query
+- ``llm``: the OpenAI API
 
-Future versions will use advanced NLP models for complex queries.
+Once a database has been connected, its schema is introspected
+(``ai/nlp/schema_cache.py``). Queries name the schema to use by its key
+(``schema_source``); the local tier resolves names against that schema and
+LLM prompts list the tables and columns relevant to the query.
 """
 
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Dict, Any
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Set, Tuple
+import asyncio
+import copy
 import json
+import logging
+import re
+import sqlite3
+import threading
+import uuid
 import openai
+from sqlalchemy.engine import Engine
 from backend.config.settings import settings
-from ai.learning.learning_engine import LearningEngine
+from ai.learning.learning_engine import LearningEngine, get_learning_engine
+from ai.llm_client import get_async_llm_client, get_llm_client
+from ai.llm_governor import llm_governor
+from ai.nlp.response_cache import PersistentResponseCache, ResponseCache, fingerprint, normalize_query
+from ai.nlp.local_sql import LocalSQLGenerator
+from ai.nlp.rate_limit import AsyncRateLimiter
+from ai.nlp.schema_cache import SchemaCache, SchemaSnapshot, select_relevant
+from ai.nlp.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Part of the response cache key; bump whenever the prompt below changes
+PROMPT_VERSION = 2
+
+TIER_LOCAL = "local"
+TIER_CACHE = "cache"
+TIER_LLM = "llm"
+
+# The "sql" member of a (possibly still incomplete) JSON response, once its value is complete
+_SQL_FIELD_RE = re.compile(r'"sql"\s*:\s*(null|"(?:[^"\\]|\\.)*")')
+
+
+def extract_sql(partial: str) -> Tuple[bool, Optional[str]]:
+    """Find the ``sql`` value in a partial JSON response.
+
+    Returns ``(True, value)`` as soon as the value is complete, which is
+    usually long before the rest of the response, and ``(False, None)``
+    before that.
+    """
+    match = _SQL_FIELD_RE.search(partial)
+    if match is None:
+        return False, None
+    try:
+        return True, json.loads(match.group(1))
+    except json.JSONDecodeError:
+        # Invalid escapes; the full response will not parse either
+        return False, None
 
 
 @dataclass
@@ -35,12 +82,203 @@ class QueryProcessor:
 
     def __post_init__(self):
         openai.api_key = settings.OPENAI_API_KEY
-        self.learning_engine = LearningEngine()
+        self.learning_engine: LearningEngine = get_learning_engine()
+        self.response_cache = ResponseCache(
+            max_entries=settings.QUERY_CACHE_MAX_ENTRIES,
+            ttl=settings.QUERY_CACHE_TTL,
+            max_bytes=settings.QUERY_CACHE_MAX_BYTES,
+        )
+        # Answers trivial queries without the LLM; each schema snapshot has its own generator
+        self.local_generator = LocalSQLGenerator()
+        self.schema_cache = SchemaCache(ttl=settings.SCHEMA_CACHE_TTL)
+        # Schemas (fingerprint and cache version) the memory cache was warmed for
+        self._warmed_schemas: Set[Tuple] = set()
+        self._warm_lock = threading.Lock()
+        self.tier_counts: Dict[str, int] = {TIER_LOCAL: 0, TIER_CACHE: 0, TIER_LLM: 0}
+        # Identical queries in flight at the same time share one OpenAI call
+        self.single_flight = SingleFlight()
+        self.persistent_cache: Optional[PersistentResponseCache] = None
+        if settings.QUERY_CACHE_PATH:
+            self.persistent_cache = PersistentResponseCache(
+                settings.QUERY_CACHE_PATH,
+                ttl=settings.QUERY_CACHE_PERSISTENT_TTL,
+                max_entries=settings.QUERY_CACHE_PERSISTENT_MAX_ENTRIES,
+            )
+            self.persistent_cache.purge(fingerprint(self._cache_version()))
 
-    def _process_with_openai(self, query: str) -> Dict[str, Any]:
-        """Process the query using OpenAI API for intent detection and SQL generation."""
-        prompt = f"""
-Convert the following natural language query to SQL. Assume a database with tables like users, orders, products, etc. Detect the intent and generate appropriate SQL.
+    def _cache_version(self) -> Tuple:
+        """Everything besides the query text that shapes the response"""
+        return (
+            settings.AI_MODEL,
+            settings.AI_TEMPERATURE,
+            settings.AI_MAX_TOKENS,
+            PROMPT_VERSION,
+            settings.QUERY_CACHE_SCHEMA_VERSION,
+        )
+
+    def _cache_key(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> Tuple:
+        """Response cache key: normalized query, schema fingerprint and the cache version"""
+        return (normalize_query(query), snapshot.fingerprint if snapshot else "") + self._cache_version()
+
+    def load_schema(self, source: str, connect: Callable[[], Engine], owner: Optional[str] = None,
+                    label: Optional[str] = None) -> SchemaSnapshot:
+        """Introspect a connected database and make it ``owner``'s active schema.
+
+        ``connect`` returns the database's engine, now and for later
+        refreshes. Blocking; run it in a worker thread from the event loop.
+        The memory cache is warmed for the schema, as cache keys depend on it,
+        the first time the schema is loaded; warming scans the whole history.
+        """
+        snapshot = self.schema_cache.load(source, connect, owner, label)
+        schema = (snapshot.fingerprint,) + self._cache_version()
+        with self._warm_lock:
+            warm = schema not in self._warmed_schemas
+            self._warmed_schemas.add(schema)
+        if warm:
+            self.warm_cache(snapshot=snapshot)
+        return snapshot
+
+    def refresh_schema(self, source: Optional[str]) -> Optional[SchemaSnapshot]:
+        """Introspect a known database again, e.g. after a migration"""
+        return self.schema_cache.refresh(source)
+
+    @property
+    def _caching(self) -> bool:
+        return self.response_cache.enabled or self.persistent_cache is not None
+
+    def _persistent_get(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        """Look a key up in the persistent tier, promoting hits to memory"""
+        try:
+            parsed = self.persistent_cache.get(fingerprint(key))
+        except sqlite3.Error as e:
+            logger.warning(f"Persistent response cache read failed: {str(e)}")
+            return None
+        if parsed is not None:
+            self.response_cache.put(key, parsed)
+        return parsed
+
+    def _store_response(self, key: Tuple, parsed: Dict[str, Any]):
+        """Cache a response; errors and "unable to generate SQL" answers are retried next time"""
+        if not isinstance(parsed, dict) or parsed.get("sql") is None:
+            return
+        self.response_cache.put(key, parsed)
+        if self.persistent_cache is not None:
+            try:
+                self.persistent_cache.put(fingerprint(key), fingerprint(key[2:]), parsed)
+            except sqlite3.Error as e:
+                logger.warning(f"Persistent response cache write failed: {str(e)}")
+
+    def _local_answer(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> Optional[Dict[str, Any]]:
+        """The local tier's answer, if it is confident enough"""
+        if not settings.QUERY_LOCAL_TIER:
+            return None
+        generator = snapshot.local_generator if snapshot else self.local_generator
+        match = generator.generate(query)
+        if match is None or match.confidence < settings.QUERY_LOCAL_MIN_CONFIDENCE:
+            return None
+        return match.as_parsed()
+
+    def _answered(self, parsed: Dict[str, Any], tier: str) -> Tuple[Dict[str, Any], str]:
+        self.tier_counts[tier] += 1
+        return parsed, tier
+
+    def _process_tiered(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> Tuple[Dict[str, Any], str]:
+        """Return the parsed response and the tier that answered"""
+        parsed = self._local_answer(query, snapshot)
+        if parsed is not None:
+            return self._answered(parsed, TIER_LOCAL)
+        if not self._caching:
+            return self._answered(self._process_with_openai(query, snapshot), TIER_LLM)
+        key = self._cache_key(query, snapshot)
+        parsed = self.response_cache.get(key)
+        if parsed is None and self.persistent_cache is not None:
+            parsed = self._persistent_get(key)
+        if parsed is not None:
+            return self._answered(parsed, TIER_CACHE)
+        parsed = self._process_with_openai(query, snapshot)
+        self._store_response(key, parsed)
+        return self._answered(parsed, TIER_LLM)
+
+    async def _aprocess_tiered(self, query: str, limiter: Optional[AsyncRateLimiter] = None,
+                               snapshot: Optional[SchemaSnapshot] = None) -> Tuple[Dict[str, Any], str]:
+        """Async :meth:`_process_tiered`; SQLite cache access runs in a worker thread.
+
+        Concurrent misses for the same key are coalesced into one OpenAI call.
+        ``limiter`` throttles the OpenAI calls, not local answers or cache hits.
+        """
+        parsed = self._local_answer(query, snapshot)
+        if parsed is not None:
+            return self._answered(parsed, TIER_LOCAL)
+        key = self._cache_key(query, snapshot)
+        parsed = await self._acache_lookup(key)
+        if parsed is not None:
+            return self._answered(parsed, TIER_CACHE)
+        parsed = await self.single_flight.do(key, lambda: self._afetch(key, query, limiter, snapshot))
+        return self._answered(parsed, TIER_LLM)
+
+    async def _acache_lookup(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        if not self._caching:
+            return None
+        parsed = self.response_cache.get(key)
+        if parsed is None and self.persistent_cache is not None:
+            parsed = await asyncio.to_thread(self._persistent_get, key)
+        return parsed
+
+    async def _afetch(self, key: Tuple, query: str, limiter: Optional[AsyncRateLimiter],
+                      snapshot: Optional[SchemaSnapshot] = None) -> Dict[str, Any]:
+        """Call OpenAI and cache the response"""
+        if limiter is not None:
+            await limiter.acquire()
+        parsed = await self._aprocess_with_openai(query, snapshot)
+        await self._astore_response(key, parsed)
+        return parsed
+
+    async def _astore_response(self, key: Tuple, parsed: Dict[str, Any]):
+        if self.persistent_cache is not None:
+            await asyncio.to_thread(self._store_response, key, parsed)
+        elif self._caching:
+            self._store_response(key, parsed)
+
+    def warm_cache(self, limit: Optional[int] = None, snapshot: Optional[SchemaSnapshot] = None) -> int:
+        """Load the most used queries' responses for a schema from the persistent cache into memory.
+
+        Queries are ranked by how often they succeeded in the learning
+        history. Returns the number of responses loaded.
+        """
+        limit = settings.QUERY_CACHE_WARM_ENTRIES if limit is None else limit
+        if self.persistent_cache is None or limit <= 0 or not self.response_cache.enabled:
+            return 0
+        counts: Dict[Tuple, int] = {}
+        for query, count in self.learning_engine.get_query_counts().items():
+            key = self._cache_key(query, snapshot)
+            counts[key] = counts.get(key, 0) + count
+        top = sorted(counts, key=counts.get, reverse=True)[:limit]
+        keys = {fingerprint(key): key for key in top}
+        found = self.persistent_cache.get_many(keys)
+        # Least used first, so the most used end up most recently used in the LRU
+        for digest in reversed([digest for digest in keys if digest in found]):
+            self.response_cache.put(keys[digest], found[digest])
+        logger.info(f"Warmed the response cache with {len(found)} of the {len(top)} most used queries")
+        return len(found)
+
+    def _schema_prompt(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> str:
+        """Tables and columns of the schema that are relevant to the query"""
+        if snapshot is None:
+            return "Assume a database with tables like users, orders, products, etc. "
+        tables = select_relevant(query, snapshot, settings.SCHEMA_PROMPT_MAX_TABLES,
+                                 settings.SCHEMA_PROMPT_MAX_COLUMNS)
+        heading = "relevant tables"
+        if not tables:
+            # Nothing matched by name; the real schema still beats a made-up one
+            tables = {table: columns[:settings.SCHEMA_PROMPT_MAX_COLUMNS]
+                      for table, columns in list(snapshot.tables.items())[:settings.SCHEMA_PROMPT_MAX_TABLES]}
+            heading = "tables" if len(tables) == len(snapshot.tables) else "tables, among others"
+        lines = "\n".join(f"- {table}({', '.join(columns)})" for table, columns in tables.items())
+        return f"The database has the following {heading} (columns in parentheses):\n{lines}\n"
+
+    def _build_prompt(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> str:
+        return f"""
+Convert the following natural language query to SQL. {self._schema_prompt(query, snapshot)}Detect the intent and generate appropriate SQL.
 
 Query: {query}
 
@@ -51,60 +289,46 @@ Return a JSON object with the following keys:
 
 If unable to generate SQL, set "sql" to null and provide a reason in "error".
 """
+
+    def _completion_args(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> Dict[str, Any]:
+        return {
+            "model": settings.AI_MODEL,
+            "messages": [{"role": "user", "content": self._build_prompt(query, snapshot)}],
+            "temperature": settings.AI_TEMPERATURE,
+            "max_tokens": settings.AI_MAX_TOKENS,
+        }
+
+    def _process_with_openai(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> Dict[str, Any]:
+        """Process the query using OpenAI API for intent detection and SQL generation."""
         try:
-            client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
-            response = client.chat.completions.create(
-                model=settings.AI_MODEL,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=settings.AI_TEMPERATURE,
-                max_tokens=settings.AI_MAX_TOKENS,
-            )
+            client = get_llm_client()
+            response = llm_governor.call(client.chat.completions.create, **self._completion_args(query, snapshot))
+            content = response.choices[0].message.content.strip()
+            parsed = json.loads(content)
+            return parsed
+        except Exception as e:
+            return self._error_response(e)
+
+    async def _aprocess_with_openai(self, query: str, snapshot: Optional[SchemaSnapshot] = None) -> Dict[str, Any]:
+        """Async :meth:`_process_with_openai`; the event loop is free while the request is in flight."""
+        try:
+            client = get_async_llm_client()
+            response = await llm_governor.acall(client.chat.completions.create,
+                                                **self._completion_args(query, snapshot))
             content = response.choices[0].message.content.strip()
             parsed = json.loads(content)
             return parsed
-        except openai.OpenAIError as e:
-            return {"intent": "error", "sql": None, "entities": {}, "error": str(e)}
-        except json.JSONDecodeError as e:
-            return {"intent": "error", "sql": None, "entities": {}, "error": f"Invalid JSON response: {str(e)}"}
         except Exception as e:
-            return {"intent": "error", "sql": None, "entities": {}, "error": str(e)}
+            return self._error_response(e)
 
-    def _generate_sql(self, parsed: Dict[str, Any]) -> str:
-        """Generate basic SQL from parsed tokens.
+    def _error_response(self, exc: Exception) -> Dict[str, Any]:
+        """Parsed-response shape for a failed OpenAI call"""
+        if isinstance(exc, json.JSONDecodeError):
+            return {"intent": "error", "sql": None, "entities": {}, "error": f"Invalid JSON response: {str(exc)}"}
+        return {"intent": "error", "sql": None, "entities": {}, "error": str(exc)}
 
-        Supports simple patterns:
-        - select [all|*] [table]
-        - show [me] [table]
-        - get [column] from [table]
-        """
-        tokens = parsed["tokens"]
-        if not tokens:
-            return "-- Unable to parse query"
-
-        # Pattern 1: select all [table]
-        if tokens[0] == "select" and "all" in tokens:
-            table_idx = tokens.index("all") + 1
-            if table_idx < len(tokens):
-                table = tokens[table_idx]
-                return f"SELECT * FROM {table};"
-
-        # Pattern 2: show [me] [table]
-        if tokens[0] == "show":
-            table = tokens[-1] if len(tokens) > 1 else "unknown"
-            return f"SELECT * FROM {table};"
-
-        # Pattern 3: get [column] from [table]
-        if tokens[0] == "get" and "from" in tokens:
-            from_idx = tokens.index("from")
-            column = " ".join(tokens[1:from_idx])
-            table = tokens[from_idx + 1] if from_idx + 1 < len(tokens) else "unknown"
-            return f"SELECT {column} FROM {table};"
-
-        # Fallback
-        return "-- Query not recognized. Supported: 'select all customers', 'show users', 'get names from customers'"
-
-    def process(self, query: str) -> Dict[str, Any]:
-        """Process a raw query string.
+    def process(self, query: str, schema_source: Optional[str] = None) -> Dict[str, Any]:
+        """Process a raw query string against the schema of ``schema_source``, if known.
 
         Returns
         -------
@@ -114,22 +338,156 @@ If unable to generate SQL, set "sql" to null and provide a reason in "error".
         """
         if not isinstance(query, str):
             raise TypeError("query must be a string")
-        parsed = self._process_with_openai(query)
-        
-        # Record the interaction
+        parsed, tier = self._process_tiered(query, self.schema_cache.get(schema_source))
+        interaction_id = self.learning_engine.record_interaction(**self._interaction(query, parsed))
+        return self._result(query, parsed, interaction_id, tier)
+
+    async def aprocess(self, query: str, schema_source: Optional[str] = None) -> Dict[str, Any]:
+        """Async :meth:`process` for use on the event loop.
+
+        The OpenAI call uses the async client, and the learning engine write
+        (file or database I/O) runs in a worker thread, so many queries can be
+        in flight in one worker.
+        """
+        if not isinstance(query, str):
+            raise TypeError("query must be a string")
+        parsed, tier = await self._aprocess_tiered(query, snapshot=self.schema_cache.get(schema_source))
+        interaction_id = await asyncio.to_thread(self.learning_engine.record_interaction,
+                                                 **self._interaction(query, parsed))
+        return self._result(query, parsed, interaction_id, tier)
+
+    async def astream(self, query: str, schema_source: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Process a query with a streamed OpenAI response, yielding ``(event, data)`` pairs.
+
+        Events are ``delta`` (``content``: the next chunk of model output),
+        ``sql`` (``sql``: sent once, as soon as the value can be read from the
+        partial response) and finally ``result``, with the same data as
+        :meth:`process` returns. Local answers and cached responses skip
+        straight to ``sql``. Streams are not coalesced: each one needs its own
+        model output.
+        """
+        if not isinstance(query, str):
+            raise TypeError("query must be a string")
+        snapshot = self.schema_cache.get(schema_source)
+        key = self._cache_key(query, snapshot)
+        tier = TIER_LOCAL
+        parsed = self._local_answer(query, snapshot)
+        if parsed is None:
+            tier = TIER_CACHE
+            parsed = await self._acache_lookup(key)
+        sql_sent = False
+        if parsed is None:
+            tier = TIER_LLM
+            content = ""
+            try:
+                client = get_async_llm_client()
+                # The governor covers opening the stream, not reading it
+                stream = await llm_governor.acall(client.chat.completions.create,
+                                                  **self._completion_args(query, snapshot), stream=True)
+                async for chunk in stream:
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if not delta:
+                        continue
+                    content += delta
+                    yield "delta", {"content": delta}
+                    if not sql_sent:
+                        sql_sent, sql = extract_sql(content)
+                        if sql_sent:
+                            yield "sql", {"sql": sql}
+                parsed = json.loads(content.strip())
+            except Exception as e:
+                parsed = self._error_response(e)
+            await self._astore_response(key, parsed)
+        self.tier_counts[tier] += 1
+        if not sql_sent:
+            yield "sql", {"sql": parsed.get("sql")}
+        interaction_id = await asyncio.to_thread(self.learning_engine.record_interaction,
+                                                 **self._interaction(query, parsed))
+        yield "result", self._result(query, parsed, interaction_id, tier)
+
+    async def aiter_many(self, queries: List[str], concurrency: Optional[int] = None,
+                         rate_limit: Optional[float] = None,
+                         schema_source: Optional[str] = None) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """Process a batch of queries, yielding ``(index, result)`` as each completes.
+
+        At most ``concurrency`` queries run at once and at most ``rate_limit``
+        OpenAI calls start per second (settings ``QUERY_BATCH_CONCURRENCY``
+        and ``QUERY_BATCH_RATE_LIMIT`` by default). Queries that normalize to
+        the same key are processed once. The interactions of the queries that
+        completed together are recorded in one learning-engine write before
+        their results are yielded, so their IDs can take feedback right away.
+        """
+        if not all(isinstance(query, str) for query in queries):
+            raise TypeError("queries must be strings")
+        concurrency = settings.QUERY_BATCH_CONCURRENCY if concurrency is None else concurrency
+        semaphore = asyncio.Semaphore(max(concurrency, 1))
+        limiter = AsyncRateLimiter(settings.QUERY_BATCH_RATE_LIMIT if rate_limit is None else rate_limit)
+        snapshot = self.schema_cache.get(schema_source)
+
+        indexes_by_key: Dict[Tuple, List[int]] = {}
+        for index, query in enumerate(queries):
+            indexes_by_key.setdefault(self._cache_key(query, snapshot), []).append(index)
+
+        async def run(indexes: List[int]) -> Tuple[List[int], Dict[str, Any], str]:
+            async with semaphore:
+                try:
+                    parsed, tier = await self._aprocess_tiered(queries[indexes[0]], limiter, snapshot)
+                except Exception as e:
+                    parsed, tier = self._error_response(e), TIER_LLM
+            return indexes, parsed, tier
+
+        tasks = [asyncio.ensure_future(run(indexes)) for indexes in indexes_by_key.values()]
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                completed = []
+                for task in done:
+                    indexes, parsed, tier = task.result()
+                    for index in indexes:
+                        interaction = dict(self._interaction(queries[index], parsed), interaction_id=uuid.uuid4().hex)
+                        completed.append((index, parsed, tier, interaction))
+                await asyncio.to_thread(self.learning_engine.record_interactions,
+                                        [interaction for _, _, _, interaction in completed])
+                for index, parsed, tier, interaction in completed:
+                    yield index, self._result(queries[index], copy.deepcopy(parsed),
+                                              interaction["interaction_id"], tier)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def aprocess_many(self, queries: List[str], concurrency: Optional[int] = None,
+                            rate_limit: Optional[float] = None,
+                            schema_source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Process a batch of queries concurrently; results are in input order"""
+        results: List[Optional[Dict[str, Any]]] = [None] * len(queries)
+        async for index, result in self.aiter_many(queries, concurrency, rate_limit, schema_source):
+            results[index] = result
+        return results
+
+    def process_many(self, queries: List[str], concurrency: Optional[int] = None,
+                     rate_limit: Optional[float] = None, schema_source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Synchronous :meth:`aprocess_many` for scripts; not for use inside a running event loop"""
+        return asyncio.run(self.aprocess_many(queries, concurrency, rate_limit, schema_source))
+
+    def _interaction(self, query: str, parsed: Dict[str, Any]) -> Dict[str, Any]:
+        """Learning engine record for a processed query, cache hits included, so analytics see every query"""
         success = parsed.get("sql") is not None
-        error = parsed.get("error") if not success else None
-        self.learning_engine.record_interaction(
-            natural_query=query,
-            generated_sql=parsed.get("sql"),
-            success=success,
-            error=error
-        )
-        
+        return {
+            "natural_query": query,
+            "generated_sql": parsed.get("sql"),
+            "success": success,
+            "error": parsed.get("error") if not success else None,
+        }
+
+    def _result(self, query: str, parsed: Dict[str, Any], interaction_id: str, tier: str) -> Dict[str, Any]:
         return {
             "original": query,
             "parsed": parsed,
             "generated_sql": parsed.get("sql"),
+            "interaction_id": interaction_id,
+            "cached": tier == TIER_CACHE,
+            "tier": tier,
         }
 
 # Singleton processor
@@ -0,0 +1,25 @@
+"""
+ABIET Rate Limiting
+Async limiter that spaces out calls to a maximum rate
+"""
+
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """Lets at most ``rate`` callers per second through; 0 disables the limit"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        # No await between reading and reserving the slot, so no lock is needed
+        now = time.monotonic()
+        wait = self._next_slot - now
+        self._next_slot = max(now, self._next_slot) + 1.0 / self.rate
+        if wait > 0:
+            await asyncio.sleep(wait)
@@ -0,0 +1,221 @@
+"""
+ABIET Response Cache
+LRU cache with TTL and a byte budget for parsed model responses
+
+Keys are built from the normalized query text plus everything else that
+shapes the model's answer (model, sampling settings, prompt and schema
+versions), so a change to any of them misses instead of returning a stale
+response. Values are returned as deep copies, so callers can modify them.
+
+:class:`PersistentResponseCache` is a second tier in a SQLite file that
+survives restarts and is shared by all workers on a host. Rows are keyed by
+a fingerprint of the full cache key and tagged with a fingerprint of its
+non-query part, so rows written for another model, prompt or schema version
+are deleted when the cache is opened.
+"""
+
+from collections import OrderedDict
+from typing import Dict, Any, Hashable, Iterable, Optional
+import copy
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+# Sentence punctuation and quotes carry no meaning for SQL generation;
+# operators such as < > = are kept
+_PUNCTUATION_RE = re.compile(r"[.,!?;:\"'`]+")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query: str) -> str:
+    """Fold case, whitespace and punctuation of a natural language query"""
+    return _SPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", query.lower())).strip()
+
+
+def fingerprint(value: Any) -> str:
+    """Stable hash of a JSON-serializable cache key (or part of one)"""
+    return hashlib.sha1(json.dumps(value, default=str).encode("utf-8")).hexdigest()
+
+
+def _size(key: Hashable, value: Any) -> int:
+    """Approximate size of an entry in bytes"""
+    return len(repr(key)) + len(json.dumps(value, default=str))
+
+
+class ResponseCache:
+    """Thread-safe LRU cache bounded by entry count, age and total size"""
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, max_bytes: int = 10 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # key -> (expires_at, size, value), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return a copy of the cached value, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl > 0 and entry[0] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[2])
+
+    def put(self, key: Hashable, value: Any):
+        """Cache a copy of ``value``, evicting least recently used entries"""
+        if not self.enabled:
+            return
+        size = _size(key, value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, copy.deepcopy(value))
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for monitoring"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+PERSISTENT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_responses_last_used ON responses (last_used);
+"""
+
+# Enforce max_entries once per this many writes rather than on every write
+_TRIM_EVERY = 100
+
+
+class PersistentResponseCache:
+    """Response cache tier in a SQLite file, shared across restarts and workers"""
+
+    def __init__(self, path: str, ttl: float = 7 * 86400, max_entries: int = 100000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(PERSISTENT_SCHEMA)
+        self._conn = conn
+        self.hits = 0
+        self.misses = 0
+
+    def purge(self, version: str) -> int:
+        """Delete rows written for another version or past their TTL"""
+        with self._lock:
+            params = [version]
+            query = "DELETE FROM responses WHERE version != ?"
+            if self.ttl > 0:
+                query += " OR created <= ?"
+                params.append(time.time() - self.ttl)
+            return self._conn.execute(query, params).rowcount
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Cached responses for the given fingerprints that have not expired"""
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                query = f"SELECT key, response, created FROM responses WHERE key IN ({placeholders})"
+                for key, response, created in self._conn.execute(query, chunk):
+                    if self.ttl <= 0 or created > now - self.ttl:
+                        found[key] = json.loads(response)
+            if found:
+                self._conn.executemany("UPDATE responses SET hits = hits + 1, last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def get(self, key: str) -> Optional[Any]:
+        return self.get_many([key]).get(key)
+
+    def put(self, key: str, version: str, response: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, version, response, created, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, 0)",
+                (key, version, json.dumps(response, default=str), now, now),
+            )
+            self._writes += 1
+            if self.max_entries > 0 and self._writes % _TRIM_EVERY == 0:
+                self._conn.execute(
+                    "DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                    "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,247 @@
+"""
+ABIET Schema Cache
+Introspected database schemas and relevant-table selection for prompts
+
+A database is introspected once through SQLAlchemy when it is first used,
+and again when its snapshot is older than the TTL (in the background, while
+the stale snapshot keeps serving) or when a refresh is requested. Snapshots
+are keyed by connection fingerprint, and each user has their own active
+database: the one they most recently connected to or queried. Snapshots do
+not hold engines; they keep a ``connect`` callable that fetches the engine
+when needed, so engines stay owned (and disposed) by the engine registry.
+
+Sending the whole schema with every prompt would cost tokens and latency,
+so :func:`select_relevant` keeps only the tables whose names or columns
+match words of the query, exactly, as singular/plural variants, or by
+character trigram similarity.
+"""
+
+from typing import Dict, Any, Callable, List, Optional, Set
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from sqlalchemy import inspect
+from sqlalchemy.engine import Engine
+
+from ai.nlp.local_sql import LocalSQLGenerator, word_variants
+from ai.nlp.response_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Trigram similarity from which a query word counts as naming a table
+FUZZY_THRESHOLD = 0.5
+# Tables scoring below this fraction of the best table are left out
+RELATIVE_CUTOFF = 0.5
+TABLE_NAME_SCORE = 3.0
+FUZZY_TABLE_SCORE = 2.0
+COLUMN_NAME_SCORE = 1.0
+
+
+def introspect(engine) -> Dict[str, List[str]]:
+    """Tables and views of the engine's default schema with their column names"""
+    inspector = inspect(engine)
+    names = list(inspector.get_table_names())
+    try:
+        names += inspector.get_view_names()
+    except NotImplementedError:
+        pass
+    return {name: [column["name"] for column in inspector.get_columns(name)] for name in names}
+
+
+def _trigrams(word: str) -> Set[str]:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _name_words(name: str) -> List[str]:
+    """Words of an identifier: "OrderItems" and "order_items" give order, items"""
+    spaced = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", name)
+    return _WORD_RE.findall(spaced.lower())
+
+
+class SchemaSnapshot:
+    """One database's tables and columns, indexed for relevance lookups"""
+
+    def __init__(self, source: str, tables: Dict[str, List[str]], connect: Optional[Callable[[], Engine]] = None,
+                 label: Optional[str] = None):
+        self.source = source
+        # How the database is shown to its users; never contains the password
+        self.label = label or source
+        self.tables = tables
+        # Returns the engine to introspect the database again with
+        self.connect = connect
+        self.loaded_at = time.monotonic()
+        self.fingerprint = hashlib.sha1(json.dumps(tables, sort_keys=True).encode("utf-8")).hexdigest()
+        self._table_words = {table: set(_name_words(table)) for table in tables}
+        self._table_trigrams = {table: _trigrams("".join(_name_words(table))) for table in tables}
+        self._column_words = {table: {column: set(_name_words(column)) for column in columns}
+                              for table, columns in tables.items()}
+        self.local_generator = LocalSQLGenerator(tables)
+
+
+def select_relevant(query: str, snapshot: SchemaSnapshot, max_tables: int = 8,
+                    max_columns: int = 30) -> Dict[str, List[str]]:
+    """The tables of ``snapshot`` that ``query`` most likely refers to, with their columns"""
+    words = set(_WORD_RE.findall(normalize_query(query)))
+    expanded = set(words)
+    for word in words:
+        expanded.update(word_variants(word))
+    query_trigrams = [_trigrams(word) for word in words if len(word) > 3]
+
+    scores = {}
+    matched_columns = {}
+    for table, table_words in snapshot._table_words.items():
+        score = TABLE_NAME_SCORE * len(table_words & expanded) / max(len(table_words), 1)
+        if not score and query_trigrams:
+            table_trigrams = snapshot._table_trigrams[table]
+            best = max(len(table_trigrams & trigrams) / len(table_trigrams | trigrams) for trigrams in query_trigrams)
+            if best >= FUZZY_THRESHOLD:
+                score = FUZZY_TABLE_SCORE * best
+        columns = [column for column, column_words in snapshot._column_words[table].items()
+                   if column_words and column_words <= expanded]
+        score += COLUMN_NAME_SCORE * len(columns)
+        if score > 0:
+            scores[table] = score
+            matched_columns[table] = columns
+
+    relevant = {}
+    cutoff = RELATIVE_CUTOFF * max(scores.values(), default=0)
+    for table in sorted(scores, key=lambda t: (-scores[t], t))[:max_tables]:
+        if scores[table] < cutoff:
+            break
+        # Matched columns survive the column cap; the schema's column order is kept
+        keep = set(matched_columns[table])
+        for column in snapshot.tables[table]:
+            if len(keep) >= max_columns:
+                break
+            keep.add(column)
+        relevant[table] = [column for column in snapshot.tables[table] if column in keep]
+    return relevant
+
+
+class SchemaCache:
+    """Schema snapshots per database, refreshed after ``ttl`` seconds"""
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self._snapshots: Dict[str, SchemaSnapshot] = {}
+        # User -> their active database, and every database they used
+        self._active: Dict[str, str] = {}
+        self._used: Dict[str, Set[str]] = {}
+        self._refreshing: Set[str] = set()
+        # Databases whose introspection failed, so it is not retried on every request
+        self._failed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def load(self, source: str, connect: Callable[[], Engine], owner: Optional[str] = None,
+             label: Optional[str] = None) -> SchemaSnapshot:
+        """Introspect a database and make it ``owner``'s active one"""
+        snapshot = SchemaSnapshot(source, introspect(connect()), connect, label)
+        with self._lock:
+            self._snapshots[source] = snapshot
+            self._failed.pop(source, None)
+            if owner is not None:
+                self._use(owner, source)
+        logger.info(f"Loaded schema of {snapshot.label}: {len(snapshot.tables)} tables")
+        return snapshot
+
+    def _use(self, owner: str, source: str):
+        """Make a database the owner's active one; call with the lock held"""
+        self._active[owner] = source
+        self._used.setdefault(owner, set()).add(source)
+
+    def use(self, owner: str, source: str) -> bool:
+        """Make a loaded database ``owner``'s active one; False when it is not loaded yet"""
+        with self._lock:
+            if source not in self._snapshots:
+                return False
+            self._use(owner, source)
+            return True
+
+    def load_in_background(self, source: str, connect: Callable[[], Engine], owner: Optional[str] = None,
+                           label: Optional[str] = None):
+        """:meth:`load` in a daemon thread, at most once at a time per database.
+
+        After a failure the database is not tried again for ``ttl`` seconds.
+        """
+        with self._lock:
+            failed_at = self._failed.get(source)
+            if source in self._refreshing or (failed_at is not None and time.monotonic() - failed_at < self.ttl):
+                return
+            self._refreshing.add(source)
+
+        def run():
+            try:
+                self.load(source, connect, owner, label)
+            except Exception as e:
+                logger.warning(f"Schema introspection of {label or source} failed: {str(e)}")
+                with self._lock:
+                    self._failed[source] = time.monotonic()
+            finally:
+                with self._lock:
+                    self._refreshing.discard(source)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def source_of(self, owner: Optional[str]) -> Optional[str]:
+        """The owner's active database, if any"""
+        with self._lock:
+            return self._active.get(owner) if owner is not None else None
+
+    def get(self, source: Optional[str]) -> Optional[SchemaSnapshot]:
+        """The snapshot of ``source``.
+
+        A snapshot past its TTL is still returned while a background thread
+        introspects the database again.
+        """
+        if source is None:
+            return None
+        with self._lock:
+            snapshot = self._snapshots.get(source)
+            stale = (snapshot is not None and self.ttl > 0 and snapshot.connect is not None
+                     and time.monotonic() - snapshot.loaded_at > self.ttl and source not in self._refreshing)
+            if stale:
+                self._refreshing.add(source)
+        if stale:
+            threading.Thread(target=self._refresh_in_background, args=(snapshot,), daemon=True).start()
+        return snapshot
+
+    def _refresh_in_background(self, snapshot: SchemaSnapshot):
+        try:
+            fresh = SchemaSnapshot(snapshot.source, introspect(snapshot.connect()), snapshot.connect, snapshot.label)
+            with self._lock:
+                if self._snapshots.get(snapshot.source) is snapshot:
+                    self._snapshots[snapshot.source] = fresh
+        except Exception as e:
+            logger.warning(f"Refreshing the schema of {snapshot.label} failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(snapshot.source)
+
+    def refresh(self, source: Optional[str]) -> Optional[SchemaSnapshot]:
+        """Introspect a known database again now"""
+        with self._lock:
+            snapshot = self._snapshots.get(source) if source is not None else None
+        if snapshot is None or snapshot.connect is None:
+            return snapshot
+        fresh = SchemaSnapshot(snapshot.source, introspect(snapshot.connect()), snapshot.connect, snapshot.label)
+        with self._lock:
+            self._snapshots[snapshot.source] = fresh
+        return fresh
+
+    def stats(self, owner: Optional[str]) -> Dict[str, Any]:
+        """The databases ``owner`` used, by label; other users' databases are not listed"""
+        with self._lock:
+            active = self._snapshots.get(self._active.get(owner, ""))
+            snapshots = [self._snapshots[source] for source in self._used.get(owner, ()) if source in self._snapshots]
+            return {
+                "active_source": active.label if active else None,
+                "sources": {snapshot.label: {"tables": len(snapshot.tables), "fingerprint": snapshot.fingerprint,
+                                             "age": round(time.monotonic() - snapshot.loaded_at, 1)}
+                            for snapshot in snapshots},
+            }
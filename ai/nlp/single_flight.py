@@ -0,0 +1,43 @@
+"""
+ABIET Single Flight
+Coalesces concurrent identical calls into one in-flight call
+
+The first caller for a key starts the call as a task; callers that arrive
+while it is running await the same task instead of starting their own, and
+every caller gets its own copy of the result. The key is forgotten as soon
+as the call finishes, so a failure is shared only with the callers that were
+already waiting and the next call starts afresh.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Hashable
+import asyncio
+import copy
+
+
+class SingleFlight:
+    """Per-key coalescing of concurrent async calls"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Await ``call()``, or the in-flight call for ``key`` if there is one"""
+        task = self._calls.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+        # Shield: a cancelled caller must not cancel the call for the others
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_flight": len(self._calls), "executed": self.executed, "coalesced": self.coalesced}
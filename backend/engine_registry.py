@@ -0,0 +1,144 @@
+"""
+ABIET Engine Registry
+Shared SQLAlchemy engines and connection pools for the /db routes
+
+Creating an engine per request pays a full connection handshake every time
+and leaks the engine's pool. The registry keeps one engine per connection
+fingerprint (db_type, host, port, database, user and a hash of the password,
+or the configured URL), so requests for the same database share a pool.
+Engines unused for ``DB_ENGINE_IDLE_TIMEOUT`` seconds, and the least recently
+used ones beyond ``DB_ENGINE_MAX_ENGINES``, are disposed. Pool options come
+from the ``DB_POOL_*`` settings, overridden per db_type by
+``DB_POOL_OVERRIDES``.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import hashlib
+import logging
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from backend.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def connection_fingerprint(db_type: str, host: str, port: int, database: str, username: str, password: str) -> str:
+    """Registry key of a connection; the password only enters hashed"""
+    password_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    parts = [db_type, host, str(port), database, username, password_hash]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def url_fingerprint(db_type: str, url: str) -> str:
+    """Registry key of a configured database URL"""
+    return hashlib.sha256(f"{db_type}\x1f{url}".encode("utf-8")).hexdigest()
+
+
+def pool_options(db_type: str) -> Dict[str, Any]:
+    """``create_engine`` pool arguments for a db_type"""
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    options.update(settings.DB_POOL_OVERRIDES.get(db_type, {}))
+    return options
+
+
+class _Entry:
+    def __init__(self, db_type: str, engine: Engine):
+        self.db_type = db_type
+        self.engine = engine
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.uses = 0
+
+
+class EngineRegistry:
+    """LRU of engines keyed by connection fingerprint"""
+
+    def __init__(self, max_engines: Optional[int] = None, idle_timeout: Optional[float] = None):
+        self.max_engines = settings.DB_ENGINE_MAX_ENGINES if max_engines is None else max_engines
+        self.idle_timeout = settings.DB_ENGINE_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.disposed = 0
+
+    def get(self, key: str, db_type: str, url: str) -> Engine:
+        """The engine for ``key``, created from ``url`` on first use"""
+        with self._lock:
+            expired = self._take_idle()
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(db_type, create_engine(url, **pool_options(db_type)))
+                self._entries[key] = entry
+                self.created += 1
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(self.max_engines, 1):
+                expired.append(self._entries.popitem(last=False)[1])
+            entry.last_used = time.monotonic()
+            entry.uses += 1
+        self._dispose(expired)
+        return entry.engine
+
+    def _take_idle(self) -> List[_Entry]:
+        """Remove engines idle past the timeout; call with the lock held"""
+        if self.idle_timeout <= 0:
+            return []
+        now = time.monotonic()
+        idle = [key for key, entry in self._entries.items() if now - entry.last_used > self.idle_timeout]
+        return [self._entries.pop(key) for key in idle]
+
+    def _dispose(self, entries: List[_Entry]):
+        for entry in entries:
+            try:
+                entry.engine.dispose()
+            except Exception as e:
+                logger.warning(f"Disposing a {entry.db_type} engine failed: {str(e)}")
+            self.disposed += 1
+
+    def sweep(self) -> int:
+        """Dispose engines idle past the timeout; returns how many"""
+        with self._lock:
+            expired = self._take_idle()
+        self._dispose(expired)
+        return len(expired)
+
+    def dispose_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        self._dispose(entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """Registry counters and the pool state of each engine, without credentials"""
+        now = time.monotonic()
+        with self._lock:
+            entries = list(self._entries.items())
+        engines = []
+        for key, entry in entries:
+            pool = entry.engine.pool
+            engine_stats = {
+                "id": key[:12],
+                "db_type": entry.db_type,
+                "url": entry.engine.url.render_as_string(hide_password=True),
+                "uses": entry.uses,
+                "idle_seconds": round(now - entry.last_used, 1),
+                "pool": pool.status(),
+            }
+            for name in ("size", "checkedin", "checkedout", "overflow"):
+                if hasattr(pool, name):
+                    engine_stats[name] = getattr(pool, name)()
+            engines.append(engine_stats)
+        return {"engines": engines, "created": self.created, "disposed": self.disposed,
+                "max_engines": self.max_engines, "idle_timeout": self.idle_timeout}
+
+
+# Process-wide registry used by backend/routes/db.py
+engine_registry = EngineRegistry()
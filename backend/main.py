@@ -10,6 +10,13 @@ from backend.routes import api_router
 from backend.config.settings import settings, engine
 from backend.models import Base
 from sqlalchemy.orm import Session
+from ai.learning import write_behind
+from ai.learning.learning_engine import get_learning_engine
+from ai.learning.retention import RetentionJob, RetentionManager, RetentionPolicy
+from ai.nlp.query_processor import processor
+from ai.llm_client import llm_clients
+from backend.engine_registry import engine_registry
+from backend.result_cursors import cursor_registry
 
 # Configure logging
 logging.basicConfig(
@@ -41,6 +48,32 @@ app.include_router(api_router, prefix="/api/v1")
 # Create database tables
 Base.metadata.create_all(bind=engine)
 
+@app.on_event("startup")
+async def start_learning_retention():
+    policy = RetentionPolicy(settings.LEARNING_RETENTION_MAX_AGE_DAYS, settings.LEARNING_RETENTION_MAX_RECORDS)
+    app.state.retention_job = None
+    if policy.enabled and settings.LEARNING_RETENTION_INTERVAL > 0:
+        learning_engine = get_learning_engine()
+        manager = RetentionManager(learning_engine, learning_engine.archive, policy)
+        app.state.retention_job = RetentionJob(manager, settings.LEARNING_RETENTION_INTERVAL).start()
+
+@app.on_event("startup")
+async def warm_query_cache():
+    try:
+        processor.warm_cache()
+    except Exception as e:
+        logger.error(f"Warming the response cache failed: {str(e)}")
+
+@app.on_event("shutdown")
+async def flush_learning_writes():
+    if getattr(app.state, "retention_job", None) is not None:
+        app.state.retention_job.stop()
+    # Make sure queued learning records reach storage before the worker exits
+    write_behind.close_all()
+    await llm_clients.aclose()
+    cursor_registry.close_all()
+    engine_registry.dispose_all()
+
 @app.get("/")
 async def root():
     return {
@@ -0,0 +1,229 @@
+"""
+ABIET Result Cache
+Opt-in cache of read-only /db/execute results with table-level invalidation
+
+Only statements classified as read-only (a single SELECT or WITH statement
+without write keywords such as INSERT, INTO, UPDATE or EXEC) that name at
+least one table are cached, and only when the whole result fits in one page.
+A statement such as ``SELECT GETDATE()`` names no table, so no write could
+ever invalidate it. Entries are keyed by the
+connection fingerprint (credentials included, since permissions differ), the
+SQL with comments and whitespace normalized, and the page size. They expire
+after ``DB_RESULT_CACHE_TTL`` seconds, and the least recently used ones are
+evicted beyond ``DB_RESULT_CACHE_MAX_BYTES``.
+
+The cache lives in each worker process. A write committed through the
+endpoint invalidates the results of this process that read the tables it
+names, on the same database for any user. When those tables cannot be
+determined (e.g. ``EXEC some_procedure``), every result of that database is
+invalidated. Writes committed by other workers or outside the endpoint are
+not seen; the TTL bounds how stale such results can get.
+
+Table names are found with a small tokenizer, not a full SQL parser. It
+errs on the side of extra invalidation: qualified names are reduced to the
+table name, and CTE names count as tables. A SELECT that calls a function
+with side effects still looks read-only, so such queries should not ask for
+the cache.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Hashable, List, Optional, Sequence, Set, Tuple
+import re
+import threading
+import time
+from backend.config.settings import settings
+from backend.result_cursors import row_bytes
+
+# String literals, comments and whitespace, scanned in one pass so none hides inside another
+_LEXICAL_RE = re.compile(r"(?P<string>'(?:[^']|'')*')|--[^\n]*|/\*.*?\*/|\s+", re.DOTALL)
+_PART = r'(?:\[[^\]]+\]|"[^"]+"|`[^`]+`|\w+)'
+_TOKEN_RE = re.compile(rf"(?P<name>{_PART}(?:\s*\.\s*{_PART})*)|(?P<punct>[(),;])")
+
+READ_KEYWORDS = {"SELECT", "WITH"}
+WRITE_KEYWORDS = {
+    "INSERT", "UPDATE", "DELETE", "MERGE", "UPSERT", "CREATE", "ALTER", "DROP", "TRUNCATE", "RENAME",
+    "GRANT", "REVOKE", "EXEC", "EXECUTE", "CALL", "INTO", "LOCK", "COPY", "SET",
+}
+# Keywords followed by a table name
+_TABLE_KEYWORDS = {"FROM", "JOIN", "INTO", "UPDATE", "TABLE", "MERGE", "USING", "TRUNCATE"}
+_CLAUSE_KEYWORDS = {
+    "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "OFFSET", "FETCH", "UNION", "EXCEPT", "INTERSECT",
+    "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "OUTER", "ON", "SET", "VALUES", "SELECT", "WITH",
+    "USING", "WHEN", "FOR", "WINDOW", "RETURNING", "OUTPUT", "AS", "PIVOT", "UNPIVOT", "APPLY",
+}
+
+
+@dataclass(frozen=True)
+class SQLStatement:
+    read_only: bool
+    # Tables the statement names; None when they could not be determined
+    tables: Optional[FrozenSet[str]]
+    normalized: str
+
+
+def _unquote(name: str) -> str:
+    """Table name of a possibly qualified and quoted name, lowercased"""
+    last = re.split(r"\s*\.\s*(?=[\[\"`\w])", name)[-1]
+    return last.strip('[]"`').lower()
+
+
+def classify_sql(sql: str) -> SQLStatement:
+    """Whether ``sql`` only reads, which tables it names, and its normalized text"""
+    stripped = _LEXICAL_RE.sub(lambda match: "''" if match.group("string") else " ", sql)
+    tokens: List[Tuple[str, str]] = [
+        ("name", match.group("name")) if match.group("name") else ("punct", match.group("punct"))
+        for match in _TOKEN_RE.finditer(stripped)
+    ]
+    # Quoted identifiers are names, never keywords
+    words = {value.upper() for kind, value in tokens if kind == "name" and value[0] not in '["`'}
+    statement_ends = [index for index, (kind, value) in enumerate(tokens) if value == ";"]
+    single = all(index == len(tokens) - 1 for index in statement_ends)
+    read_only = (bool(tokens) and tokens[0][1].upper() in READ_KEYWORDS and single
+                 and not words & WRITE_KEYWORDS)
+
+    tables: Set[str] = set()
+    for index, (kind, value) in enumerate(tokens):
+        if kind != "name" or value.upper() not in _TABLE_KEYWORDS:
+            continue
+        position = index + 1
+        while position < len(tokens) and tokens[position][0] == "name":
+            name = tokens[position][1]
+            if name.upper() in _CLAUSE_KEYWORDS or name.upper() in _TABLE_KEYWORDS:
+                break
+            tables.add(_unquote(name))
+            position += 1
+            # Optional alias, then a comma for another table of a FROM list
+            if position < len(tokens) and tokens[position][1].upper() == "AS":
+                position += 1
+            if (position < len(tokens) and tokens[position][0] == "name"
+                    and tokens[position][1].upper() not in _CLAUSE_KEYWORDS | _TABLE_KEYWORDS):
+                position += 1
+            if position < len(tokens) and tokens[position][1] == ",":
+                position += 1
+                continue
+            break
+    normalized = _LEXICAL_RE.sub(lambda match: match.group("string") or " ", sql).strip().rstrip(";").strip()
+    return SQLStatement(read_only, frozenset(tables) if tables or read_only else None, normalized)
+
+
+@dataclass
+class CachedResult:
+    keys: List[str]
+    rows: List[Tuple[Any, ...]]
+    created: float
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.created
+
+
+class ResultCache:
+    """Thread-safe LRU of query results bounded by age and total size"""
+
+    def __init__(self, ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        self.ttl = settings.DB_RESULT_CACHE_TTL if ttl is None else ttl
+        self.max_bytes = settings.DB_RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        # key -> (database, tables, size, result), least recently used first
+        self._entries: "OrderedDict[Hashable, Tuple[str, Optional[FrozenSet[str]], int, CachedResult]]" = OrderedDict()
+        # (database, table) -> keys of results that read it
+        self._by_table: Dict[Tuple[str, str], Set[Hashable]] = {}
+        # Bumped on every invalidation, so results read before a write are not stored after it
+        self._generations: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def generation(self, database: str) -> int:
+        with self._lock:
+            return self._generations.get(database, 0)
+
+    def get(self, key: Hashable) -> Optional[CachedResult]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3].age > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[3]
+
+    def put(self, key: Hashable, database: str, tables: FrozenSet[str], keys: List[str],
+            rows: Sequence[Sequence[Any]], generation: int):
+        """Cache a complete result read at ``generation`` of its database"""
+        if not self.enabled or not tables:
+            return
+        size = sum(row_bytes(keys, row) for row in rows) + sum(len(column) for column in keys)
+        if size > self.max_bytes:
+            return
+        result = CachedResult(list(keys), [tuple(row) for row in rows], time.time())
+        with self._lock:
+            if self._generations.get(database, 0) != generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (database, tables, size, result)
+            for table in tables:
+                self._by_table.setdefault((database, table), set()).add(key)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key: Hashable):
+        database, tables, size, _ = self._entries.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._by_table.get((database, table))
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[(database, table)]
+
+    def invalidate(self, database: str, tables: Optional[FrozenSet[str]] = None) -> int:
+        """Drop results of ``database`` that read any of ``tables`` (all of them for None)"""
+        with self._lock:
+            self._generations[database] = self._generations.get(database, 0) + 1
+            if tables is None:
+                keys = {key for key, entry in self._entries.items() if entry[0] == database}
+            else:
+                keys = set()
+                for table in tables:
+                    keys |= self._by_table.get((database, table), set())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+# Per-process cache used by backend/routes/db.py
+result_cache = ResultCache()
@@ -0,0 +1,187 @@
+"""
+ABIET Result Cursors
+Paged /db/execute results behind opaque continuation tokens
+
+A page is read from a server-side cursor. When rows remain, the cursor and
+its connection stay open under a random continuation token, and the next
+request with that token reads on where the previous page stopped. Cursors
+idle for ``DB_CURSOR_IDLE_TTL`` seconds are closed, and at most
+``DB_CURSOR_MAX_OPEN`` are kept (each holds a pooled connection), the least
+recently used one being closed first. A token only works for the user who
+received it.
+
+Every page is capped at ``DB_MAX_ROWS`` rows and about ``DB_MAX_BYTES``
+bytes, whatever page size was asked for. Rows are not lost at a cap, they
+start the next page.
+
+Keyset pagination (rewriting the SQL with a predicate on an ordered unique
+key) is not attempted: the SQL is arbitrary generated text, so the open
+cursor is the only approach that works for every query.
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import logging
+import secrets
+import threading
+import time
+from sqlalchemy.engine import Connection, CursorResult
+from backend.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Rough encoded size of a value that is neither text nor bytes, and per-value separators
+_SCALAR_BYTES = 8
+_VALUE_OVERHEAD = 4
+
+
+class CursorExpiredError(ValueError):
+    """The continuation token is unknown, expired or belongs to another user"""
+
+
+def row_bytes(keys: Sequence[str], row: Sequence[Any]) -> int:
+    """Approximate size of a row in a JSON response"""
+    size = 0
+    for key, value in zip(keys, row):
+        size += len(key) + _VALUE_OVERHEAD
+        size += len(value) if isinstance(value, (str, bytes)) else _SCALAR_BYTES
+    return size
+
+
+class BufferedResult:
+    """The rows of a result read up front, for statements whose transaction
+    must end before their rows are sent (e.g. ``INSERT ... RETURNING``).
+    Offers the part of the result API that pages and streams use."""
+
+    returns_rows = True
+
+    def __init__(self, result: CursorResult):
+        self._keys = list(result.keys())
+        self._rows = result.fetchall()
+        self._position = 0
+
+    def keys(self) -> List[str]:
+        return self._keys
+
+    def fetchmany(self, size: int) -> List[Sequence[Any]]:
+        rows = self._rows[self._position:self._position + size]
+        self._position += len(rows)
+        return rows
+
+
+class _Cursor:
+    def __init__(self, conn: Connection, result: CursorResult, owner: str):
+        self.conn = conn
+        self.result = result
+        self.owner = owner
+        self.keys = list(result.keys()) if result.returns_rows else []
+        # Rows fetched but not sent yet (beyond a cap, or read to look ahead)
+        self.pending: List[Sequence[Any]] = []
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception as e:
+            logger.warning(f"Closing a result cursor failed: {str(e)}")
+
+    def _fetch(self, count: int) -> List[Sequence[Any]]:
+        rows, self.pending = self.pending[:count], self.pending[count:]
+        if len(rows) < count and self.result.returns_rows:
+            rows.extend(self.result.fetchmany(count - len(rows)))
+        return rows
+
+    def read_page(self, page_size: int, max_bytes: int) -> Tuple[List[Sequence[Any]], bool]:
+        """The next page and whether rows remain after it"""
+        page: List[Sequence[Any]] = []
+        size = 0
+        full = False
+        while len(page) < page_size and not full:
+            batch = self._fetch(min(page_size - len(page), settings.DB_STREAM_BATCH_SIZE))
+            if not batch:
+                break
+            for index, row in enumerate(batch):
+                size += row_bytes(self.keys, row)
+                # A page holds at least one row, so oversized rows still get through
+                if page and size > max_bytes:
+                    self.pending = list(batch[index:]) + self.pending
+                    full = True
+                    break
+                page.append(row)
+        if not self.pending:
+            self.pending = self._fetch(1)
+        return page, bool(self.pending)
+
+
+class CursorRegistry:
+    """Open cursors by continuation token"""
+
+    def __init__(self):
+        self._cursors: "OrderedDict[str, _Cursor]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _take_expired(self) -> List[_Cursor]:
+        """Remove cursors idle past the TTL; call with the lock held"""
+        now = time.monotonic()
+        expired = [token for token, cursor in self._cursors.items()
+                   if now - cursor.last_used > settings.DB_CURSOR_IDLE_TTL]
+        return [self._cursors.pop(token) for token in expired]
+
+    def read(self, cursor: _Cursor, page_size: Optional[int]) -> Tuple[List[str], List[Sequence[Any]], Optional[str]]:
+        """Read a page; returns ``(keys, rows, continuation token or None)``.
+
+        The cursor is closed when it is exhausted and kept under a new token
+        otherwise.
+        """
+        page_size = min(page_size or settings.DB_MAX_ROWS, settings.DB_MAX_ROWS)
+        try:
+            rows, more = cursor.read_page(max(page_size, 1), settings.DB_MAX_BYTES)
+        except Exception:
+            cursor.close()
+            raise
+        if not more:
+            cursor.close()
+            return cursor.keys, rows, None
+        token = secrets.token_urlsafe(24)
+        cursor.last_used = time.monotonic()
+        with self._lock:
+            closing = self._take_expired()
+            self._cursors[token] = cursor
+            while len(self._cursors) > max(settings.DB_CURSOR_MAX_OPEN, 1):
+                closing.append(self._cursors.popitem(last=False)[1])
+        for stale in closing:
+            stale.close()
+        return cursor.keys, rows, token
+
+    def open(self, conn: Connection, result: CursorResult, owner: str) -> _Cursor:
+        return _Cursor(conn, result, owner)
+
+    def resume(self, token: str, owner: str) -> _Cursor:
+        """Take the cursor of a continuation token; it is kept again by :meth:`read`"""
+        with self._lock:
+            closing = self._take_expired()
+            cursor = self._cursors.get(token)
+            if cursor is not None and cursor.owner == owner:
+                del self._cursors[token]
+            else:
+                cursor = None
+        for stale in closing:
+            stale.close()
+        if cursor is None:
+            raise CursorExpiredError("The continuation token is invalid or has expired. Please run the query again.")
+        return cursor
+
+    def close_all(self):
+        with self._lock:
+            cursors = list(self._cursors.values())
+            self._cursors.clear()
+        for cursor in cursors:
+            cursor.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"open": len(self._cursors)}
+
+
+# Process-wide registry used by backend/routes/db.py
+cursor_registry = CursorRegistry()
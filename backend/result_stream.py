@@ -0,0 +1,389 @@
+"""
+ABIET Result Streaming
+Encodes query results batch by batch for /db/execute
+
+Rows are fetched from a server-side cursor in batches of
+``DB_STREAM_BATCH_SIZE`` and encoded as they arrive, so memory use depends on
+the batch size, not on the size of the result. The generators are
+synchronous; Starlette runs them in a worker thread, off the event loop.
+/db/execute caps streamed results like pages, at ``DB_MAX_ROWS`` rows and
+about ``DB_MAX_BYTES`` bytes; a result cut at a cap ends with a truncation
+marker (below) instead of success.
+
+Formats:
+
+- ``ndjson``: one JSON object per row and line, and a trailer line
+  ``{"status": "success", "row_count": n}``
+- ``json``: ``{"rows": [...], "status": "success"}``, written incrementally
+- ``columnar``: NDJSON frames without repeated column names: a header
+  ``{"columns": [...]}``, then per batch ``{"dtypes": [...], "data": [...]}``
+  with one value array per column, and a trailer
+  ``{"status": "success", "row_count": n}``
+- ``binary``: the same column batches packed as described below
+
+The columnar formats are built straight from the cursor's row tuples,
+without a dict per row. Column dtypes are inferred per batch: ``null``,
+``bool``, ``int64``, ``float64``, ``string``, ``binary`` (base64 in JSON),
+``decimal``, ``date`` and ``timestamp`` (the last three as strings, ISO 8601
+for dates and times). Values of other types, and integers outside int64, are
+sent as strings.
+
+Binary layout (all integers little-endian)::
+
+    stream  = "ABCR" u8:version(1) u32:column_count name*column_count batch* end
+    name    = u32:length utf-8 bytes
+    batch   = u32:row_count(>0) column*column_count
+    column  = u8:type null_bitmap values
+    end     = u32:0 u8:status(0 success, 1 error, 2 truncated) u32:length utf-8 detail
+
+``null_bitmap`` has ceil(row_count / 8) bytes; bit i (least significant bit
+first) is set when row i is null. ``values`` depend on the type code: 0 null
+(no values), 1 bool (one byte per row), 2 int64 and 3 float64 (eight bytes
+per row), 4 string, 5 binary, 6 decimal, 7 date and 8 timestamp (u32 offsets,
+row_count + 1 of them, followed by the bytes; text is utf-8). Null rows hold
+zeros or empty values. :func:`decode_binary` reads the format back.
+
+A result cannot be taken back once it is partly sent, so a failure while
+streaming ends the output with an error marker instead of an HTTP error: a
+``{"status": "error", "detail": ...}`` line instead of the trailer for NDJSON
+and ``columnar``, ``"status": "error"`` instead of ``"success"`` for JSON, and
+status 1 in the binary end marker. Clients should only trust a result that ends with success.
+A result cut at a cap ends the same way with status ``truncated`` (status 2
+in the binary end marker) and the number of rows sent.
+"""
+
+from array import array
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import base64
+import json
+import logging
+import struct
+import sys
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.engine import Connection, CursorResult
+from backend.result_cursors import row_bytes
+
+logger = logging.getLogger(__name__)
+
+ERROR_DETAIL = "A database error occurred while streaming the result."
+TRUNCATED_DETAIL = "The result exceeds the row or size limit and was truncated."
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+    "columnar": "application/x-ndjson",
+    "binary": "application/vnd.abiet.columnar",
+}
+
+BINARY_MAGIC = b"ABCR"
+BINARY_VERSION = 1
+_BINARY_STATUSES = {0: "success", 1: "error", 2: "truncated"}
+
+DTYPE_CODES = {
+    "null": 0, "bool": 1, "int64": 2, "float64": 3, "string": 4,
+    "binary": 5, "decimal": 6, "date": 7, "timestamp": 8,
+}
+_DTYPES = {code: dtype for dtype, code in DTYPE_CODES.items()}
+_TEXT_DTYPES = {
+    str: "string", Decimal: "decimal", date: "date", datetime: "timestamp",
+    bytes: "binary", bytearray: "binary", memoryview: "binary",
+}
+_INT64_MIN, _INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+Batch = Tuple[List[str], List[Sequence[Any]]]
+
+
+def _dumps(value: Any) -> str:
+    # Only values json cannot handle (dates, decimals, bytes, ...) take the slow encoder
+    return json.dumps(value, default=jsonable_encoder)
+
+
+class _Batches:
+    """Batches of a result up to the caps; ``truncated`` is set once rows were left out"""
+
+    def __init__(self, result: CursorResult, batch_size: int, max_rows: Optional[int], max_bytes: Optional[int]):
+        self.result = result
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.truncated = False
+        self.row_count = 0
+
+    def __iter__(self) -> Iterator[Batch]:
+        if not self.result.returns_rows:
+            return
+        keys = list(self.result.keys())
+        size = 0
+        while self.max_rows is None or self.row_count < self.max_rows:
+            count = self.batch_size if self.max_rows is None else min(self.batch_size, self.max_rows - self.row_count)
+            rows = self.result.fetchmany(count)
+            if not rows:
+                return
+            if self.max_bytes is not None:
+                for index, row in enumerate(rows):
+                    size += row_bytes(keys, row)
+                    # At least one row is sent, so an oversized row still gets through
+                    if size > self.max_bytes and (index or self.row_count):
+                        self.truncated = True
+                        rows = rows[:index]
+                        break
+            if rows:
+                self.row_count += len(rows)
+                yield keys, rows
+            if self.truncated:
+                return
+        # At the row cap: the result was cut only if another row exists
+        self.truncated = bool(self.result.fetchmany(1))
+
+
+def iter_batches(result: CursorResult, batch_size: int, max_rows: Optional[int] = None,
+                 max_bytes: Optional[int] = None) -> _Batches:
+    """``(column names, row tuples)`` of ``result``, at most ``batch_size`` rows at a time.
+
+    Iteration stops after ``max_rows`` rows or about ``max_bytes`` bytes, and
+    the returned iterable's ``truncated`` tells whether rows remained.
+    """
+    return _Batches(result, batch_size, max_rows, max_bytes)
+
+
+def _truncated(batches: Iterable[Batch]) -> bool:
+    return getattr(batches, "truncated", False)
+
+
+def column_dtype(values: Sequence[Any]) -> str:
+    """The dtype of one batch's values of a column"""
+    types = set(map(type, values))
+    types.discard(type(None))
+    if not types:
+        return "null"
+    if types == {bool}:
+        return "bool"
+    if types == {int}:
+        present = [value for value in values if value is not None]
+        return "int64" if _INT64_MIN <= min(present) and max(present) <= _INT64_MAX else "decimal"
+    if types <= {int, float}:
+        return "float64"
+    if len(types) == 1:
+        return _TEXT_DTYPES.get(types.pop(), "string")
+    return "string"
+
+
+def _text(value: Any, dtype: str) -> Any:
+    """A string-typed value as sent: ISO 8601 for dates and times, str() otherwise"""
+    if value is None:
+        return None
+    if dtype in ("date", "timestamp"):
+        return value.isoformat()
+    return str(value)
+
+
+def _json_values(values: Sequence[Any], dtype: str) -> List[Any]:
+    if dtype in ("null", "bool", "int64", "float64"):
+        return list(values)
+    if dtype == "binary":
+        return [None if value is None else base64.b64encode(bytes(value)).decode("ascii") for value in values]
+    return [_text(value, dtype) for value in values]
+
+
+def _columns(keys: List[str], rows: List[Sequence[Any]]) -> List[Tuple[str, Sequence[Any]]]:
+    """Transpose a batch into ``(dtype, values)`` per column"""
+    columns = list(zip(*rows)) if rows else [() for _ in keys]
+    return [(column_dtype(values), values) for values in columns]
+
+
+def _ndjson(batches: Iterable[Batch]) -> Iterator[str]:
+    row_count = 0
+    try:
+        for keys, rows in batches:
+            yield "".join(_dumps(dict(zip(keys, row))) + "\n" for row in rows)
+            row_count += len(rows)
+    except Exception as e:
+        logger.error(f"Streaming query results failed: {str(e)}")
+        yield _dumps({"status": "error", "detail": ERROR_DETAIL}) + "\n"
+        return
+    if _truncated(batches):
+        yield _dumps({"status": "truncated", "row_count": row_count, "detail": TRUNCATED_DETAIL}) + "\n"
+    else:
+        yield _dumps({"status": "success", "row_count": row_count}) + "\n"
+
+
+def _json(batches: Iterable[Batch]) -> Iterator[str]:
+    yield '{"rows": ['
+    separator = ""
+    status = "success"
+    try:
+        for keys, rows in batches:
+            yield separator + ", ".join(_dumps(dict(zip(keys, row))) for row in rows)
+            separator = ", "
+    except Exception as e:
+        logger.error(f"Streaming query results failed: {str(e)}")
+        status = "error"
+    if status == "success" and _truncated(batches):
+        trailer = {"status": "truncated", "detail": TRUNCATED_DETAIL}
+    else:
+        trailer = {"status": status} if status == "success" else {"status": status, "detail": ERROR_DETAIL}
+    yield "], " + _dumps(trailer)[1:]
+
+
+def _columnar(batches: Iterable[Batch], keys: List[str]) -> Iterator[str]:
+    yield _dumps({"columns": keys}) + "\n"
+    row_count = 0
+    try:
+        for _, rows in batches:
+            columns = _columns(keys, rows)
+            yield _dumps({
+                "dtypes": [dtype for dtype, _ in columns],
+                "data": [_json_values(values, dtype) for dtype, values in columns],
+            }) + "\n"
+            row_count += len(rows)
+    except Exception as e:
+        logger.error(f"Streaming query results failed: {str(e)}")
+        yield _dumps({"status": "error", "detail": ERROR_DETAIL}) + "\n"
+        return
+    if _truncated(batches):
+        yield _dumps({"status": "truncated", "row_count": row_count, "detail": TRUNCATED_DETAIL}) + "\n"
+        return
+    yield _dumps({"status": "success", "row_count": row_count}) + "\n"
+
+
+def _packed(typecode: str, values: Sequence[Any]) -> bytes:
+    packed = array(typecode, values)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode("utf-8")
+    return struct.pack("<I", len(encoded)) + encoded
+
+
+def _binary_column(dtype: str, values: Sequence[Any]) -> bytes:
+    bitmap = bytearray((len(values) + 7) // 8)
+    for index, value in enumerate(values):
+        if value is None:
+            bitmap[index >> 3] |= 1 << (index & 7)
+    parts = [bytes([DTYPE_CODES[dtype]]), bytes(bitmap)]
+    if dtype == "bool":
+        parts.append(bytes(1 if value else 0 for value in values))
+    elif dtype == "int64":
+        parts.append(_packed("q", [0 if value is None else value for value in values]))
+    elif dtype == "float64":
+        parts.append(_packed("d", [0.0 if value is None else value for value in values]))
+    elif dtype != "null":
+        if dtype == "binary":
+            data = [b"" if value is None else bytes(value) for value in values]
+        else:
+            data = [b"" if value is None else _text(value, dtype).encode("utf-8") for value in values]
+        offsets = array("I", [0])
+        for item in data:
+            offsets.append(offsets[-1] + len(item))
+        parts.append(_packed("I", offsets))
+        parts.append(b"".join(data))
+    return b"".join(parts)
+
+
+def _binary(batches: Iterable[Batch], keys: List[str]) -> Iterator[bytes]:
+    yield (BINARY_MAGIC + bytes([BINARY_VERSION]) + struct.pack("<I", len(keys))
+           + b"".join(_string(key) for key in keys))
+    status, detail = 0, ""
+    try:
+        for _, rows in batches:
+            yield struct.pack("<I", len(rows)) + b"".join(
+                _binary_column(dtype, values) for dtype, values in _columns(keys, rows))
+    except Exception as e:
+        logger.error(f"Streaming query results failed: {str(e)}")
+        status, detail = 1, ERROR_DETAIL
+    if status == 0 and _truncated(batches):
+        status, detail = 2, TRUNCATED_DETAIL
+    yield struct.pack("<IB", 0, status) + _string(detail)
+
+
+def decode_binary(data: bytes) -> Dict[str, Any]:
+    """Read a ``binary`` result: ``{"columns", "batches": [{"dtypes", "data"}], "status", "detail"}``.
+
+    Values are decoded to Python types: text dtypes stay strings, binary
+    becomes bytes.
+    """
+    view = memoryview(data)
+    if bytes(view[:4]) != BINARY_MAGIC or view[4] != BINARY_VERSION:
+        raise ValueError("Not an ABIET columnar result")
+    position = 5
+
+    def take(size: int) -> memoryview:
+        nonlocal position
+        chunk = view[position:position + size]
+        if len(chunk) != size:
+            raise ValueError("Truncated ABIET columnar result")
+        position += size
+        return chunk
+
+    def u32() -> int:
+        return struct.unpack("<I", take(4))[0]
+
+    def text() -> str:
+        return bytes(take(u32())).decode("utf-8")
+
+    def unpacked(typecode: str, count: int) -> List[Any]:
+        values = array(typecode)
+        values.frombytes(take(values.itemsize * count))
+        if sys.byteorder != "little":
+            values.byteswap()
+        return values.tolist()
+
+    columns = [text() for _ in range(u32())]
+    batches = []
+    while True:
+        row_count = u32()
+        if row_count == 0:
+            break
+        dtypes, data = [], []
+        for _ in columns:
+            dtype = _DTYPES[take(1)[0]]
+            bitmap = take((row_count + 7) // 8)
+            nulls = [bool(bitmap[i >> 3] >> (i & 7) & 1) for i in range(row_count)]
+            if dtype == "null":
+                values = [None] * row_count
+            elif dtype == "bool":
+                values = [bool(value) for value in take(row_count)]
+            elif dtype in ("int64", "float64"):
+                values = unpacked("q" if dtype == "int64" else "d", row_count)
+            else:
+                offsets = unpacked("I", row_count + 1)
+                blob = bytes(take(offsets[-1]))
+                values = [blob[offsets[i]:offsets[i + 1]] for i in range(row_count)]
+                if dtype != "binary":
+                    values = [value.decode("utf-8") for value in values]
+            dtypes.append(dtype)
+            data.append([None if null else value for value, null in zip(values, nulls)])
+        batches.append({"dtypes": dtypes, "data": data})
+    status = take(1)[0]
+    return {"columns": columns, "batches": batches, "status": _BINARY_STATUSES.get(status, "error"),
+            "detail": text() or None}
+
+
+ENCODERS: Dict[str, Callable[[Iterable[Batch], List[str]], Iterator[Union[str, bytes]]]] = {
+    "ndjson": lambda batches, keys: _ndjson(batches),
+    "json": lambda batches, keys: _json(batches),
+    "columnar": _columnar,
+    "binary": _binary,
+}
+
+
+def encode_rows(fmt: str, keys: List[str], rows: List[Sequence[Any]]) -> bytes:
+    """One complete result in ``fmt``, e.g. a page of rows"""
+    batches = iter([(keys, rows)] if rows else [])
+    return b"".join(chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                    for chunk in ENCODERS[fmt](batches, keys))
+
+
+def stream_result(conn: Connection, result: CursorResult, fmt: str, batch_size: int, max_rows: Optional[int] = None,
+                  max_bytes: Optional[int] = None) -> Iterator[Union[str, bytes]]:
+    """Encode ``result`` in ``fmt``, up to the caps, and close ``conn`` when done or abandoned"""
+    try:
+        keys = list(result.keys()) if result.returns_rows else []
+        yield from ENCODERS[fmt](iter_batches(result, batch_size, max_rows, max_bytes), keys)
+    finally:
+        conn.close()
@@ -119,6 +119,15 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(H
         raise credentials_exception
     return user
 
+async def get_optional_user(credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer(auto_error=False)), db: Session = Depends(get_db)):
+    """The authenticated user, or None for requests without valid credentials"""
+    if not credentials:
+        return None
+    try:
+        return await get_current_user(credentials, db)
+    except HTTPException:
+        return None
+
 @router.post("/login", response_model=Token)
 async def login_for_access_token(form_data: LoginRequest, db: Session = Depends(get_db)):
     try:
@@ -8,16 +8,45 @@ The endpoint expects a JSON payload:
 ```json
 { "db_type": "mssql", "query": "SELECT 1 AS test" }
 ```
-It returns the rows as a list of dictionaries or an error message.
+It returns the rows as a list of dictionaries or an error message. With
+``"stream": true`` rows are fetched from a server-side cursor and streamed
+as they arrive. ``"format"`` selects another encoding, streamed or not:
+``ndjson``, ``json``, column-oriented ``columnar`` or packed ``binary`` (see
+``backend/result_stream.py``). Results that are not streamed are paged:
+``page_size`` rows at most (capped by ``DB_MAX_ROWS``/``DB_MAX_BYTES``), plus a
+``continuation_token`` for the next page while rows remain (see
+``backend/result_cursors.py``). With ``"cache": true`` a read-only SELECT
+that names a table and fits in one page is answered from a short-lived
+result cache. Statements that may write are committed (rows they return
+are read first), and then invalidate this worker's cached results of the tables they name (see
+``backend/result_cache.py``); ``cached`` and ``cache_age`` (or the
+``X-Cache`` and ``Age`` headers of a formatted result) tell how fresh the rows
+are, and ``/cache`` reports the cache's state.
+
+A successful ``/connect`` also introspects the database's schema for the
+query processor and makes it the user's active schema; so does the first
+``/execute`` on a database (in the background), configured ones included.
+``/schema`` shows the caller's schemas and ``/schema/refresh`` reloads the
+active one.
+Engines and their connection pools are shared between requests through
+``backend/engine_registry.py``; ``/pools`` reports their state.
 """
 
+import asyncio
+import functools
 import logging
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
-from typing import List, Dict
-from sqlalchemy import create_engine, text
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 from backend.config.settings import settings
+from backend.engine_registry import connection_fingerprint, engine_registry, url_fingerprint
+from backend.result_cache import classify_sql, result_cache
+from backend.result_cursors import BufferedResult, cursor_registry
+from backend.result_stream import MEDIA_TYPES, encode_rows, stream_result
+from ai.nlp.query_processor import processor
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -34,12 +63,21 @@ class DBQuery(BaseModel):
     db_type: str = Field(..., description="Database type: 'mssql', 'postgresql', or 'oracle'")
     query: str = Field(..., description="SQL query to execute")
     connection: DBConnection = Field(None, description="Database connection details (optional, uses static config if not provided)")
+    stream: bool = Field(False, description="Stream rows as they are fetched instead of returning them at once")
+    format: Optional[str] = Field(None, description="Result format: 'ndjson', 'json', 'columnar' or 'binary' (streamed results default to 'ndjson')")
+    page_size: Optional[int] = Field(None, gt=0, description="Rows per page of a result that is not streamed (at most DB_MAX_ROWS)")
+    continuation_token: Optional[str] = Field(None, description="Token from the previous page; returns the next page of that result")
+    cache: bool = Field(False, description="Answer a read-only SELECT from the result cache when possible")
 
 class DBQueryResponse(BaseModel):
     status: str
     rows: List[Dict] | None = None
+    continuation_token: Optional[str] = None  # Set while more rows remain
+    cached: bool = False  # Rows came from the result cache
+    cache_age: Optional[float] = None  # Seconds since cached rows were read from the database
 
-def _get_engine(db_type: str, connection_data: DBConnection = None):
+def _engine_url(db_type: str, connection_data: DBConnection = None) -> Tuple[str, str]:
+    """URL and registry key of a database"""
     if connection_data:
         # Dynamic connection
         if db_type == "mssql":
@@ -50,6 +88,8 @@ def _get_engine(db_type: str, connection_data: DBConnection = None):
             url = f"oracle+cx_oracle://{connection_data.username}:{connection_data.password}@{connection_data.host}:{connection_data.port}/{connection_data.database}"
         else:
             raise ValueError("Unsupported db_type. Use 'mssql', 'postgresql', or 'oracle'.")
+        key = connection_fingerprint(db_type, connection_data.host, connection_data.port, connection_data.database,
+                                     connection_data.username, connection_data.password)
     else:
         # Static connection from settings
         if db_type == "mssql":
@@ -60,22 +100,61 @@ def _get_engine(db_type: str, connection_data: DBConnection = None):
             raise ValueError("Unsupported db_type. Use 'mssql' or 'oracle'.")
         if not url:
             raise ValueError(f"Database URL for {db_type} is not configured.")
-    return create_engine(url)
+        key = url_fingerprint(db_type, url)
+    return url, key
+
+def _get_engine(db_type: str, connection_data: DBConnection = None):
+    """Shared engine for a database; the registry reuses its connection pool across requests"""
+    url, key = _engine_url(db_type, connection_data)
+    return engine_registry.get(key, db_type, url)
+
+def _database_id(db_type: str, connection_data: DBConnection = None) -> str:
+    """Result cache invalidation scope: the database, whichever user writes to it"""
+    if connection_data:
+        return f"{db_type}://{connection_data.host}:{connection_data.port}/{connection_data.database}"
+    return db_type
+
+def _schema_label(db_type: str, connection_data: DBConnection = None) -> str:
+    """How a database's schema is shown to its user; never contains the password"""
+    if connection_data:
+        return f"{db_type}://{connection_data.username}@{connection_data.host}:{connection_data.port}/{connection_data.database}"
+    return db_type
+
+def _schema_connect(db_type: str, connection_data: Optional[DBConnection] = None):
+    """How a schema snapshot gets its engine: from the registry, so it never keeps a disposed one alive"""
+    return functools.partial(_get_engine, db_type, connection_data)
+
+async def _load_schema(db_type: str, connection_data: Optional[DBConnection], owner: str) -> Optional[int]:
+    """Introspect a connected database for the owner's queries; returns the table count.
+
+    Failures are logged and do not fail the request: queries then go without schema.
+    """
+    label = _schema_label(db_type, connection_data)
+    try:
+        source = _engine_url(db_type, connection_data)[1]
+        snapshot = await asyncio.to_thread(processor.load_schema, source, _schema_connect(db_type, connection_data),
+                                           owner, label)
+        return len(snapshot.tables)
+    except Exception as e:
+        logger.warning(f"Schema introspection of {label} failed: {str(e)}")
+        return None
+
+def _use_schema(db_type: str, connection_data: Optional[DBConnection], owner: str):
+    """Make a queried database the owner's active schema, introspecting it in the background the first time"""
+    source = _engine_url(db_type, connection_data)[1]
+    if not processor.schema_cache.use(owner, source):
+        processor.schema_cache.load_in_background(source, _schema_connect(db_type, connection_data), owner,
+                                                  _schema_label(db_type, connection_data))
 
 @router.post("/execute", response_model=DBQueryResponse)
 async def execute_query(payload: DBQuery, current_user: User = Depends(get_current_user)):
     try:
         logger.info(f"Executing query for user {current_user.username} on {payload.db_type}")
         
-        engine = _get_engine(payload.db_type, payload.connection)
-        
-        with engine.connect() as conn:
-            result = conn.execute(text(payload.query))
-            # Convert ResultProxy to list of dicts
-            rows = [dict(row) for row in result]
-            
-        logger.info(f"Query executed successfully for user {current_user.username}")
-        return DBQueryResponse(status="success", rows=rows)
+        if payload.format is not None and payload.format not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported format. Use one of: {', '.join(MEDIA_TYPES)}.")
+        # Connecting, executing, fetching and encoding block, so they run in a worker thread
+        return await asyncio.to_thread(_execute, payload, current_user.username)
     
     except ValueError as e:
         logger.warning(f"Invalid request from user {current_user.username}: {str(e)}")
@@ -87,6 +166,87 @@ async def execute_query(payload: DBQuery, current_user: User = Depends(get_curre
         logger.error(f"Unexpected error for user {current_user.username}: {str(e)}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred. Please try again later.")
 
+def _execute(payload: DBQuery, username: str):
+    """Run or resume a query and build its response. Blocking."""
+    cache_key = None
+    if payload.continuation_token:
+        cursor = cursor_registry.resume(payload.continuation_token, username)
+    else:
+        engine = _get_engine(payload.db_type, payload.connection)
+        _use_schema(payload.db_type, payload.connection, username)
+        statement = classify_sql(payload.query)
+        database = _database_id(payload.db_type, payload.connection)
+        # Results that name no table could never be invalidated, so they are not cached
+        if (payload.cache and statement.read_only and statement.tables and not payload.stream
+                and result_cache.enabled):
+            page_size = min(payload.page_size or settings.DB_MAX_ROWS, settings.DB_MAX_ROWS)
+            cache_key = (_engine_url(payload.db_type, payload.connection)[1], statement.normalized, page_size)
+            cached = result_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Query answered from the result cache for user {username}")
+                return _page_response(payload.format, cached.keys, cached.rows, None, "hit", cached.age)
+            generation = result_cache.generation(database)
+        conn, result = _execute_on_cursor(engine, payload.query)
+        if not statement.read_only:
+            result = _commit(conn, result)
+            result_cache.invalidate(database, statement.tables)
+        if payload.stream:
+            logger.info(f"Streaming query results for user {username}")
+            fmt = payload.format or "ndjson"
+            # Starlette iterates a synchronous body in its thread pool
+            return StreamingResponse(stream_result(conn, result, fmt, settings.DB_STREAM_BATCH_SIZE,
+                                                   settings.DB_MAX_ROWS, settings.DB_MAX_BYTES),
+                                     media_type=MEDIA_TYPES[fmt])
+        cursor = cursor_registry.open(conn, result, username)
+    keys, rows, token = cursor_registry.read(cursor, payload.page_size)
+    if cache_key is not None and token is None:
+        result_cache.put(cache_key, database, statement.tables, keys, rows, generation)
+
+    logger.info(f"Query executed successfully for user {username}")
+    return _page_response(payload.format, keys, rows, token, None if cache_key is None else "miss")
+
+def _page_response(fmt: Optional[str], keys, rows, token: Optional[str], cache_status: Optional[str] = None,
+                   cache_age: float = 0.0):
+    """A page of rows in the requested format; ``cache_status`` is "hit", "miss" or None when not asked"""
+    hit = cache_status == "hit"
+    if fmt:
+        headers = {"X-Continuation-Token": token} if token else {}
+        if cache_status:
+            headers.update({"X-Cache": cache_status, "Age": str(int(cache_age))})
+        return Response(content=encode_rows(fmt, keys, rows), media_type=MEDIA_TYPES[fmt], headers=headers or None)
+    return DBQueryResponse(status="success", rows=[dict(zip(keys, row)) for row in rows], continuation_token=token,
+                           cached=hit, cache_age=round(cache_age, 3) if hit else None)
+
+def _commit(conn, result):
+    """Commit a statement that may write; a closed connection would roll it back.
+
+    Rows it returns (``RETURNING``, ``OUTPUT``) are read first, so they are
+    served from memory after the commit.
+    """
+    try:
+        if result.returns_rows:
+            result = BufferedResult(result)
+        conn.commit()
+    except Exception:
+        conn.close()
+        raise
+    return result
+
+def _ping(engine):
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def _execute_on_cursor(engine, query: str):
+    """Execute on a server-side cursor; the caller owns the returned connection"""
+    conn = engine.connect()
+    try:
+        # Errors up to here still become HTTP errors, even for streamed results
+        result = conn.execution_options(yield_per=settings.DB_STREAM_BATCH_SIZE).execute(text(query))
+    except Exception:
+        conn.close()
+        raise
+    return conn, result
+
 @router.post("/connect")
 async def connect_db(payload: DBConnection, current_user: User = Depends(get_current_user)):
     try:
@@ -95,11 +255,11 @@ async def connect_db(payload: DBConnection, current_user: User = Depends(get_cur
         engine = _get_engine(payload.db_type, payload)
         
         # Test connection
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        await asyncio.to_thread(_ping, engine)
             
         logger.info(f"Connection test successful for user {current_user.username}")
-        return {"status": "success", "message": "Connection established successfully"}
+        schema_tables = await _load_schema(payload.db_type, payload, current_user.username)
+        return {"status": "success", "message": "Connection established successfully", "schema_tables": schema_tables}
     
     except ValueError as e:
         logger.warning(f"Invalid connection request from user {current_user.username}: {str(e)}")
@@ -119,8 +279,7 @@ async def test_db_connection(payload: DBConnection, current_user: User = Depends
         engine = _get_engine(payload.db_type, payload)
         
         # Test connection
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
+        await asyncio.to_thread(_ping, engine)
             
         logger.info(f"Connection test successful for user {current_user.username}")
         return {"status": "success", "message": "Connection test successful"}
@@ -134,3 +293,45 @@ async def test_db_connection(payload: DBConnection, current_user: User = Depends
     except Exception as e:
         logger.error(f"Unexpected connection test error for user {current_user.username}: {str(e)}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred. Please try again later.")
+
+@router.get("/pools")
+async def get_pools(current_user: User = Depends(get_current_user)):
+    try:
+        return {"status": "success", "pools": engine_registry.stats()}
+    except Exception as e:
+        logger.error(f"Error getting connection pool stats for user {current_user.username}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get connection pool statistics. Please try again.")
+
+@router.get("/cache")
+async def get_result_cache(current_user: User = Depends(get_current_user)):
+    try:
+        return {"status": "success", "cache": result_cache.stats()}
+    except Exception as e:
+        logger.error(f"Error getting result cache stats for user {current_user.username}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get result cache statistics. Please try again.")
+
+@router.get("/schema")
+async def get_schema(current_user: User = Depends(get_current_user)):
+    try:
+        return {"status": "success", "schema": processor.schema_cache.stats(current_user.username)}
+    except Exception as e:
+        logger.error(f"Error getting schema cache stats for user {current_user.username}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to get schema information. Please try again.")
+
+@router.post("/schema/refresh")
+async def refresh_schema(current_user: User = Depends(get_current_user)):
+    try:
+        logger.info(f"Refreshing the active schema for user {current_user.username}")
+        source = processor.schema_cache.source_of(current_user.username)
+        snapshot = await asyncio.to_thread(processor.refresh_schema, source)
+        if snapshot is None:
+            raise HTTPException(status_code=404, detail="No database has been connected yet.")
+        return {"status": "success", "source": snapshot.label, "tables": len(snapshot.tables)}
+    except HTTPException:
+        raise
+    except SQLAlchemyError as e:
+        logger.error(f"Schema refresh error for user {current_user.username}: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to read the database schema. Please try again.")
+    except Exception as e:
+        logger.error(f"Unexpected schema refresh error for user {current_user.username}: {str(e)}")
+        raise HTTPException(status_code=500, detail="An unexpected error occurred. Please try again later.")
@@ -2,20 +2,36 @@
 Learning System Routes
 """
 
+import asyncio
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Any
-from ai.learning.learning_engine import LearningEngine
+from typing import List, Dict, Any, Optional
+from ai.learning.learning_engine import get_learning_engine
 from ai.feedback_processor import FeedbackProcessor
+from backend.models import User
+from backend.routes.auth import get_current_user
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 class FeedbackRequest(BaseModel):
-    interaction_index: int
+    interaction_id: Optional[str] = None
+    interaction_index: Optional[int] = None  # Deprecated: positions shift as interactions are added
     feedback: str
 
+class BulkFeedbackItem(BaseModel):
+    interaction_id: str
+    feedback: str
+
+class BulkFeedbackRequest(BaseModel):
+    items: List[BulkFeedbackItem]
+
+class BulkFeedbackResponse(BaseModel):
+    status: str
+    updated: List[str]
+    missing: List[str]
+
 class FeedbackResponse(BaseModel):
     status: str
     message: str
@@ -23,13 +39,19 @@ class FeedbackResponse(BaseModel):
 class HistoryResponse(BaseModel):
     status: str
     history: List
+    total: int
+    next_cursor: Optional[int] = None
+
+class SuggestResponse(BaseModel):
+    status: str
+    suggestions: List[str]
 
 class AnalysisResponse(BaseModel):
     status: str
     analysis: Dict[str, Any]
     suggestions: List[str]
 
-learning_engine = LearningEngine()
+learning_engine = get_learning_engine()
 feedback_processor = FeedbackProcessor(learning_engine)
 
 @router.get("/")
@@ -43,6 +65,19 @@ async def learning_root():
 
 @router.post("/feedback", response_model=FeedbackResponse)
 async def submit_feedback(request: FeedbackRequest):
+    if request.interaction_id is None and request.interaction_index is None:
+        raise HTTPException(status_code=422, detail="Either interaction_id or interaction_index is required.")
+    if request.interaction_id is not None:
+        try:
+            logger.info(f"Submitting feedback for interaction {request.interaction_id}")
+            found = learning_engine.add_feedback(request.interaction_id, request.feedback)
+        except Exception as exc:
+            logger.error(f"Error submitting feedback: {str(exc)}")
+            raise HTTPException(status_code=500, detail="Failed to record feedback. Please try again.")
+        if not found:
+            raise HTTPException(status_code=404, detail="Interaction not found.")
+        logger.info("Feedback submitted successfully")
+        return FeedbackResponse(status="success", message="Feedback recorded")
     try:
         logger.info(f"Submitting feedback for interaction {request.interaction_index}")
         learning_engine.add_feedback_to_interaction(request.interaction_index, request.feedback)
@@ -52,22 +87,68 @@ async def submit_feedback(request: FeedbackRequest):
         logger.error(f"Error submitting feedback: {str(exc)}")
         raise HTTPException(status_code=500, detail="Failed to record feedback. Please try again.")
 
+@router.post("/feedback/bulk", response_model=BulkFeedbackResponse)
+async def submit_feedback_bulk(request: BulkFeedbackRequest):
+    try:
+        logger.info(f"Submitting feedback for {len(request.items)} interactions")
+        result = learning_engine.add_feedback_bulk({item.interaction_id: item.feedback for item in request.items})
+        logger.info(f"Feedback recorded for {len(result['updated'])} interactions")
+        return BulkFeedbackResponse(status="success", **result)
+    except Exception as exc:
+        logger.error(f"Error submitting bulk feedback: {str(exc)}")
+        raise HTTPException(status_code=500, detail="Failed to record feedback. Please try again.")
+
 @router.get("/history", response_model=HistoryResponse)
-async def get_history(limit: int = 10):
+async def get_history(limit: int = 10, before: Optional[int] = None, success: Optional[bool] = None,
+                      has_feedback: Optional[bool] = None):
     try:
         logger.info(f"Fetching interaction history with limit {limit}")
-        interactions = learning_engine.get_interactions(limit)
+        filters = {"success": success, "has_feedback": has_feedback}
+        page = learning_engine.get_interaction_page(limit, before, **filters)
+        total = learning_engine.count_interactions(**filters)
         logger.info("History fetched successfully")
-        return HistoryResponse(status="success", history=interactions)
+        return HistoryResponse(status="success", history=page["interactions"], total=total,
+                               next_cursor=page["next_cursor"])
     except Exception as exc:
         logger.error(f"Error fetching history: {str(exc)}")
         raise HTTPException(status_code=500, detail="Failed to retrieve interaction history. Please try again.")
 
+@router.get("/suggest", response_model=SuggestResponse)
+async def suggest_queries(q: str = "", limit: int = 5):
+    # Called on every keystroke, so successful lookups are not logged
+    try:
+        return SuggestResponse(status="success", suggestions=learning_engine.get_query_suggestions(q, limit))
+    except Exception as exc:
+        logger.error(f"Error fetching query suggestions: {str(exc)}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve query suggestions. Please try again.")
+
+@router.get("/metrics")
+async def get_learning_metrics():
+    try:
+        logger.info("Fetching learning storage metrics")
+        return {"status": "success", "metrics": learning_engine.get_write_metrics()}
+    except Exception as exc:
+        logger.error(f"Error fetching learning metrics: {str(exc)}")
+        raise HTTPException(status_code=500, detail="Failed to retrieve learning metrics. Please try again.")
+
+@router.post("/retention")
+async def run_retention(current_user: User = Depends(get_current_user)):
+    try:
+        logger.info(f"Running learning data retention for {current_user.username}")
+        # Archiving and compaction are file I/O; keep them off the event loop
+        archived = await asyncio.to_thread(learning_engine.apply_retention)
+        logger.info(f"Retention archived {sum(archived.values())} records")
+        return {"status": "success", "archived": archived}
+    except Exception as exc:
+        logger.error(f"Error running retention: {str(exc)}")
+        raise HTTPException(status_code=500, detail="Failed to apply learning data retention. Please try again.")
+
 @router.get("/analysis", response_model=AnalysisResponse)
-async def get_feedback_analysis():
+async def get_feedback_analysis(since: Optional[str] = None, until: Optional[str] = None,
+                                include_archive: bool = False):
     try:
         logger.info("Generating feedback analysis")
-        analysis = feedback_processor.analyze_feedback_patterns()
+        analysis = feedback_processor.analyze_feedback_patterns(since, until, include_archive)
         suggestions = feedback_processor.generate_improvement_suggestions(analysis)
         logger.info("Analysis generated successfully")
         return AnalysisResponse(status="success", analysis=analysis, suggestions=suggestions)
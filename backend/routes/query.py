@@ -1,19 +1,32 @@
 """backend.routes.query
 --------------------------------
 FastAPI route for natural language query processing.
-Now returns parsed tokens and generated SQL.
+Now returns parsed tokens and generated SQL. Requests with a bearer token
+are answered against the schema of the database that user most recently
+connected to or queried; anonymous requests get no schema.
 """
 
+import json
 import logging
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict
+from typing import Dict, Any, List, Optional
 
+from backend.config.settings import settings
+from backend.models import User
+from backend.routes.auth import get_optional_user
+
+from ai.llm_governor import llm_governor
 from ai.nlp.query_processor import processor
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+def _schema_source(user: Optional[User]) -> Optional[str]:
+    """Key of the schema the user's queries are answered against"""
+    return processor.schema_cache.source_of(user.username) if user is not None else None
+
 class QueryRequest(BaseModel):
     query: str
 
@@ -26,12 +39,86 @@ class QueryResponse(BaseModel):
 
 
 @router.post("/process", response_model=QueryResponse)
-async def query_endpoint(request: QueryRequest):
+async def query_endpoint(request: QueryRequest, current_user: Optional[User] = Depends(get_optional_user)):
     try:
         logger.info(f"Processing query: {request.query[:50]}...")
-        result = processor.process(request.query)
+        result = await processor.aprocess(request.query, _schema_source(current_user))
         logger.info("Query processed successfully")
         return QueryResponse(status="success", data=result)
     except Exception as exc:  # pragma: no cover – defensive programming
         logger.error(f"Error processing query: {str(exc)}")
         raise HTTPException(status_code=500, detail="Failed to process the query. Please check your input and try again.")
+
+
+@router.post("/stream")
+async def stream_query_endpoint(request: QueryRequest, current_user: Optional[User] = Depends(get_optional_user)):
+    """Server-sent events: ``delta`` chunks, the ``sql`` as soon as it is known, then the ``result``"""
+    logger.info(f"Streaming query: {request.query[:50]}...")
+    schema_source = _schema_source(current_user)
+
+    async def events():
+        try:
+            async for event, data in processor.astream(request.query, schema_source):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as exc:
+            logger.error(f"Error streaming query: {str(exc)}")
+            detail = "Failed to process the query. Please check your input and try again."
+            yield f"event: error\ndata: {json.dumps({'detail': detail})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+class BatchQueryRequest(BaseModel):
+    queries: List[str]
+    stream: bool = False  # Stream NDJSON lines as items complete instead of one response
+
+
+class BatchQueryResponse(BaseModel):
+    status: str
+    results: List[Dict]
+
+
+@router.post("/batch", response_model=BatchQueryResponse)
+async def batch_query_endpoint(request: BatchQueryRequest, current_user: Optional[User] = Depends(get_optional_user)):
+    if len(request.queries) > settings.QUERY_BATCH_MAX_SIZE:
+        raise HTTPException(status_code=422, detail=f"A batch can contain at most {settings.QUERY_BATCH_MAX_SIZE} queries.")
+    logger.info(f"Processing batch of {len(request.queries)} queries")
+    schema_source = _schema_source(current_user)
+    if request.stream:
+        async def lines():
+            # Lines already sent cannot be taken back, so a failure ends the stream with an error line
+            try:
+                async for index, result in processor.aiter_many(request.queries, schema_source=schema_source):
+                    yield json.dumps({"index": index, **result}) + "\n"
+            except Exception as exc:
+                logger.error(f"Error streaming batch: {str(exc)}")
+                yield json.dumps({"status": "error", "detail": "Failed to process the batch. Please try again."}) + "\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+    try:
+        results = await processor.aprocess_many(request.queries, schema_source=schema_source)
+        logger.info("Batch processed successfully")
+        return BatchQueryResponse(status="success", results=results)
+    except Exception as exc:
+        logger.error(f"Error processing batch: {str(exc)}")
+        raise HTTPException(status_code=500, detail="Failed to process the batch. Please check your input and try again.")
+
+
+class CacheStatsResponse(BaseModel):
+    status: str
+    cache: Dict[str, Any]
+
+
+@router.get("/cache", response_model=CacheStatsResponse)
+async def cache_stats_endpoint():
+    try:
+        stats = processor.response_cache.stats()
+        stats["single_flight"] = processor.single_flight.stats()
+        stats["tiers"] = dict(processor.tier_counts)
+        stats["llm"] = llm_governor.stats()
+        if processor.persistent_cache is not None:
+            stats["persistent"] = processor.persistent_cache.stats()
+        return CacheStatsResponse(status="success", cache=stats)
+    except Exception as exc:
+        logger.error(f"Error getting cache stats: {str(exc)}")
+        raise HTTPException(status_code=500, detail="Failed to get cache statistics. Please try again.")
@@ -2,6 +2,10 @@ const BACKEND_URL = 'http://localhost:8000';
 
 // Initialize token from localStorage
 let token = localStorage.getItem('token');
+let lastInteractionId = null;
+// Rows requested per page of query results; further pages load as the table is scrolled
+const RESULTS_PAGE_SIZE = 100;
+let resultsPage = null;
 
 function showLoggedIn() {
     document.getElementById('login').classList.add('hidden');
@@ -247,10 +251,11 @@ document.getElementById('queryForm').addEventListener('submit', async (e) => {
     }
     document.getElementById('sqlBox').textContent = 'Processing...';
     document.getElementById('resultsTable').classList.add('hidden');
+    stopPaging();
     document.getElementById('noResults').classList.add('hidden');
     document.getElementById('feedbackSection').classList.add('hidden');
     try {
-        const response = await fetch(BACKEND_URL + '/api/v1/query/', {
+        const response = await fetch(BACKEND_URL + '/api/v1/query/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -258,29 +263,75 @@ document.getElementById('queryForm').addEventListener('submit', async (e) => {
             },
             body: JSON.stringify({ query })
         });
-        const data = await response.json();
-        if (response.ok) {
-            const parsed = data.data.parsed;
-            document.getElementById('sqlBox').textContent = parsed.sql || 'No SQL generated';
-            if (parsed.sql) {
-                await executeSQL(parsed.sql);
-            } else {
-                document.getElementById('noResults').textContent = parsed.error || 'Unable to generate SQL';
-                document.getElementById('noResults').classList.remove('hidden');
+        if (!response.ok) {
+            const data = await response.json();
+            document.getElementById('sqlBox').textContent = `Error: ${data.detail || JSON.stringify(data)}`;
+            return;
+        }
+        let result = null;
+        await readServerSentEvents(response, (event, data) => {
+            if (event === 'sql') {
+                // Shown as soon as the model has written it, before the rest of the response
+                document.getElementById('sqlBox').textContent = data.sql || 'Generating...';
+            } else if (event === 'result') {
+                result = data;
+            } else if (event === 'error') {
+                document.getElementById('sqlBox').textContent = `Error: ${data.detail}`;
             }
-            document.getElementById('feedbackSection').classList.remove('hidden');
-            loadHistory(); // Refresh history
+        });
+        if (!result) {
+            return;
+        }
+        const parsed = result.parsed;
+        lastInteractionId = result.interaction_id;
+        document.getElementById('sqlBox').textContent = parsed.sql || 'No SQL generated';
+        if (parsed.sql) {
+            await executeSQL(parsed.sql);
         } else {
-            document.getElementById('sqlBox').textContent = `Error: ${data.detail || JSON.stringify(data)}`;
+            document.getElementById('noResults').textContent = parsed.error || 'Unable to generate SQL';
+            document.getElementById('noResults').classList.remove('hidden');
         }
+        document.getElementById('feedbackSection').classList.remove('hidden');
+        loadHistory(); // Refresh history
     } catch (err) {
         document.getElementById('sqlBox').textContent = 'Network error: ' + err.message;
     }
 });
 
-async function executeSQL(sql) {
+// Parse a text/event-stream response body, calling onEvent(event, data) per event
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+            break;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            const dataLines = [];
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event: ')) {
+                    event = line.slice(7);
+                } else if (line.startsWith('data: ')) {
+                    dataLines.push(line.slice(6));
+                }
+            }
+            if (dataLines.length) {
+                onEvent(event, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+}
+
+async function executeSQL(sql, continuationToken = null) {
     // Get connection details from form
-    const connectionData = {
+    const connectionData = continuationToken ? resultsPage.connection : {
         db_type: document.getElementById('dbType').value,
         host: document.getElementById('dbHost').value,
         port: parseInt(document.getElementById('dbPort').value),
@@ -299,30 +350,49 @@ async function executeSQL(sql) {
             body: JSON.stringify({ 
                 db_type: connectionData.db_type, 
                 query: sql,
-                connection: connectionData
+                connection: connectionData,
+                page_size: RESULTS_PAGE_SIZE,
+                continuation_token: continuationToken
             })
         });
         const data = await response.json();
         if (response.ok) {
-            displayResults(data.rows);
+            displayResults(data.rows, continuationToken !== null);
+            resultsPage = data.continuation_token
+                ? { sql, connection: connectionData, token: data.continuation_token, loading: false }
+                : null;
+            document.getElementById('loadMoreBtn').classList.toggle('hidden', !resultsPage);
         } else {
+            stopPaging();
             document.getElementById('noResults').textContent = `Execution error: ${data.detail || JSON.stringify(data)}`;
             document.getElementById('noResults').classList.remove('hidden');
         }
     } catch (err) {
+        stopPaging();
         document.getElementById('noResults').textContent = 'Network error: ' + err.message;
         document.getElementById('noResults').classList.remove('hidden');
     }
 }
 
-function displayResults(rows) {
+function stopPaging() {
+    resultsPage = null;
+    document.getElementById('loadMoreBtn').classList.add('hidden');
+}
+
+function displayResults(rows, append = false) {
+    const table = document.getElementById('resultsTable');
+    const head = document.getElementById('tableHead');
+    const body = document.getElementById('tableBody');
+    if (append) {
+        // Next page: same columns as the header already shown
+        const headers = Array.from(head.querySelectorAll('th'), th => th.textContent);
+        appendRows(body, headers, rows || []);
+        return;
+    }
     if (!rows || rows.length === 0) {
         document.getElementById('noResults').classList.remove('hidden');
         return;
     }
-    const table = document.getElementById('resultsTable');
-    const head = document.getElementById('tableHead');
-    const body = document.getElementById('tableBody');
     head.innerHTML = '';
     body.innerHTML = '';
     const headers = Object.keys(rows[0]);
@@ -333,6 +403,12 @@ function displayResults(rows) {
         headerRow.appendChild(th);
     });
     head.appendChild(headerRow);
+    appendRows(body, headers, rows);
+    table.classList.remove('hidden');
+}
+
+function appendRows(body, headers, rows) {
+    const fragment = document.createDocumentFragment();
     rows.forEach(row => {
         const tr = document.createElement('tr');
         headers.forEach(h => {
@@ -340,9 +416,28 @@ function displayResults(rows) {
             td.textContent = row[h];
             tr.appendChild(td);
         });
-        body.appendChild(tr);
+        fragment.appendChild(tr);
     });
-    table.classList.remove('hidden');
+    body.appendChild(fragment);
+}
+
+async function loadMoreResults() {
+    if (!resultsPage || resultsPage.loading) {
+        return;
+    }
+    resultsPage.loading = true;
+    await executeSQL(resultsPage.sql, resultsPage.token);
+}
+
+document.getElementById('loadMoreBtn').addEventListener('click', loadMoreResults);
+
+// Load the next page as soon as the button scrolls into view
+if ('IntersectionObserver' in window) {
+    new IntersectionObserver(entries => {
+        if (entries.some(entry => entry.isIntersecting)) {
+            loadMoreResults();
+        }
+    }).observe(document.getElementById('loadMoreBtn'));
 }
 
 document.getElementById('goodBtn').addEventListener('click', () => {
@@ -362,30 +457,24 @@ document.getElementById('submitCorrection').addEventListener('click', () => {
 });
 
 async function submitFeedback(feedback) {
-    // Get the latest interaction index
-    const historyResponse = await fetch(BACKEND_URL + '/api/v1/learning/history?limit=1', {
-        headers: { 'Authorization': `Bearer ${token}` }
+    if (!lastInteractionId) {
+        alert('Run a query before submitting feedback');
+        return;
+    }
+    const response = await fetch(BACKEND_URL + '/api/v1/learning/feedback', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Authorization': `Bearer ${token}`
+        },
+        body: JSON.stringify({ interaction_id: lastInteractionId, feedback })
     });
-    if (historyResponse.ok) {
-        const historyData = await historyResponse.json();
-        if (historyData.history.length > 0) {
-            const latestIndex = historyData.history.length - 1;
-            const response = await fetch(BACKEND_URL + '/api/v1/learning/feedback', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'Authorization': `Bearer ${token}`
-                },
-                body: JSON.stringify({ interaction_index: latestIndex, feedback })
-            });
-            if (response.ok) {
-                alert('Feedback submitted');
-                document.getElementById('correctionInput').classList.add('hidden');
-                document.getElementById('submitCorrection').classList.add('hidden');
-            } else {
-                alert('Failed to submit feedback');
-            }
-        }
+    if (response.ok) {
+        alert('Feedback submitted');
+        document.getElementById('correctionInput').classList.add('hidden');
+        document.getElementById('submitCorrection').classList.add('hidden');
+    } else {
+        alert('Failed to submit feedback');
     }
 }
 
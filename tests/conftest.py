@@ -4,4 +4,15 @@ import pathlib
 
 # Add project root to PYTHONPATH
 project_root = pathlib.Path(__file__).parent.parent
-sys.path.insert(0, str(project_root))
\ No newline at end of file
+sys.path.insert(0, str(project_root))
+
+@pytest.fixture(autouse=True)
+def reset_llm_clients():
+    """Drop shared OpenAI clients so each test's mocked client class is used,
+    and reset the governor so no test inherits an open circuit or a shrunk limit"""
+    from ai.llm_client import llm_clients
+    from ai.llm_governor import llm_governor
+    llm_clients.close()
+    llm_governor.reset()
+    yield
+    llm_clients.close()
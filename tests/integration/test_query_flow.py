@@ -1,7 +1,7 @@
 import sys
 import pathlib
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
 
 from backend.main import app
@@ -11,7 +11,7 @@ def client():
     with TestClient(app) as c:
         yield c
 
-@patch('ai.nlp.query_processor.openai.OpenAI')
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
 def test_end_to_end_query_flow(mock_openai_class, client):
     """Integration test for the complete query processing flow."""
     # Mock the OpenAI client and response
@@ -25,7 +25,7 @@ def test_end_to_end_query_flow(mock_openai_class, client):
         "sql": "SELECT * FROM customers WHERE active = 1",
         "entities": {"table": "customers", "condition": "active"}
     }'''
-    mock_client.chat.completions.create.return_value = mock_response
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
     
     # Send query request
     response = client.post("/api/v1/query/process", json={"query": "show me all active customers"})
@@ -41,12 +41,12 @@ def test_end_to_end_query_flow(mock_openai_class, client):
     assert parsed["sql"] == "SELECT * FROM customers WHERE active = 1"
     assert parsed["entities"] == {"table": "customers", "condition": "active"}
 
-@patch('ai.nlp.query_processor.openai.OpenAI')
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
 def test_end_to_end_query_flow_with_error(mock_openai_class, client):
     """Test end-to-end flow when OpenAI fails."""
     mock_client = MagicMock()
     mock_openai_class.return_value = mock_client
-    mock_client.chat.completions.create.side_effect = Exception("API unavailable")
+    mock_client.chat.completions.create = AsyncMock(side_effect=Exception("API unavailable"))
     
     response = client.post("/api/v1/query/process", json={"query": "invalid query"})
     
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+from fastapi.testclient import TestClient
+
+from ai.learning.learning_engine import LearningEngine
+from ai.nlp.query_processor import QueryProcessor
+from ai.nlp.rate_limit import AsyncRateLimiter
+
+def _async_client(mock_async_openai_class, delay=0.05):
+    async def create(**kwargs):
+        await asyncio.sleep(delay)
+        query = kwargs["messages"][0]["content"].split("Query: ")[1].split("\n")[0]
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = json.dumps({"intent": "x", "sql": f"-- {query}", "entities": {}})
+        return response
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=create)
+    mock_async_openai_class.return_value = mock_client
+    return mock_client
+
+@pytest.fixture
+def batch_processor(tmp_path):
+    processor = QueryProcessor()
+    processor.learning_engine = LearningEngine(storage_path=str(tmp_path / "learning_data.json"), storage_format="json")
+    return processor
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_process_many_dedupes_and_keeps_order(mock_async_openai_class, batch_processor):
+    mock_client = _async_client(mock_async_openai_class)
+    queries = ["show a", "show b", "Show A!", "show c"]
+
+    results = await batch_processor.aprocess_many(queries)
+
+    assert [result["original"] for result in results] == queries
+    assert results[2]["generated_sql"] == "-- show a"
+    assert mock_client.chat.completions.create.await_count == 3
+    # Every item is recorded, under the ID it was returned with
+    recorded = batch_processor.learning_engine.get_interactions()
+    assert sorted(i["id"] for i in recorded) == sorted(result["interaction_id"] for result in results)
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_process_many_batches_learning_writes(mock_async_openai_class, batch_processor):
+    _async_client(mock_async_openai_class, delay=0)
+    with patch.object(batch_processor.learning_engine.store, "persist",
+                      wraps=batch_processor.learning_engine.store.persist) as persist:
+        await batch_processor.aprocess_many([f"query {i}" for i in range(20)], concurrency=10)
+    # Queries that complete together share a write
+    assert persist.call_count <= 4
+    assert sum(len(call.args[0]) for call in persist.call_args_list) == 20
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_streamed_items_are_recorded_before_they_are_yielded(mock_async_openai_class, batch_processor):
+    _async_client(mock_async_openai_class)
+    items = batch_processor.aiter_many(["describe a", "describe b"], concurrency=1)
+    _, first = await items.__anext__()
+    # Feedback for an early item works while the rest of the batch is still running
+    assert batch_processor.learning_engine.add_feedback(first["interaction_id"], "good")
+    await items.aclose()
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_concurrency_is_bounded(mock_async_openai_class, batch_processor):
+    running = peak = 0
+
+    async def create(**kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '{"intent": "x", "sql": "SELECT 1", "entities": {}}'
+        return response
+
+    mock_async_openai_class.return_value.chat.completions.create = AsyncMock(side_effect=create)
+    await batch_processor.aprocess_many([f"query {i}" for i in range(12)], concurrency=3)
+    assert peak == 3
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_calls():
+    limiter = AsyncRateLimiter(rate=50)
+    start = time.perf_counter()
+    for _ in range(6):
+        await limiter.acquire()
+    assert time.perf_counter() - start >= 0.09
+
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+def test_batch_endpoint(mock_async_openai_class, tmp_path):
+    from backend.main import app
+    from backend.routes.query import processor
+    _async_client(mock_async_openai_class, delay=0)
+    engine = LearningEngine(storage_path=str(tmp_path / "learning_data.json"), storage_format="json")
+    with patch.object(processor, "learning_engine", engine), TestClient(app) as client:
+        response = client.post("/api/v1/query/batch", json={"queries": ["batch one", "batch two"]})
+        assert response.status_code == 200
+        assert [r["generated_sql"] for r in response.json()["results"]] == ["-- batch one", "-- batch two"]
+
+        response = client.post("/api/v1/query/batch", json={"queries": ["batch three", "batch four"], "stream": True})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert sorted(line["index"] for line in lines) == [0, 1]
+        assert {line["original"] for line in lines} == {"batch three", "batch four"}
+
+        response = client.post("/api/v1/query/batch", json={"queries": ["q"] * 501})
+        assert response.status_code == 422
+
+    async def failing(queries, schema_source=None):
+        yield 0, {"original": queries[0]}
+        raise RuntimeError("learning store unavailable")
+    with patch.object(processor, "aiter_many", failing), TestClient(app) as client:
+        response = client.post("/api/v1/query/batch", json={"queries": ["batch five", "batch six"], "stream": True})
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines == [{"index": 0, "original": "batch five"},
+                         {"status": "error", "detail": "Failed to process the batch. Please try again."}]
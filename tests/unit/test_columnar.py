@@ -0,0 +1,87 @@
+import json
+import pytest
+
+from ai.feedback_processor import FeedbackProcessor
+from ai.learning.columnar import ColumnarInteractions
+from ai.learning.learning_engine import LearningEngine
+from backend.config.settings import settings
+
+RECORDS = [
+    {"id": "a", "natural_query": "show orders", "generated_sql": "SELECT * FROM orders", "success": True,
+     "feedback": None, "error": None, "timestamp": "2026-01-01T10:00:00.123456"},
+    {"id": "b", "natural_query": "show orders", "generated_sql": None, "success": False,
+     "feedback": "wrong table", "error": "boom", "timestamp": "2026-01-01T23:59:59"},
+    {"id": "c", "natural_query": "count users", "generated_sql": "SELECT COUNT(*) FROM users", "success": True,
+     "feedback": "great", "error": None, "timestamp": "2026-01-02T08:00:00", "extra": [1, 2]},
+]
+
+def test_round_trips_records_and_interns_strings():
+    columns = ColumnarInteractions(RECORDS)
+    assert len(columns) == 3
+    assert columns[:] == RECORDS
+    assert [dict(row) for row in columns] == RECORDS
+    assert columns[-1]["extra"] == [1, 2]
+    # "show orders" is stored once
+    assert len(columns.strings) == 7
+
+def test_unusual_values_are_kept_exactly():
+    records = [{"id": "x", "natural_query": "q", "success": 1, "timestamp": "2026-01-01T10:00:00+00:00"},
+               {"id": "y", "natural_query": "q", "success": True}]
+    columns = ColumnarInteractions(records)
+    assert columns[0]["success"] == 1
+    assert columns[0]["timestamp"] == "2026-01-01T10:00:00+00:00"
+    assert "timestamp" not in columns[1]
+
+def test_row_views_write_to_columns():
+    columns = ColumnarInteractions(RECORDS)
+    row = columns[0]
+    row.update({"feedback": "better now", "success": False})
+    assert columns.materialize(0)["feedback"] == "better now"
+    assert columns.materialize(0)["success"] is False
+    with pytest.raises(TypeError):
+        row["id"] = "z"
+
+def test_prune_drops_older_rows():
+    columns = ColumnarInteractions(RECORDS)
+    columns.prune("2026-01-02T00:00:00")
+    assert [row["id"] for row in columns] == ["c"]
+    assert columns.row_of("a") is None
+    assert columns.row_of("c") == 0
+
+def test_daily_success_counts():
+    columns = ColumnarInteractions(RECORDS)
+    assert columns.daily_success() == {"2026-01-01": (2, 1), "2026-01-02": (1, 1)}
+    assert columns.daily_success(has_feedback=True) == {"2026-01-01": (1, 0), "2026-01-02": (1, 1)}
+
+@pytest.mark.parametrize("storage_format", ["json", "journal"])
+def test_engine_with_columnar_history(tmp_path, monkeypatch, storage_format):
+    monkeypatch.setattr(settings, "LEARNING_COLUMNAR_HISTORY", True)
+    path = tmp_path / "learning_data.json"
+    path.write_text(json.dumps({"interactions": [
+        {"natural_query": "legacy", "generated_sql": None, "success": False,
+         "feedback": None, "error": None, "timestamp": "2025-12-01T00:00:00"}]}))
+    engine = LearningEngine(storage_path=str(path), storage_format=storage_format)
+    assert isinstance(engine.learning_data["interactions"], ColumnarInteractions)
+
+    interaction_id = engine.record_interaction("show orders", "SELECT * FROM orders", True)
+    assert engine.add_feedback(interaction_id, "looks right")
+    assert engine.get_interactions(has_feedback=True)[0]["feedback"] == "looks right"
+    engine.store.prune("interactions", "2026-01-01T00:00:00")
+    engine.close()
+
+    reopened = LearningEngine(storage_path=str(path), storage_format=storage_format)
+    interactions = reopened.get_interactions()
+    assert [(i["id"], i["feedback"]) for i in interactions] == [(interaction_id, "looks right")]
+    reopened.close()
+
+def test_success_trends_from_columns(tmp_path, monkeypatch):
+    path = tmp_path / "learning_data.json"
+    path.write_text(json.dumps({"interactions": RECORDS}))
+    plain = LearningEngine(storage_path=str(path), storage_format="json")
+    expected = FeedbackProcessor(plain).analyze_feedback_patterns()["success_trends"]
+
+    monkeypatch.setattr(settings, "LEARNING_COLUMNAR_HISTORY", True)
+    columnar = LearningEngine(storage_path=str(path), storage_format="json")
+    assert FeedbackProcessor(columnar).analyze_feedback_patterns()["success_trends"] == expected
+    assert expected == {"2026-01-01": {"total_queries": 1, "success_rate": 0.0},
+                        "2026-01-02": {"total_queries": 1, "success_rate": 1.0}}
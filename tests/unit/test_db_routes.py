@@ -66,9 +66,10 @@ def test_execute_query_success(mock_get_engine, client, auth_token):
     mock_engine = MagicMock()
     mock_conn = MagicMock()
     mock_result = MagicMock()
-    mock_result.__iter__.return_value = [{"id": 1, "name": "test"}]
-    mock_conn.execute.return_value = mock_result
-    mock_engine.connect.return_value.__enter__.return_value = mock_conn
+    mock_result.keys.return_value = ["id", "name"]
+    mock_result.fetchmany.side_effect = [[(1, "test")], [], []]
+    mock_conn.execution_options.return_value.execute.return_value = mock_result
+    mock_engine.connect.return_value = mock_conn
     mock_get_engine.return_value = mock_engine
     
     response = client.post("/api/v1/db/execute", 
@@ -85,7 +86,7 @@ def test_execute_query_sql_error(mock_get_engine, client, auth_token):
     # Mock the engine to raise SQLAlchemyError
     from sqlalchemy.exc import SQLAlchemyError
     mock_engine = MagicMock()
-    mock_engine.connect.return_value.__enter__.side_effect = SQLAlchemyError("SQL Error")
+    mock_engine.connect.side_effect = SQLAlchemyError("SQL Error")
     mock_get_engine.return_value = mock_engine
     
     response = client.post("/api/v1/db/execute", 
@@ -107,4 +108,228 @@ def test_execute_query_unauthorized(client):
     response = client.post("/api/v1/db/execute", 
         json={"db_type": "mssql", "query": "SELECT 1"}
     )
-    assert response.status_code == 401
\ No newline at end of file
+    assert response.status_code == 401
+@pytest.fixture
+def rows_engine(tmp_path):
+    from sqlalchemy import text
+    engine = create_engine(f"sqlite:///{tmp_path / 'rows.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE items (id INTEGER PRIMARY KEY, name TEXT)"))
+        conn.execute(text("INSERT INTO items (id, name) VALUES (:id, :name)"),
+                     [{"id": i, "name": f"item {i}"} for i in range(2500)])
+    yield engine
+    engine.dispose()
+
+@patch('backend.routes.db._get_engine')
+def test_execute_query_streams_ndjson(mock_get_engine, client, auth_token, rows_engine):
+    import json
+    mock_get_engine.return_value = rows_engine
+    response = client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": "SELECT id, name FROM items ORDER BY id", "stream": True},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    *rows, trailer = [json.loads(line) for line in response.text.splitlines()]
+    assert len(rows) == 2500
+    assert rows[0] == {"id": 0, "name": "item 0"}
+    assert trailer == {"status": "success", "row_count": 2500}
+
+@patch('backend.routes.db._get_engine')
+def test_execute_query_streams_json(mock_get_engine, client, auth_token, rows_engine):
+    mock_get_engine.return_value = rows_engine
+    response = client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": "SELECT id FROM items WHERE id < 3 ORDER BY id",
+              "stream": True, "format": "json"},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"rows": [{"id": 0}, {"id": 1}, {"id": 2}], "status": "success"}
+
+@patch('backend.routes.db._get_engine')
+def test_streamed_query_errors_before_the_first_row_are_http_errors(mock_get_engine, client, auth_token, rows_engine):
+    mock_get_engine.return_value = rows_engine
+    response = client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": "SELECT * FROM missing", "stream": True},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 500
+    response = client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": "SELECT 1", "stream": True, "format": "xml"},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 400
+
+@patch('backend.routes.db._get_engine')
+def test_execute_query_in_columnar_formats(mock_get_engine, client, auth_token, rows_engine):
+    import json
+    from backend.result_stream import decode_binary
+    mock_get_engine.return_value = rows_engine
+    query = "SELECT id, name FROM items WHERE id < 2 ORDER BY id"
+    response = client.post("/api/v1/db/execute", json={"db_type": "mssql", "query": query, "format": "columnar"},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.status_code == 200
+    frames = [json.loads(line) for line in response.text.splitlines()]
+    assert frames[1] == {"dtypes": ["int64", "string"], "data": [[0, 1], ["item 0", "item 1"]]}
+
+    response = client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": query, "format": "binary", "stream": True},
+        headers={"Authorization": f"Bearer {auth_token}"}
+    )
+    assert response.headers["content-type"] == "application/vnd.abiet.columnar"
+    assert decode_binary(response.content)["batches"][0]["data"] == [[0, 1], ["item 0", "item 1"]]
+
+@patch('backend.routes.db._get_engine')
+def test_execute_query_pages_with_continuation_tokens(mock_get_engine, client, auth_token, rows_engine):
+    mock_get_engine.return_value = rows_engine
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    body = {"db_type": "mssql", "query": "SELECT id FROM items ORDER BY id", "page_size": 1000}
+    ids = []
+    pages = 0
+    while True:
+        response = client.post("/api/v1/db/execute", json=body, headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        ids += [row["id"] for row in data["rows"]]
+        pages += 1
+        if not data["continuation_token"]:
+            break
+        body["continuation_token"] = data["continuation_token"]
+    assert ids == list(range(2500))
+    assert pages == 3
+    # A used or unknown token cannot be replayed
+    response = client.post("/api/v1/db/execute", json=body, headers=headers)
+    assert response.status_code == 400
+
+@patch('backend.routes.db._get_engine')
+def test_execute_query_applies_the_hard_row_cap(mock_get_engine, client, auth_token, rows_engine):
+    from backend.config.settings import settings
+    mock_get_engine.return_value = rows_engine
+    with patch.object(settings, "DB_MAX_ROWS", 100):
+        response = client.post("/api/v1/db/execute",
+            json={"db_type": "mssql", "query": "SELECT id FROM items", "page_size": 5000, "format": "columnar"},
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+    assert response.status_code == 200
+    assert response.text.splitlines()[-1] == '{"status": "success", "row_count": 100}'
+    assert response.headers["x-continuation-token"]
+
+@patch('backend.routes.db._get_engine')
+def test_streamed_results_are_capped(mock_get_engine, client, auth_token, rows_engine):
+    import json
+    from backend.config.settings import settings
+    mock_get_engine.return_value = rows_engine
+    with patch.object(settings, "DB_MAX_ROWS", 1000):
+        response = client.post("/api/v1/db/execute",
+            json={"db_type": "mssql", "query": "SELECT id FROM items", "stream": True},
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 1001
+    assert lines[-1]["status"] == "truncated"
+    assert lines[-1]["row_count"] == 1000
+
+@patch('backend.routes.db._get_engine')
+def test_execute_query_result_cache(mock_get_engine, client, auth_token, rows_engine):
+    from backend.result_cache import result_cache
+    mock_get_engine.return_value = rows_engine
+    result_cache.clear()
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    body = {"db_type": "mssql", "query": "SELECT id FROM items WHERE id < 3 ORDER BY id", "cache": True}
+    first = client.post("/api/v1/db/execute", json=body, headers=headers).json()
+    assert first["cached"] is False
+    # Layout and a trailing semicolon do not change the key
+    body["query"] = "SELECT id  FROM items\nWHERE id < 3 ORDER BY id;"
+    second = client.post("/api/v1/db/execute", json=body, headers=headers).json()
+    assert second["cached"] is True
+    assert second["cache_age"] >= 0
+    assert second["rows"] == first["rows"] == [{"id": 0}, {"id": 1}, {"id": 2}]
+
+    response = client.post("/api/v1/db/execute", json={**body, "format": "columnar"}, headers=headers)
+    assert response.headers["x-cache"] == "hit"
+    assert "age" in response.headers
+
+    # A write to the table invalidates its cached results
+    response = client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": "UPDATE items SET name = 'renamed' WHERE id = 0"}, headers=headers)
+    assert response.status_code == 200
+    assert client.post("/api/v1/db/execute", json=body, headers=headers).json()["cached"] is False
+    stats = client.get("/api/v1/db/cache", headers=headers).json()["cache"]
+    assert stats["invalidations"] == 1
+    assert stats["entries"] == 1
+    result_cache.clear()
+
+@patch('backend.routes.db._get_engine')
+def test_writes_are_committed_before_invalidating(mock_get_engine, client, auth_token, rows_engine):
+    from backend.result_cache import result_cache
+    mock_get_engine.return_value = rows_engine
+    result_cache.clear()
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    body = {"db_type": "mssql", "query": "SELECT name FROM items WHERE id = 0", "cache": True}
+    client.post("/api/v1/db/execute", json=body, headers=headers)
+    client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": "UPDATE items SET name = 'renamed' WHERE id = 0"}, headers=headers)
+    data = client.post("/api/v1/db/execute", json=body, headers=headers).json()
+    assert data["cached"] is False
+    assert data["rows"] == [{"name": "renamed"}]
+    result_cache.clear()
+
+@patch('backend.routes.db._get_engine')
+def test_writes_returning_rows_are_committed(mock_get_engine, client, auth_token, rows_engine):
+    from backend.result_cache import result_cache
+    mock_get_engine.return_value = rows_engine
+    result_cache.clear()
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    body = {"db_type": "mssql", "query": "SELECT COUNT(*) AS n FROM items", "cache": True}
+    assert client.post("/api/v1/db/execute", json=body, headers=headers).json()["rows"] == [{"n": 2500}]
+    response = client.post("/api/v1/db/execute",
+        json={"db_type": "mssql", "query": "INSERT INTO items (id, name) VALUES (5000, 'new') RETURNING id"},
+        headers=headers)
+    assert response.json()["rows"] == [{"id": 5000}]
+    data = client.post("/api/v1/db/execute", json=body, headers=headers).json()
+    assert data["cached"] is False
+    assert data["rows"] == [{"n": 2501}]
+    result_cache.clear()
+
+@patch('backend.routes.db._get_engine')
+def test_results_without_tables_are_not_cached(mock_get_engine, client, auth_token, rows_engine):
+    from backend.result_cache import result_cache
+    mock_get_engine.return_value = rows_engine
+    result_cache.clear()
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    body = {"db_type": "mssql", "query": "SELECT 1 AS one", "cache": True}
+    for _ in range(2):
+        assert client.post("/api/v1/db/execute", json=body, headers=headers).json()["cached"] is False
+    assert client.get("/api/v1/db/cache", headers=headers).json()["cache"]["entries"] == 0
+
+@patch('backend.routes.db._get_engine')
+def test_schema_is_per_user(mock_get_engine, client, auth_token, rows_engine):
+    from ai.nlp.query_processor import processor
+    mock_get_engine.return_value = rows_engine
+    client.post("/api/v1/auth/register", json={"username": "other", "email": "other@example.com", "password": "pw"})
+    other_token = client.post("/api/v1/auth/login", json={"username": "other", "password": "pw"}).json()["access_token"]
+    connection = {"db_type": "postgresql", "host": "shop-db", "port": 5432, "database": "shop",
+                  "username": "app", "password": "secret"}
+    response = client.post("/api/v1/db/connect", json=connection, headers={"Authorization": f"Bearer {auth_token}"})
+    assert response.json()["schema_tables"] == 1
+
+    mine = client.get("/api/v1/db/schema", headers={"Authorization": f"Bearer {auth_token}"}).json()["schema"]
+    assert mine["active_source"] == "postgresql://app@shop-db:5432/shop"
+    theirs = client.get("/api/v1/db/schema", headers={"Authorization": f"Bearer {other_token}"}).json()["schema"]
+    assert theirs == {"active_source": None, "sources": {}}
+    assert processor.schema_cache.source_of("other") is None
+
+@pytest.mark.asyncio
+async def test_execute_query_runs_off_the_event_loop():
+    import threading
+    from backend.routes.db import DBQuery, execute_query
+    threads = []
+
+    def execute(payload, username):
+        threads.append(threading.current_thread())
+        return {"status": "success", "rows": []}
+
+    with patch('backend.routes.db._execute', side_effect=execute):
+        await execute_query(DBQuery(db_type="mssql", query="SELECT 1"), User(username="testuser"))
+    assert threads and threads[0] is not threading.main_thread()
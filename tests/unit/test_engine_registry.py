@@ -0,0 +1,69 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from sqlalchemy import text
+
+from backend.engine_registry import EngineRegistry, connection_fingerprint, engine_registry, pool_options
+from backend.config.settings import settings
+from backend.routes.db import DBConnection, _get_engine
+
+@pytest.fixture
+def registry():
+    registry = EngineRegistry(max_engines=2, idle_timeout=0)
+    yield registry
+    registry.dispose_all()
+
+def _url(tmp_path, name):
+    return f"sqlite:///{tmp_path / name}"
+
+def test_same_key_shares_one_engine(registry, tmp_path):
+    first = registry.get("a", "sqlite", _url(tmp_path, "a.db"))
+    assert registry.get("a", "sqlite", _url(tmp_path, "a.db")) is first
+    with first.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+    stats = registry.stats()
+    assert stats["created"] == 1
+    assert stats["engines"][0]["uses"] == 2
+    assert stats["engines"][0]["checkedin"] == 1
+
+def test_least_recently_used_engine_is_disposed(registry, tmp_path):
+    a = registry.get("a", "sqlite", _url(tmp_path, "a.db"))
+    registry.get("b", "sqlite", _url(tmp_path, "b.db"))
+    registry.get("a", "sqlite", _url(tmp_path, "a.db"))
+    with patch.object(type(a), "dispose") as dispose:
+        registry.get("c", "sqlite", _url(tmp_path, "c.db"))
+    dispose.assert_called_once()
+    assert [engine["id"] for engine in registry.stats()["engines"]] == ["a", "c"]
+    assert registry.disposed == 1
+
+def test_idle_engines_are_disposed(tmp_path):
+    registry = EngineRegistry(max_engines=10, idle_timeout=0.01)
+    registry.get("a", "sqlite", _url(tmp_path, "a.db"))
+    time.sleep(0.02)
+    assert registry.sweep() == 1
+    assert registry.stats()["engines"] == []
+
+def test_pool_options_per_db_type(monkeypatch):
+    monkeypatch.setattr(settings, "DB_POOL_OVERRIDES", {"oracle": {"pool_size": 2, "pool_recycle": 600}})
+    assert pool_options("oracle")["pool_size"] == 2
+    assert pool_options("oracle")["pool_recycle"] == 600
+    assert pool_options("mssql")["pool_size"] == settings.DB_POOL_SIZE
+
+def test_fingerprint_depends_on_password_but_does_not_contain_it():
+    first = connection_fingerprint("postgresql", "db", 5432, "shop", "app", "secret")
+    assert first == connection_fingerprint("postgresql", "db", 5432, "shop", "app", "secret")
+    assert first != connection_fingerprint("postgresql", "db", 5432, "shop", "app", "other")
+    assert "secret" not in first
+
+@patch('backend.engine_registry.create_engine')
+def test_get_engine_reuses_engines_across_requests(mock_create_engine):
+    mock_create_engine.side_effect = lambda url, **kwargs: MagicMock()
+    connection = DBConnection(db_type="postgresql", host="reuse-test", port=5432, database="shop",
+                              username="app", password="secret")
+    try:
+        engine = _get_engine("postgresql", connection)
+        assert _get_engine("postgresql", connection) is engine
+        assert mock_create_engine.call_count == 1
+        assert mock_create_engine.call_args.kwargs["pool_pre_ping"] == settings.DB_POOL_PRE_PING
+    finally:
+        engine_registry.dispose_all()
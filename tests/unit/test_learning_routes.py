@@ -0,0 +1,78 @@
+import os
+import threading
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.main import app
+from backend.models import Base, User
+from backend.routes.auth import get_db
+
+TEST_DATABASE_URL = "sqlite:///./test.db"
+
+@pytest.fixture
+def test_db():
+    engine = create_engine(TEST_DATABASE_URL, connect_args={"check_same_thread": False})
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    yield TestingSessionLocal()
+
+    Base.metadata.drop_all(bind=engine)
+    if os.path.exists("./test.db"):
+        os.unlink("./test.db")
+
+@pytest.fixture
+def client(test_db):
+    def override_get_db():
+        try:
+            yield test_db
+        finally:
+            test_db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+
+    with TestClient(app) as c:
+        yield c
+
+@pytest.fixture
+def auth_token(client):
+    client.post("/api/v1/auth/register", json={
+        "username": "testuser",
+        "email": "test@example.com",
+        "password": "testpass"
+    })
+    login_response = client.post("/api/v1/auth/login", json={
+        "username": "testuser",
+        "password": "testpass"
+    })
+    return login_response.json()["access_token"]
+
+@patch('backend.routes.learning.learning_engine')
+def test_retention_requires_authentication(mock_engine, client):
+    response = client.post("/api/v1/learning/retention")
+    assert response.status_code == 401
+    mock_engine.apply_retention.assert_not_called()
+
+@patch('backend.routes.learning.learning_engine')
+def test_retention_returns_archived_counts(mock_engine, client, auth_token):
+    mock_engine.apply_retention.return_value = {"interactions": 2, "patterns": 0, "corrections": 0}
+    response = client.post("/api/v1/learning/retention", headers={"Authorization": f"Bearer {auth_token}"})
+    assert response.status_code == 200
+    assert response.json() == {"status": "success", "archived": {"interactions": 2, "patterns": 0, "corrections": 0}}
+
+@pytest.mark.asyncio
+async def test_retention_runs_off_the_event_loop():
+    from backend.routes.learning import run_retention
+    threads = []
+
+    def apply_retention():
+        threads.append(threading.current_thread())
+        return {}
+
+    with patch('backend.routes.learning.learning_engine') as mock_engine:
+        mock_engine.apply_retention.side_effect = apply_retention
+        await run_retention(User(username="testuser"))
+    assert threads and threads[0] is not threading.main_thread()
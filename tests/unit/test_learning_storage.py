@@ -0,0 +1,322 @@
+import json
+import os
+import pytest
+
+from ai.learning.learning_engine import LearningEngine
+from ai.learning.storage import JournalStore, JSONFileStore, create_store
+
+@pytest.fixture
+def storage_path(tmp_path):
+    return str(tmp_path / "learning_data.json")
+
+def test_create_store_unknown_format(storage_path):
+    with pytest.raises(ValueError, match="Unsupported learning storage format"):
+        create_store(storage_path, "xml")
+
+def test_journal_append_does_not_rewrite_snapshot(storage_path):
+    engine = LearningEngine(storage_path=storage_path, storage_format="journal")
+    engine.record_interaction("query1", "sql1", True)
+    engine.record_interaction("query2", "sql2", True)
+
+    assert not os.path.exists(storage_path)
+    with open(storage_path + ".journal") as f:
+        lines = f.readlines()
+    assert len(lines) == 2
+    assert json.loads(lines[1])["record"]["natural_query"] == "query2"
+
+def test_journal_replays_on_load(storage_path):
+    engine = LearningEngine(storage_path=storage_path, storage_format="journal")
+    engine.record_interaction("query", "sql", True)
+    engine.add_feedback_to_interaction(0, "good")
+    engine.record_correction("wrong", "right")
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format="journal")
+    assert reloaded.learning_data["interactions"][0]["feedback"] == "good"
+    assert reloaded.learning_data["corrections"][0]["corrected"] == "right"
+
+def test_journal_compaction(storage_path):
+    store = JournalStore(storage_path, compact_every=3)
+    store.load()
+    for i in range(4):
+        store.append("interactions", {"natural_query": f"q{i}"})
+
+    # Three entries were folded into the snapshot, one remains in the journal
+    with open(storage_path) as f:
+        snapshot = json.load(f)
+    assert len(snapshot["interactions"]) == 3
+    with open(storage_path + ".journal") as f:
+        assert len(f.readlines()) == 1
+
+    reloaded = JournalStore(storage_path, compact_every=3)
+    assert len(reloaded.load()["interactions"]) == 4
+
+def test_journal_skips_entries_already_in_snapshot(storage_path):
+    store = JournalStore(storage_path)
+    store.load()
+    store.append("interactions", {"natural_query": "q"})
+    with open(store.journal_path) as f:
+        journal = f.read()
+    store.compact()
+
+    # Simulate a crash between writing the snapshot and removing the journal
+    with open(store.journal_path, "w") as f:
+        f.write(journal)
+    reloaded = JournalStore(storage_path)
+    assert len(reloaded.load()["interactions"]) == 1
+
+def test_journal_ignores_torn_tail(storage_path):
+    store = JournalStore(storage_path)
+    store.load()
+    store.append("interactions", {"natural_query": "q"})
+    with open(store.journal_path, "a") as f:
+        f.write('{"op": "append", "collec')
+
+    reloaded = JournalStore(storage_path)
+    assert len(reloaded.load()["interactions"]) == 1
+    assert not os.path.exists(store.journal_path)
+
+def test_migrate_json_to_journal_and_back(storage_path):
+    legacy = {"patterns": [], "corrections": [], "interactions": [{"natural_query": "old"}], "usage_stats": {}}
+    with open(storage_path, "w") as f:
+        json.dump(legacy, f)
+
+    journal_engine = LearningEngine(storage_path=storage_path, storage_format="journal")
+    assert journal_engine.learning_data["interactions"][0]["natural_query"] == "old"
+    journal_engine.record_interaction("new", "sql", True)
+
+    json_engine = LearningEngine(storage_path=storage_path, storage_format="json")
+    assert [i["natural_query"] for i in json_engine.learning_data["interactions"]] == ["old", "new"]
+    assert not os.path.exists(storage_path + ".journal")
+    with open(storage_path) as f:
+        assert "journal_seq" not in json.load(f)
+
+@pytest.fixture
+def sqlite_engine(storage_path):
+    engine = LearningEngine(storage_path=storage_path, storage_format="sqlite")
+    yield engine
+    engine.store.close()
+
+def test_sqlite_uses_wal(sqlite_engine):
+    conn = sqlite_engine.store._connect()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert sqlite_engine.store.db_path.endswith("learning_data.db")
+
+def test_sqlite_records_and_reloads(storage_path, sqlite_engine):
+    sqlite_engine.record_interaction("query", "sql", True)
+    sqlite_engine.add_feedback_to_interaction(0, "good")
+    sqlite_engine.record_query_pattern("query", "sql", True)
+    sqlite_engine.store.close()
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format="sqlite")
+    interaction = reloaded.learning_data["interactions"][0]
+    assert interaction["feedback"] == "good"
+    assert interaction["success"] is True
+    assert reloaded.learning_data["patterns"][0]["generated_sql"] == "sql"
+    reloaded.store.close()
+
+def test_sqlite_filters_and_counts(sqlite_engine):
+    sqlite_engine.record_interaction("q1", "sql1", True)
+    sqlite_engine.record_interaction("q2", None, False, error="boom")
+    sqlite_engine.record_interaction("q3", "sql3", True, feedback="nice")
+
+    assert sqlite_engine.count_interactions() == 3
+    assert sqlite_engine.count_interactions(success=False) == 1
+    assert [i["natural_query"] for i in sqlite_engine.get_interactions(has_feedback=True)] == ["q3"]
+    assert [i["natural_query"] for i in sqlite_engine.get_interactions(limit=2)] == ["q2", "q3"]
+
+@pytest.mark.parametrize("storage_format", ["json", "sqlite"])
+def test_keyset_paging(storage_path, storage_format):
+    engine = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    for i in range(5):
+        engine.record_interaction(f"q{i}", f"sql{i}", i % 2 == 0)
+
+    seen = []
+    page = engine.get_interaction_page(2)
+    while True:
+        seen = [i["natural_query"] for i in page["interactions"]] + seen
+        if page["next_cursor"] is None:
+            break
+        page = engine.get_interaction_page(2, page["next_cursor"])
+    assert seen == ["q0", "q1", "q2", "q3", "q4"]
+
+    first = engine.get_interaction_page(2, success=True)
+    assert [i["natural_query"] for i in first["interactions"]] == ["q2", "q4"]
+    rest = engine.get_interaction_page(2, first["next_cursor"], success=True)
+    assert [i["natural_query"] for i in rest["interactions"]] == ["q0"]
+    assert rest["next_cursor"] is None
+    engine.store.close()
+
+def test_sqlite_imports_legacy_json(storage_path):
+    legacy = {"patterns": [{"natural_query": "p"}], "corrections": [],
+              "interactions": [{"natural_query": "old", "success": True, "feedback": "ok", "timestamp": "2026-01-01T00:00:00"}],
+              "usage_stats": {"runs": 3}}
+    with open(storage_path, "w") as f:
+        json.dump(legacy, f)
+
+    engine = LearningEngine(storage_path=storage_path, storage_format="sqlite")
+    assert engine.count_interactions(has_feedback=True) == 1
+    assert [(p["natural_query"], p["usage_count"]) for p in engine.learning_data["patterns"]] == [("p", 1)]
+    assert engine.learning_data["usage_stats"] == {"runs": 3}
+    engine.store.close()
+
+@pytest.mark.parametrize("storage_format", ["json", "journal", "sqlite"])
+def test_workers_do_not_lose_writes(storage_path, storage_format):
+    # Two engines on the same path behave like two uvicorn workers
+    worker_a = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    worker_b = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    for engine in (worker_a, worker_b):
+        engine.store.refresh_interval = 0
+
+    worker_a.record_interaction("from a", "sql", True)
+    worker_b.record_interaction("from b", "sql", True)
+    worker_a.record_correction("wrong", "right")
+
+    for engine in (worker_a, worker_b):
+        assert sorted(i["natural_query"] for i in engine.get_interactions()) == ["from a", "from b"]
+    worker_b.store.refresh()
+    assert worker_b.learning_data["corrections"][0]["corrected"] == "right"
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    assert reloaded.count_interactions() == 2
+    for engine in (worker_a, worker_b, reloaded):
+        engine.close()
+
+def test_journal_worker_reloads_after_other_worker_compacts(storage_path):
+    worker_a = JournalStore(storage_path, compact_every=2, refresh_interval=0)
+    worker_b = JournalStore(storage_path, compact_every=100, refresh_interval=0)
+    worker_a.load()
+    worker_b.load()
+
+    worker_b.append("interactions", {"natural_query": "b1"})
+    worker_a.append("interactions", {"natural_query": "a1"})  # triggers compaction
+    assert not os.path.exists(worker_a.journal_path)
+    worker_b.append("interactions", {"natural_query": "b2"})
+
+    worker_a.refresh()
+    reloaded = JournalStore(storage_path)
+    on_disk = [i["natural_query"] for i in reloaded.load()["interactions"]]
+    assert sorted(on_disk) == ["a1", "b1", "b2"]
+    assert [i["natural_query"] for i in worker_a.data["interactions"]] == on_disk
+
+def test_refresh_interval_bounds_read_staleness(storage_path):
+    writer = LearningEngine(storage_path=storage_path, storage_format="journal")
+    reader = LearningEngine(storage_path=storage_path, storage_format="journal")
+    reader.store.refresh_interval = 60
+    reader.store.refresh()
+
+    writer.record_interaction("new", "sql", True)
+    assert reader.count_interactions() == 0
+    reader.store._last_refresh = 0
+    assert reader.count_interactions() == 1
+
+def test_shared_engine_is_reused():
+    from ai.learning.learning_engine import get_learning_engine
+    from ai.feedback_processor import feedback_processor
+    from ai.nlp.query_processor import processor
+    from backend.routes import learning
+
+    engine = get_learning_engine()
+    assert processor.learning_engine is engine
+    assert learning.learning_engine is engine
+    assert feedback_processor.learning_engine is engine
+
+@pytest.mark.parametrize("storage_format", ["json", "journal", "sqlite"])
+def test_feedback_by_interaction_id(storage_path, storage_format):
+    engine = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    first = engine.record_interaction("q1", "sql1", True)
+    second = engine.record_interaction("q2", "sql2", True)
+
+    assert engine.add_feedback(second, "good")
+    assert not engine.add_feedback("missing", "bad")
+    result = engine.add_feedback_bulk({first: "ok", "missing": "bad"})
+    assert result == {"updated": [first], "missing": ["missing"]}
+    engine.close()
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    feedback = {i["id"]: i["feedback"] for i in reloaded.get_interactions()}
+    assert feedback == {first: "ok", second: "good"}
+    reloaded.close()
+
+@pytest.mark.parametrize("storage_format", ["json", "journal", "sqlite"])
+def test_legacy_interactions_get_stable_ids(storage_path, storage_format):
+    legacy = {"patterns": [], "corrections": [], "usage_stats": {},
+              "interactions": [{"natural_query": "old", "timestamp": "2026-01-01T00:00:00"}]}
+    with open(storage_path, "w") as f:
+        json.dump(legacy, f)
+
+    engine = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    interaction_id = engine.get_interactions()[0]["id"]
+    assert engine.add_feedback(interaction_id, "good")
+    engine.close()
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    interaction = reloaded.get_interactions()[0]
+    assert (interaction["id"], interaction["feedback"]) == (interaction_id, "good")
+    reloaded.close()
+
+def test_sqlite_migrates_interactions_without_ids(storage_path):
+    import sqlite3
+    db_path = storage_path[:-len(".json")] + ".db"
+    conn = sqlite3.connect(db_path)
+    conn.executescript("""
+        CREATE TABLE interactions (id INTEGER PRIMARY KEY AUTOINCREMENT, natural_query TEXT, generated_sql TEXT,
+            success INTEGER, feedback TEXT, error TEXT, timestamp TEXT, has_feedback INTEGER);
+        INSERT INTO interactions (natural_query, success, timestamp, has_feedback) VALUES ('old', 1, 't', 0);
+        PRAGMA user_version = 1;
+    """)
+    conn.close()
+
+    engine = LearningEngine(storage_path=storage_path, storage_format="sqlite")
+    interaction_id = engine.get_interactions()[0]["id"]
+    assert interaction_id
+    assert engine.add_feedback(interaction_id, "good")
+    assert engine.count_interactions(has_feedback=True) == 1
+    engine.close()
+
+@pytest.mark.parametrize("storage_format", ["json", "journal", "sqlite"])
+def test_patterns_are_deduplicated(storage_path, storage_format):
+    engine = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    engine.record_query_pattern("Show users", "SELECT * FROM users", True)
+    engine.record_query_pattern("show   users", "SELECT * FROM users;", False)
+    engine.record_query_pattern("show users", "SELECT id FROM users", True)
+    engine.close()
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    patterns = reloaded.learning_data["patterns"]
+    assert len(patterns) == 2
+    pattern = reloaded.get_pattern("show users", "SELECT * FROM users")
+    assert (pattern["usage_count"], pattern["success_count"], pattern["failure_count"]) == (2, 1, 1)
+    assert pattern["success"] is False
+    assert pattern["first_seen"] <= pattern["timestamp"]
+    reloaded.close()
+
+@pytest.mark.parametrize("storage_format", ["json", "sqlite"])
+def test_duplicate_patterns_are_folded_on_load(storage_path, storage_format):
+    legacy = {"corrections": [], "interactions": [], "usage_stats": {}, "patterns": [
+        {"natural_query": "q", "generated_sql": "s", "success": True, "timestamp": "2026-01-01T00:00:00", "usage_count": 1},
+        {"natural_query": "q", "generated_sql": "s", "success": False, "timestamp": "2026-01-02T00:00:00", "usage_count": 1},
+        {"test": "data"},
+    ]}
+    with open(storage_path, "w") as f:
+        json.dump(legacy, f)
+
+    engine = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    patterns = engine.learning_data["patterns"]
+    assert len(patterns) == 2 and patterns[1] == {"test": "data"}
+    assert (patterns[0]["usage_count"], patterns[0]["success_count"], patterns[0]["failure_count"]) == (2, 1, 1)
+    assert (patterns[0]["first_seen"], patterns[0]["timestamp"]) == ("2026-01-01T00:00:00", "2026-01-02T00:00:00")
+    engine.record_query_pattern("q", "s", True)
+    assert engine.get_pattern("q", "s")["usage_count"] == 3
+    engine.close()
+
+def test_sqlite_workers_share_pattern_counters(storage_path):
+    worker_a = LearningEngine(storage_path=storage_path, storage_format="sqlite")
+    worker_b = LearningEngine(storage_path=storage_path, storage_format="sqlite")
+    worker_a.record_query_pattern("q", "s", True)
+    worker_b.record_query_pattern("q", "s", True)
+    worker_a.close()
+    worker_b.close()
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format="sqlite")
+    assert [p["usage_count"] for p in reloaded.learning_data["patterns"]] == [2]
+    reloaded.close()
@@ -0,0 +1,56 @@
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from ai.llm_client import LLMClientManager
+
+@patch('ai.llm_client.openai.OpenAI')
+def test_sync_client_is_created_once(mock_openai_class):
+    manager = LLMClientManager()
+    assert manager.get_client() is manager.get_client()
+    assert mock_openai_class.call_count == 1
+    http_client = mock_openai_class.call_args.kwargs["http_client"]
+    assert http_client._transport._pool._max_connections > 0
+    manager.close()
+    mock_openai_class.return_value.close.assert_called_once()
+
+@patch('ai.llm_client.openai.AsyncOpenAI')
+def test_async_client_is_shared_per_event_loop(mock_async_openai_class):
+    mock_async_openai_class.side_effect = lambda **kwargs: MagicMock(close=AsyncMock())
+    manager = LLMClientManager()
+
+    async def get_twice():
+        return manager.get_async_client(), manager.get_async_client()
+
+    first, second = asyncio.run(get_twice())
+    assert first is second
+    # A new loop gets its own client; the old one's connections belong to a closed loop
+    third, _ = asyncio.run(get_twice())
+    assert third is not first
+    assert mock_async_openai_class.call_count == 2
+
+    asyncio.run(manager.aclose())
+    third.close.assert_awaited_once()
+
+def test_real_clients_use_configured_pool_limits():
+    manager = LLMClientManager()
+    client = manager.get_client()
+    pool = client._client._transport._pool
+    from backend.config.settings import settings
+    assert pool._max_connections == settings.LLM_MAX_CONNECTIONS
+    assert pool._max_keepalive_connections == settings.LLM_MAX_KEEPALIVE_CONNECTIONS
+    manager.close()
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_query_processor_reuses_the_shared_client(mock_openai_class):
+    from ai.nlp.query_processor import QueryProcessor
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = '{"intent": "x", "sql": null, "error": "no"}'
+    mock_openai_class.return_value.chat.completions.create.return_value = mock_response
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+
+    processor.process("first query")
+    processor.process("second query")
+    assert mock_openai_class.call_count == 1
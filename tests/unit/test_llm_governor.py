@@ -0,0 +1,164 @@
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+from unittest.mock import patch, MagicMock
+
+from ai.llm_governor import (AdaptiveConcurrencyLimit, CircuitOpenError, LLMGovernor, TokenBucket,
+                             estimate_tokens, is_retryable)
+from ai.nlp.query_processor import QueryProcessor
+from backend.config.settings import settings
+
+def _status_error(cls, status, headers=None):
+    response = httpx.Response(status, headers=headers or {},
+                              request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+    return cls("upstream error", response=response, body=None)
+
+def _connection_error():
+    return openai.APIConnectionError(request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"))
+
+@pytest.fixture
+def governor(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_BASE_DELAY", 0.001)
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY", 0.01)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 2)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "LLM_CIRCUIT_RESET_TIMEOUT", 0.05)
+    return LLMGovernor()
+
+def test_retryable_errors():
+    assert is_retryable(_status_error(openai.RateLimitError, 429))
+    assert is_retryable(_status_error(openai.InternalServerError, 503))
+    assert is_retryable(_connection_error())
+    assert not is_retryable(_status_error(openai.BadRequestError, 400))
+    assert not is_retryable(Exception("API Error"))
+
+def test_retries_until_success(governor):
+    create = MagicMock(side_effect=[_connection_error(), _status_error(openai.RateLimitError, 429), "response"])
+    assert governor.call(create, model="m") == "response"
+    assert create.call_count == 3
+    assert governor.stats()["retries"] == 2
+    assert governor.breaker.state == "closed"
+
+def test_gives_up_after_max_retries(governor):
+    create = MagicMock(side_effect=_connection_error())
+    with pytest.raises(openai.APIConnectionError):
+        governor.call(create)
+    assert create.call_count == 3
+
+def test_other_errors_are_not_retried_and_do_not_trip_the_circuit(governor):
+    create = MagicMock(side_effect=Exception("API Error"))
+    for _ in range(5):
+        with pytest.raises(Exception, match="API Error"):
+            governor.call(create)
+    assert create.call_count == 5
+    assert governor.breaker.state == "closed"
+
+def test_retry_after_is_honoured(governor, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_RETRY_MAX_DELAY", 5.0)
+    error = _status_error(openai.RateLimitError, 429, {"retry-after": "2"})
+    assert governor._backoff(0, error) == 2.0
+
+def test_circuit_opens_fails_fast_and_recovers(governor, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    create = MagicMock(side_effect=_status_error(openai.InternalServerError, 500))
+    for _ in range(3):
+        with pytest.raises(openai.InternalServerError):
+            governor.call(create)
+    with pytest.raises(CircuitOpenError):
+        governor.call(create)
+    assert create.call_count == 3
+    assert governor.stats()["circuit"]["state"] == "open"
+
+    time.sleep(0.06)
+    create.side_effect = None
+    create.return_value = "response"
+    assert governor.call(create) == "response"
+    assert governor.breaker.state == "closed"
+
+def test_token_bucket_spaces_out_requests():
+    bucket = TokenBucket(per_minute=60)
+    assert sum(bucket.reserve(1) for _ in range(60)) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve(1) == pytest.approx(2.0, abs=0.05)
+    assert TokenBucket(per_minute=0).reserve(10 ** 6) == 0
+
+def test_token_estimate_counts_prompt_and_max_tokens():
+    assert estimate_tokens({"messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}) == 200
+
+def test_aimd_limit():
+    limit = AdaptiveConcurrencyLimit(initial=8, minimum=1, maximum=10, target_latency=1.0)
+    for _ in range(8):
+        limit.acquire()
+        limit.release(0.1)
+    assert limit.limit == pytest.approx(9, abs=0.1)
+    limit.acquire()
+    limit.release(0.1, overloaded=True)
+    assert int(limit.limit) == 4
+    limit.acquire()
+    limit.release(2.0)
+    assert int(limit.limit) == 2
+
+@pytest.mark.asyncio
+async def test_async_calls_respect_the_concurrency_limit(governor):
+    governor.concurrency = AdaptiveConcurrencyLimit(initial=2, minimum=2, maximum=2, target_latency=10)
+    in_flight = []
+
+    async def create(**kwargs):
+        in_flight.append(governor.concurrency.in_flight)
+        await asyncio.sleep(0.01)
+        return "response"
+
+    results = await asyncio.gather(*(governor.acall(create) for _ in range(6)))
+    assert results == ["response"] * 6
+    assert max(in_flight) == 2
+    assert governor.concurrency.in_flight == 0
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_processor_fails_fast_while_circuit_is_open(mock_openai_class, monkeypatch):
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    from ai.llm_governor import llm_governor
+    llm_governor.reset()
+    mock_client = mock_openai_class.return_value
+    mock_client.chat.completions.create.side_effect = _status_error(openai.InternalServerError, 502)
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+
+    for i in range(settings.LLM_CIRCUIT_FAILURE_THRESHOLD):
+        assert processor.process(f"show sales {i}")["generated_sql"] is None
+    result = processor.process("show sales again")
+    assert "temporarily unavailable" in result["parsed"]["error"]
+    assert mock_client.chat.completions.create.call_count == settings.LLM_CIRCUIT_FAILURE_THRESHOLD
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_lose_a_wake_up():
+    limit = AdaptiveConcurrencyLimit(initial=1, minimum=1, maximum=1, target_latency=10)
+    await limit.aacquire()
+    cancelled = asyncio.ensure_future(limit.aacquire())
+    waiting = asyncio.ensure_future(limit.aacquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    limit.release(0.1)
+    await asyncio.wait_for(waiting, timeout=1)
+    assert limit.in_flight == 1
+    assert not limit._waiters
+
+@pytest.mark.asyncio
+async def test_cancelled_probe_does_not_leave_the_circuit_half_open(governor):
+    governor.breaker.state = governor.breaker.HALF_OPEN
+    governor.concurrency = AdaptiveConcurrencyLimit(initial=1, minimum=1, maximum=1, target_latency=10)
+    await governor.concurrency.aacquire()
+    probe = asyncio.ensure_future(governor.acall(MagicMock()))
+    await asyncio.sleep(0)
+    probe.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await probe
+    governor.concurrency.release(0.1)
+
+    async def create(**kwargs):
+        return "response"
+
+    assert await governor.acall(create) == "response"
+    assert governor.breaker.state == "closed"
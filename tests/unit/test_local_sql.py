@@ -0,0 +1,84 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+
+from ai.nlp.local_sql import UNRESOLVED_CONFIDENCE, LocalSQLGenerator
+from ai.nlp.query_processor import QueryProcessor
+from backend.config.settings import settings
+
+SCHEMA = {
+    "customers": ["id", "name", "email", "first_name"],
+    "orders": ["id", "customer_id", "total"],
+    "categories": ["id", "title"],
+}
+
+@pytest.fixture
+def generator():
+    return LocalSQLGenerator(SCHEMA)
+
+@pytest.mark.parametrize("query, sql", [
+    ("show all customers", "SELECT * FROM customers"),
+    ("Select all Customers.", "SELECT * FROM customers"),
+    ("show me the orders", "SELECT * FROM orders"),
+    ("list category", "SELECT * FROM categories"),
+    ("get name and email from customers", "SELECT name, email FROM customers"),
+    ("show first name of customers", "SELECT first_name FROM customers"),
+    ("how many orders are there", "SELECT COUNT(*) FROM orders"),
+    ("count customers", "SELECT COUNT(*) FROM customers"),
+])
+def test_trivial_queries_are_answered_locally(generator, query, sql):
+    match = generator.generate(query)
+    assert match is not None
+    assert match.sql == sql
+
+@pytest.mark.parametrize("query", [
+    "show all active customers",
+    "show all invoices",
+    "get phone from customers",
+    "which customers ordered last week",
+])
+def test_unresolved_queries_are_left_to_the_llm(generator, query):
+    assert generator.generate(query) is None
+
+def test_inexact_names_lower_confidence(generator):
+    assert generator.generate("show all customers").confidence == 1.0
+    assert generator.generate("show all customer").confidence < 1.0
+
+def test_without_a_schema_names_are_taken_as_they_are():
+    generator = LocalSQLGenerator()
+    match = generator.generate("select all customers")
+    assert match.sql == "SELECT * FROM customers"
+    assert match.confidence == UNRESOLVED_CONFIDENCE < settings.QUERY_LOCAL_MIN_CONFIDENCE
+    assert generator.generate("how many orders are there").sql == "SELECT COUNT(*) FROM orders"
+    # Without column names to check against, filters look like column lists
+    assert generator.generate("find users from germany") is None
+    assert generator.generate("show orders for alice") is None
+    assert generator.generate("get name and email from users") is None
+    assert generator.generate("show all tables") is None
+
+def test_local_generation_is_fast(generator):
+    start = time.perf_counter()
+    for _ in range(1000):
+        generator.generate("get name and email from customers")
+    assert (time.perf_counter() - start) / 1000 < 0.0005
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_processor_reports_answering_tier(mock_openai_class):
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = '{"intent": "x", "sql": "SELECT 1", "entities": {}}'
+    mock_client = mock_openai_class.return_value
+    mock_client.chat.completions.create.return_value = mock_response
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+    processor.local_generator.set_schema(SCHEMA)
+
+    local = processor.process("show all customers")
+    assert (local["tier"], local["generated_sql"]) == ("local", "SELECT * FROM customers")
+    assert mock_client.chat.completions.create.call_count == 0
+    # Local answers are still recorded
+    processor.learning_engine.record_interaction.assert_called_once()
+
+    assert processor.process("show all active customers")["tier"] == "llm"
+    assert processor.process("show all active customers")["tier"] == "cache"
+    assert processor.tier_counts == {"local": 1, "cache": 1, "llm": 1}
@@ -1,7 +1,9 @@
+import asyncio
 import sys
 import pathlib
+import time
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 from ai.nlp.query_processor import QueryProcessor, processor
 
@@ -95,3 +97,59 @@ def test_process_records_interaction(mock_learning_engine_class, mock_openai_cla
         success=True,
         error=None
     )
+
+def _async_client(mock_async_openai_class, content, delay=0.0):
+    async def create(**kwargs):
+        await asyncio.sleep(delay)
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = content
+        return response
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=create)
+    mock_async_openai_class.return_value = mock_client
+    return mock_client
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_aprocess_returns_structure_and_records(mock_async_openai_class, query_processor):
+    _async_client(mock_async_openai_class, '{"intent": "retrieve data", "sql": "SELECT * FROM users", "entities": {}}')
+    query_processor.learning_engine = MagicMock()
+    query_processor.learning_engine.record_interaction.return_value = "abc"
+
+    result = await query_processor.aprocess("select all users")
+
+    assert result["parsed"]["sql"] == "SELECT * FROM users"
+    assert result["interaction_id"] == "abc"
+    query_processor.learning_engine.record_interaction.assert_called_once_with(
+        natural_query="select all users",
+        generated_sql="SELECT * FROM users",
+        success=True,
+        error=None
+    )
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_aprocess_with_openai_error(mock_async_openai_class, query_processor):
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=Exception("API Error"))
+    mock_async_openai_class.return_value = mock_client
+    query_processor.learning_engine = MagicMock()
+
+    parsed = (await query_processor.aprocess("select all customers"))["parsed"]
+    assert parsed["intent"] == "error"
+    assert parsed["sql"] is None
+    assert "API Error" in parsed["error"]
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_aprocess_runs_llm_calls_concurrently(mock_async_openai_class, query_processor):
+    _async_client(mock_async_openai_class, '{"intent": "x", "sql": "SELECT 1", "entities": {}}', delay=0.2)
+    query_processor.learning_engine = MagicMock()
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(query_processor.aprocess(f"query {i}") for i in range(10)))
+    assert len(results) == 10
+    # Ten 0.2 s calls overlap instead of taking 2 s in sequence
+    assert time.perf_counter() - start < 1.0
@@ -0,0 +1,78 @@
+import json
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+from fastapi.testclient import TestClient
+
+from ai.learning.learning_engine import LearningEngine
+from ai.nlp.query_processor import QueryProcessor, extract_sql
+
+RESPONSE = '{"intent": "list users", "sql": "SELECT \\"name\\" FROM users", "entities": {"table": "users"}}'
+
+def _streaming_client(mock_async_openai_class, text, chunk_size=7):
+    async def stream():
+        for start in range(0, len(text), chunk_size):
+            chunk = MagicMock()
+            chunk.choices = [MagicMock()]
+            chunk.choices[0].delta.content = text[start:start + chunk_size]
+            yield chunk
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=lambda **kwargs: stream())
+    mock_async_openai_class.return_value = mock_client
+    return mock_client
+
+def test_extract_sql_from_partial_json():
+    assert extract_sql('{"intent": "x", "sql": "SELECT') == (False, None)
+    assert extract_sql('{"intent": "x", "sql": "SELECT \\"a\\" FROM t", "ent') == (True, 'SELECT "a" FROM t')
+    assert extract_sql('{"sql": null') == (True, None)
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_astream_emits_sql_before_response_ends(mock_async_openai_class):
+    mock_client = _streaming_client(mock_async_openai_class, RESPONSE)
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+    processor.learning_engine.record_interaction.return_value = "abc"
+
+    events = [(event, data) async for event, data in processor.astream("list users")]
+
+    names = [event for event, _ in events]
+    assert names.count("sql") == 1 and names[-1] == "result"
+    # The SQL is sent while model output is still arriving
+    assert "delta" in names[names.index("sql") + 1:]
+    assert dict(events)["sql"] == {"sql": 'SELECT "name" FROM users'}
+    result = events[-1][1]
+    assert result["parsed"]["entities"] == {"table": "users"}
+    assert result["interaction_id"] == "abc"
+    assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+
+    # The streamed response was cached
+    cached = [(event, data) async for event, data in processor.astream("List users")]
+    assert [event for event, _ in cached] == ["sql", "result"]
+    assert cached[-1][1]["cached"] is True
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_astream_reports_invalid_json(mock_async_openai_class):
+    _streaming_client(mock_async_openai_class, "not json")
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+
+    events = [(event, data) async for event, data in processor.astream("broken")]
+    assert events[-2] == ("sql", {"sql": None})
+    assert "Invalid JSON response" in events[-1][1]["parsed"]["error"]
+
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+def test_stream_endpoint_sends_server_sent_events(mock_async_openai_class, tmp_path):
+    from backend.main import app
+    from backend.routes.query import processor
+    _streaming_client(mock_async_openai_class, RESPONSE)
+    engine = LearningEngine(storage_path=str(tmp_path / "learning_data.json"), storage_format="json")
+    with patch.object(processor, "learning_engine", engine), TestClient(app) as client:
+        response = client.post("/api/v1/query/stream", json={"query": "stream these users"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+    assert events[-1][0] == "event: result"
+    result = json.loads(events[-1][1][len("data: "):])
+    assert engine.store.has_interaction(result["interaction_id"])
@@ -0,0 +1,138 @@
+import time
+from unittest.mock import patch, MagicMock
+
+from ai.learning.learning_engine import LearningEngine
+from ai.nlp.query_processor import QueryProcessor
+from ai.nlp.response_cache import PersistentResponseCache, ResponseCache, normalize_query
+from backend.config.settings import settings
+
+def test_normalize_query_folds_case_whitespace_and_punctuation():
+    assert normalize_query("  Show ALL\tcustomers?! ") == "show all customers"
+    assert normalize_query("orders > 100") != normalize_query("orders < 100")
+
+def test_lru_eviction_and_counters():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", {"sql": "A"})
+    cache.put("b", {"sql": "B"})
+    assert cache.get("a") == {"sql": "A"}
+    cache.put("c", {"sql": "C"})
+    assert cache.get("b") is None
+    assert cache.get("a") == {"sql": "A"}
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"], stats["entries"]) == (2, 1, 1, 2)
+
+def test_entries_expire_after_ttl():
+    cache = ResponseCache(ttl=0.05)
+    cache.put("a", {"sql": "A"})
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+def test_byte_budget_bounds_size():
+    cache = ResponseCache(max_bytes=200)
+    for i in range(10):
+        cache.put(i, {"sql": "x" * 50})
+    assert cache.stats()["bytes"] <= 200
+    assert 0 < len(cache) < 10
+    cache.put("huge", {"sql": "x" * 500})
+    assert cache.get("huge") is None
+
+def test_cached_values_are_copies():
+    cache = ResponseCache()
+    cache.put("a", {"entities": []})
+    cache.get("a")["entities"].append("x")
+    assert cache.get("a") == {"entities": []}
+
+def _mock_response(mock_openai_class, content):
+    mock_client = MagicMock()
+    mock_openai_class.return_value = mock_client
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock()]
+    mock_response.choices[0].message.content = content
+    mock_client.chat.completions.create.return_value = mock_response
+    return mock_client
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_processor_serves_repeated_queries_from_cache(mock_openai_class):
+    mock_client = _mock_response(mock_openai_class, '{"intent": "list", "sql": "SELECT * FROM users", "entities": {}}')
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+
+    first = processor.process("Show all users")
+    second = processor.process("show all users?")
+    assert mock_client.chat.completions.create.call_count == 1
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["generated_sql"] == "SELECT * FROM users"
+    # Cache hits are still recorded for analytics
+    assert processor.learning_engine.record_interaction.call_count == 2
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_processor_does_not_cache_failures(mock_openai_class):
+    mock_client = _mock_response(mock_openai_class, '{"intent": "unknown", "sql": null, "error": "unclear"}')
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+
+    processor.process("do the thing")
+    result = processor.process("do the thing")
+    assert mock_client.chat.completions.create.call_count == 2
+    assert result["cached"] is False
+
+@patch('ai.nlp.query_processor.settings')
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_model_settings_are_part_of_the_key(mock_openai_class, mock_settings):
+    mock_client = _mock_response(mock_openai_class, '{"intent": "list", "sql": "SELECT 1", "entities": {}}')
+    mock_settings.QUERY_CACHE_MAX_ENTRIES = 10
+    mock_settings.QUERY_CACHE_TTL = 60
+    mock_settings.QUERY_CACHE_MAX_BYTES = 10000
+    mock_settings.QUERY_CACHE_SCHEMA_VERSION = "1"
+    mock_settings.QUERY_CACHE_PATH = ""
+    mock_settings.QUERY_LOCAL_MIN_CONFIDENCE = 0.9
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+
+    processor.process("select one")
+    mock_settings.AI_MODEL = "another-model"
+    processor.process("select one")
+    mock_settings.QUERY_CACHE_SCHEMA_VERSION = "2"
+    processor.process("select one")
+    assert mock_client.chat.completions.create.call_count == 3
+
+def test_persistent_cache_purges_other_versions(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = PersistentResponseCache(path)
+    cache.put("k1", "v1", {"sql": "SELECT 1"})
+    cache.put("k2", "v2", {"sql": "SELECT 2"})
+    cache.close()
+
+    reopened = PersistentResponseCache(path)
+    assert reopened.purge("v2") == 1
+    assert reopened.get_many(["k1", "k2"]) == {"k2": {"sql": "SELECT 2"}}
+    reopened.close()
+
+def test_persistent_cache_expires_entries(tmp_path):
+    cache = PersistentResponseCache(str(tmp_path / "cache.db"), ttl=0.05)
+    cache.put("k", "v", {"sql": "SELECT 1"})
+    time.sleep(0.1)
+    assert cache.get("k") is None
+    cache.close()
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_responses_survive_restart_and_warm_from_history(mock_openai_class, tmp_path, monkeypatch):
+    mock_client = _mock_response(mock_openai_class, '{"intent": "list", "sql": "SELECT * FROM users", "entities": {}}')
+    monkeypatch.setattr(settings, "QUERY_CACHE_PATH", str(tmp_path / "cache.db"))
+    engine = LearningEngine(storage_path=str(tmp_path / "learning_data.json"), storage_format="json")
+
+    first = QueryProcessor()
+    first.learning_engine = engine
+    first.process("show all users")
+    first.process("Show all users!")
+    first.persistent_cache.close()
+
+    restarted = QueryProcessor()
+    restarted.learning_engine = engine
+    assert restarted.warm_cache() == 1
+    assert len(restarted.response_cache) == 1
+    assert restarted.process("show all users")["cached"] is True
+    assert mock_client.chat.completions.create.call_count == 1
+    assert restarted.response_cache.stats()["hits"] == 1
+    restarted.persistent_cache.close()
@@ -0,0 +1,89 @@
+import time
+import pytest
+
+from backend.result_cache import ResultCache, classify_sql
+
+@pytest.fixture
+def cache():
+    return ResultCache(ttl=60, max_bytes=10000)
+
+def _put(cache, key, tables, rows=((1, "a"),), database="db"):
+    cache.put(key, database, frozenset(tables), ["id", "name"], list(rows), cache.generation(database))
+
+def test_classify_read_only_selects():
+    statement = classify_sql("SELECT o.id FROM dbo.Orders o, items AS i JOIN [Customers] c ON c.id = o.customer_id")
+    assert statement.read_only
+    assert statement.tables == {"orders", "customers", "items"}
+    assert classify_sql("WITH recent AS (SELECT * FROM orders) SELECT * FROM recent").read_only
+    # Keywords inside strings and comments do not count
+    assert classify_sql("SELECT 'DELETE FROM users' AS note -- UPDATE\nFROM t").read_only
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * INTO backup FROM orders",
+    "SELECT * FROM orders FOR UPDATE",
+    "SELECT 1; DELETE FROM orders",
+    "SELECT '--'; DELETE FROM orders",
+    "DELETE FROM orders",
+    "EXEC refresh_orders",
+])
+def test_classify_statements_that_write(sql):
+    assert not classify_sql(sql).read_only
+
+def test_classify_write_tables():
+    assert classify_sql("UPDATE sales.orders SET total = 0").tables == {"orders"}
+    assert classify_sql("INSERT INTO order_items (id) VALUES (1)").tables == {"order_items"}
+    assert classify_sql("EXEC refresh_orders").tables is None
+
+def test_normalized_text_ignores_layout():
+    assert classify_sql("SELECT id\n  FROM t; ").normalized == classify_sql("SELECT id FROM t /* all */").normalized
+    assert classify_sql("SELECT 'a  b'").normalized != classify_sql("SELECT 'a b'").normalized
+
+def test_hit_reports_age(cache):
+    _put(cache, "k", ["orders"])
+    time.sleep(0.01)
+    result = cache.get("k")
+    assert result.rows == [(1, "a")]
+    assert result.age >= 0.01
+    assert cache.get("other") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_entries_expire():
+    cache = ResultCache(ttl=0.01, max_bytes=10000)
+    _put(cache, "k", ["orders"])
+    time.sleep(0.02)
+    assert cache.get("k") is None
+    assert cache.stats()["entries"] == 0
+
+def test_byte_bound_evicts_least_recently_used():
+    cache = ResultCache(ttl=60, max_bytes=100)
+    rows = [(1, "x" * 20)]
+    _put(cache, "a", ["t"], rows)
+    _put(cache, "b", ["t"], rows)
+    cache.get("a")
+    _put(cache, "c", ["t"], rows)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_write_invalidates_only_results_of_its_tables(cache):
+    _put(cache, "orders", ["orders", "customers"])
+    _put(cache, "items", ["items"])
+    _put(cache, "other db", ["orders"], database="other")
+    assert cache.invalidate("db", frozenset({"customers"})) == 1
+    assert cache.get("orders") is None
+    assert cache.get("items") is not None
+    assert cache.get("other db") is not None
+    # Unknown tables invalidate the whole database
+    assert cache.invalidate("db", None) == 1
+    assert cache.get("items") is None
+
+def test_results_read_before_a_write_are_not_stored(cache):
+    generation = cache.generation("db")
+    cache.invalidate("db", frozenset({"orders"}))
+    cache.put("k", "db", frozenset({"orders"}), ["id"], [(1,)], generation)
+    assert cache.get("k") is None
+
+def test_results_without_tables_are_not_stored(cache):
+    cache.put("k", "db", frozenset(), ["one"], [(1,)], cache.generation("db"))
+    assert cache.get("k") is None
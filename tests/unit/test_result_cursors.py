@@ -0,0 +1,73 @@
+import time
+import pytest
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+
+from backend.config.settings import settings
+from backend.result_cursors import CursorExpiredError, CursorRegistry
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pages.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, payload TEXT)"))
+        conn.execute(text("INSERT INTO t (id, payload) VALUES (:id, :payload)"),
+                     [{"id": i, "payload": "x" * 100} for i in range(30)])
+    yield engine
+    engine.dispose()
+
+def _open(registry, engine, owner="alice"):
+    conn = engine.connect()
+    result = conn.execution_options(yield_per=10).execute(text("SELECT id, payload FROM t ORDER BY id"))
+    return registry.open(conn, result, owner), conn
+
+def test_pages_resume_where_the_previous_one_stopped(engine):
+    registry = CursorRegistry()
+    cursor, conn = _open(registry, engine)
+    _, rows, token = registry.read(cursor, 12)
+    assert [row[0] for row in rows] == list(range(12))
+    _, rows, token = registry.read(registry.resume(token, "alice"), 12)
+    assert [row[0] for row in rows] == list(range(12, 24))
+    _, rows, token = registry.read(registry.resume(token, "alice"), 12)
+    assert [row[0] for row in rows] == list(range(24, 30))
+    assert token is None
+    assert conn.closed
+
+def test_exact_last_page_has_no_token(engine):
+    registry = CursorRegistry()
+    cursor, _ = _open(registry, engine)
+    _, rows, token = registry.read(cursor, 30)
+    assert len(rows) == 30 and token is None
+
+def test_byte_cap_moves_rows_to_the_next_page(engine):
+    registry = CursorRegistry()
+    cursor, _ = _open(registry, engine)
+    with patch.object(settings, "DB_MAX_BYTES", 400):
+        _, rows, token = registry.read(cursor, 30)
+    assert len(rows) == 3
+    _, rows, _ = registry.read(registry.resume(token, "alice"), 30)
+    assert rows[0][0] == 3 and len(rows) == 27
+
+def test_tokens_belong_to_their_user(engine):
+    registry = CursorRegistry()
+    cursor, _ = _open(registry, engine)
+    _, _, token = registry.read(cursor, 5)
+    with pytest.raises(CursorExpiredError):
+        registry.resume(token, "mallory")
+    assert registry.resume(token, "alice") is cursor
+
+def test_idle_and_surplus_cursors_are_closed(engine):
+    registry = CursorRegistry()
+    with patch.object(settings, "DB_CURSOR_MAX_OPEN", 1):
+        first, first_conn = _open(registry, engine)
+        _, _, first_token = registry.read(first, 5)
+        second, _ = _open(registry, engine)
+        _, _, second_token = registry.read(second, 5)
+    assert first_conn.closed
+    with pytest.raises(CursorExpiredError):
+        registry.resume(first_token, "alice")
+    with patch.object(settings, "DB_CURSOR_IDLE_TTL", 0.01):
+        time.sleep(0.02)
+        with pytest.raises(CursorExpiredError):
+            registry.resume(second_token, "alice")
+    assert registry.stats() == {"open": 0}
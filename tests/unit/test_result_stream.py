@@ -0,0 +1,166 @@
+import json
+import tracemalloc
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+import pytest
+from sqlalchemy import create_engine, text
+
+from backend.result_stream import decode_binary, iter_batches, stream_result
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'big.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, payload TEXT)"))
+        conn.execute(text("INSERT INTO t (id, payload) VALUES (:id, :payload)"),
+                     [{"id": i, "payload": "x" * 100} for i in range(50000)])
+    yield engine
+    engine.dispose()
+
+def _stream(engine, query, fmt, batch_size=1000):
+    conn = engine.connect()
+    result = conn.execution_options(yield_per=batch_size).execute(text(query))
+    return conn, stream_result(conn, result, fmt, batch_size)
+
+def test_batches_have_the_requested_size(engine):
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=300).execute(text("SELECT id FROM t WHERE id < 1000"))
+        sizes = [len(rows) for _, rows in iter_batches(result, 300)]
+    assert sizes == [300, 300, 300, 100]
+
+def test_row_cap_truncates_the_stream(engine):
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=300).execute(text("SELECT id FROM t WHERE id < 1000"))
+        batches = iter_batches(result, 300, max_rows=700)
+        assert [len(rows) for _, rows in batches] == [300, 300, 100]
+        assert batches.truncated
+        result = conn.execute(text("SELECT id FROM t WHERE id < 700"))
+        batches = iter_batches(result, 300, max_rows=700)
+        assert sum(len(rows) for _, rows in batches) == 700
+        assert not batches.truncated
+
+@pytest.mark.parametrize("fmt", ["ndjson", "json", "columnar", "binary"])
+def test_truncated_streams_end_with_a_marker(engine, fmt):
+    conn = engine.connect()
+    result = conn.execute(text("SELECT id, payload FROM t"))
+    output = b"".join(chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                      for chunk in stream_result(conn, result, fmt, 100, max_rows=50000, max_bytes=10000))
+    if fmt == "binary":
+        decoded = decode_binary(output)
+        assert decoded["status"] == "truncated"
+        rows = sum(len(batch["data"][0]) for batch in decoded["batches"])
+    elif fmt == "json":
+        document = json.loads(output)
+        assert document["status"] == "truncated"
+        rows = len(document["rows"])
+    else:
+        lines = [json.loads(line) for line in output.decode("utf-8").splitlines()]
+        assert lines[-1]["status"] == "truncated"
+        rows = lines[-1]["row_count"]
+    # Each row is about 120 bytes
+    assert 70 <= rows <= 90
+    assert conn.closed
+
+def test_memory_stays_flat_while_streaming(engine):
+    conn, chunks = _stream(engine, "SELECT id, payload FROM t", "ndjson")
+    tracemalloc.start()
+    count = 0
+    for chunk in chunks:
+        count += chunk.count("\n")
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # One line per row and the trailer
+    assert count == 50001
+    # The encoded result is about 6 MB; only a batch at a time is held
+    assert peak < 2 * 1024 * 1024
+    assert conn.closed
+
+def test_json_output_is_one_document(engine):
+    _, chunks = _stream(engine, "SELECT id FROM t WHERE id < 2500", "json")
+    document = json.loads("".join(chunks))
+    assert len(document["rows"]) == 2500
+    assert document["status"] == "success"
+
+def test_statements_without_rows_stream_an_empty_result(engine):
+    _, chunks = _stream(engine, "UPDATE t SET payload = 'y' WHERE id = 1", "json")
+    assert json.loads("".join(chunks)) == {"rows": [], "status": "success"}
+
+def test_values_json_cannot_encode_are_converted():
+    result = MagicMock()
+    result.returns_rows = True
+    result.keys.return_value = ["day", "amount"]
+    result.fetchmany.side_effect = [[(date(2024, 1, 2), Decimal("1.50"))], []]
+    row, trailer = "".join(stream_result(MagicMock(), result, "ndjson", 10)).splitlines()
+    assert json.loads(row) == {"day": "2024-01-02", "amount": 1.5}
+    assert json.loads(trailer) == {"status": "success", "row_count": 1}
+
+@pytest.mark.parametrize("fmt", ["ndjson", "json"])
+def test_failure_while_streaming_ends_with_an_error_marker(fmt):
+    result = MagicMock()
+    result.returns_rows = True
+    result.keys.return_value = ["id"]
+    result.fetchmany.side_effect = [[(1,)], RuntimeError("connection lost")]
+    conn = MagicMock()
+    output = "".join(stream_result(conn, result, fmt, 10))
+    if fmt == "ndjson":
+        assert json.loads(output.splitlines()[-1])["status"] == "error"
+    else:
+        assert json.loads(output) == {"rows": [{"id": 1}], "status": "error",
+                                      "detail": "A database error occurred while streaming the result."}
+    conn.close.assert_called_once()
+
+def _mock_result(keys, batches):
+    result = MagicMock()
+    result.returns_rows = True
+    result.keys.return_value = keys
+    result.fetchmany.side_effect = list(batches) + [[]]
+    return result
+
+MIXED_ROWS = [
+    (1, 1.5, "a", True, None, b"\x00\x01", Decimal("2.50"), date(2024, 1, 2), datetime(2024, 1, 2, 3, 4, 5), 2 ** 70),
+    (None, 2, None, False, None, None, None, None, None, 1),
+]
+MIXED_KEYS = ["i", "f", "s", "b", "n", "raw", "dec", "day", "ts", "big"]
+MIXED_DTYPES = ["int64", "float64", "string", "bool", "null", "binary", "decimal", "date", "timestamp", "decimal"]
+
+def test_columnar_frames_hold_one_array_per_column():
+    output = "".join(stream_result(MagicMock(), _mock_result(MIXED_KEYS, [MIXED_ROWS]), "columnar", 10))
+    header, batch, trailer = [json.loads(line) for line in output.splitlines()]
+    assert header == {"columns": MIXED_KEYS}
+    assert batch["dtypes"] == MIXED_DTYPES
+    assert batch["data"][0] == [1, None]
+    assert batch["data"][5] == ["AAE=", None]
+    assert batch["data"][8] == ["2024-01-02T03:04:05", None]
+    assert batch["data"][9] == [str(2 ** 70), "1"]
+    assert trailer == {"status": "success", "row_count": 2}
+
+def test_binary_round_trip():
+    data = b"".join(stream_result(MagicMock(), _mock_result(MIXED_KEYS, [MIXED_ROWS, MIXED_ROWS[:1]]), "binary", 10))
+    decoded = decode_binary(data)
+    assert decoded["columns"] == MIXED_KEYS
+    assert decoded["status"] == "success"
+    assert len(decoded["batches"]) == 2
+    first = decoded["batches"][0]
+    assert first["dtypes"] == MIXED_DTYPES
+    assert first["data"][0] == [1, None]
+    assert first["data"][1] == [1.5, 2.0]
+    assert first["data"][3] == [True, False]
+    assert first["data"][4] == [None, None]
+    assert first["data"][5] == [b"\x00\x01", None]
+    assert first["data"][6] == ["2.50", None]
+    assert first["data"][7] == ["2024-01-02", None]
+
+def test_binary_failure_sets_the_error_status():
+    result = _mock_result(["id"], [[(1,)]])
+    result.fetchmany.side_effect = [[(1,)], RuntimeError("connection lost")]
+    decoded = decode_binary(b"".join(stream_result(MagicMock(), result, "binary", 10)))
+    assert decoded["status"] == "error"
+    assert decoded["batches"][0]["data"] == [[1]]
+
+def test_columnar_formats_are_smaller_than_rows(engine):
+    sizes = {}
+    for fmt in ("json", "columnar", "binary"):
+        _, chunks = _stream(engine, "SELECT id, payload AS description_of_the_item FROM t WHERE id < 5000", fmt)
+        sizes[fmt] = sum(len(chunk) for chunk in chunks)
+    assert sizes["columnar"] < sizes["json"] and sizes["binary"] < sizes["json"]
@@ -0,0 +1,78 @@
+import gzip
+import json
+import os
+from datetime import datetime
+import pytest
+
+from ai.feedback_processor import FeedbackProcessor
+from ai.learning.learning_engine import LearningEngine
+from ai.learning.retention import LearningArchive, RetentionManager, RetentionPolicy
+
+@pytest.fixture
+def storage_path(tmp_path):
+    return str(tmp_path / "learning_data.json")
+
+def _seed(engine, days):
+    # Interactions recorded on 2026-01-<day>, oldest first
+    for day in days:
+        engine.store.append("interactions", {"id": f"i{day}", "natural_query": f"q{day}", "success": True,
+                                             "feedback": f"f{day}", "timestamp": f"2026-01-{day:02d}T12:00:00"})
+
+@pytest.mark.parametrize("storage_format", ["json", "journal", "sqlite"])
+def test_retention_by_count_archives_oldest(storage_path, storage_format):
+    engine = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    _seed(engine, range(1, 6))
+
+    archived = engine.apply_retention(max_records=2)
+    assert archived["interactions"] == 3
+    assert [i["natural_query"] for i in engine.get_interactions()] == ["q4", "q5"]
+    engine.close()
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    assert reloaded.count_interactions() == 2
+    history = [i["natural_query"] for i in reloaded.iter_interaction_history()]
+    assert history == ["q1", "q2", "q3", "q4", "q5"]
+    reloaded.close()
+
+def test_retention_by_age(storage_path):
+    engine = LearningEngine(storage_path=storage_path, storage_format="json")
+    _seed(engine, range(1, 6))
+    engine.record_correction("wrong", "right")
+
+    manager = RetentionManager(engine, engine.archive, RetentionPolicy(max_age_days=2))
+    manager.run(now=datetime(2026, 1, 5, 0, 0))
+
+    assert [i["natural_query"] for i in engine.get_interactions()] == ["q3", "q4", "q5"]
+    assert len(engine.learning_data["corrections"]) == 1
+    with open(storage_path) as f:
+        assert len(json.load(f)["interactions"]) == 3
+
+def test_retention_disabled_by_default(storage_path):
+    engine = LearningEngine(storage_path=storage_path, storage_format="json")
+    _seed(engine, range(1, 3))
+    assert engine.apply_retention() == {"interactions": 0, "patterns": 0, "corrections": 0}
+    assert not os.path.exists(engine.archive.directory)
+
+def test_archive_reads_only_overlapping_segments(tmp_path):
+    archive = LearningArchive(str(tmp_path / "archive"))
+    archive.write_segment("interactions", [{"timestamp": "2026-01-01T00:00:00"}, {"timestamp": "2026-01-02T00:00:00"}])
+    archive.write_segment("interactions", [{"timestamp": "2026-02-01T00:00:00"}])
+
+    assert len(archive.segments("interactions", since="2026-01-15")) == 1
+    assert [r["timestamp"] for r in archive.iter_records("interactions", since="2026-01-02", until="2026-02-01")] \
+        == ["2026-01-02T00:00:00"]
+    with gzip.open(archive.segments("interactions")[0], "rt") as f:
+        assert len(f.readlines()) == 2
+    # Files that do not follow the segment naming are skipped
+    open(os.path.join(archive.directory, "interactions_backup.jsonl.gz"), "wb").close()
+    assert len(archive.segments("interactions")) == 2
+
+def test_feedback_processor_reads_archive_for_long_ranges(storage_path):
+    engine = LearningEngine(storage_path=storage_path, storage_format="journal")
+    _seed(engine, range(1, 6))
+    engine.apply_retention(max_records=1)
+    processor = FeedbackProcessor(engine)
+
+    assert processor.analyze_feedback_patterns()["total_feedback"] == 1
+    assert processor.analyze_feedback_patterns(since="2026-01-02")["total_feedback"] == 4
+    assert len(processor.get_feedback_data(include_archive=True)) == 5
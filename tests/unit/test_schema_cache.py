@@ -0,0 +1,151 @@
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from sqlalchemy import create_engine, text
+
+from ai.nlp.schema_cache import SchemaCache, SchemaSnapshot, introspect, select_relevant
+from ai.nlp.query_processor import QueryProcessor
+from backend.routes.db import DBConnection, _schema_label
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'shop.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE customers (id INTEGER PRIMARY KEY, name TEXT, email TEXT)"))
+        conn.execute(text("CREATE TABLE orders (id INTEGER PRIMARY KEY, customer_id INTEGER, total REAL, created_at TEXT)"))
+        conn.execute(text("CREATE TABLE OrderItems (id INTEGER PRIMARY KEY, order_id INTEGER, product_id INTEGER)"))
+        conn.execute(text("CREATE TABLE products (id INTEGER PRIMARY KEY, title TEXT, price REAL)"))
+        conn.execute(text("CREATE TABLE audit_log (id INTEGER PRIMARY KEY, event TEXT)"))
+    yield engine
+    engine.dispose()
+
+def test_introspect_lists_tables_and_columns(engine):
+    tables = introspect(engine)
+    assert set(tables) == {"customers", "orders", "OrderItems", "products", "audit_log"}
+    assert tables["orders"] == ["id", "customer_id", "total", "created_at"]
+
+@pytest.mark.parametrize("query, expected", [
+    ("show the total of all orders per customer", {"orders", "customers"}),
+    ("which product has the highest price", {"products"}),
+    ("list the order items of order 5", {"OrderItems", "orders"}),
+    ("how many custmers signed up", {"customers"}),
+])
+def test_relevant_tables_are_selected(engine, query, expected):
+    assert set(select_relevant(query, SchemaSnapshot("shop", introspect(engine)))) == expected
+
+def test_unrelated_query_selects_nothing(engine):
+    assert select_relevant("what is the weather like", SchemaSnapshot("shop", introspect(engine))) == {}
+
+def test_matched_columns_survive_the_column_cap():
+    snapshot = SchemaSnapshot("wide", {"events": [f"c{i}" for i in range(50)] + ["severity"]})
+    assert select_relevant("events by severity", snapshot, max_columns=3)["events"] == ["c0", "c1", "severity"]
+
+def test_selection_is_fast():
+    snapshot = SchemaSnapshot("big", {f"table_{i}_data": ["id", "name", f"value_{i}"] for i in range(2000)})
+    start = time.perf_counter()
+    for _ in range(10):
+        select_relevant("show the name of table 7 data", snapshot)
+    assert (time.perf_counter() - start) / 10 < 0.1
+
+def test_stale_schema_is_refreshed_in_the_background(engine):
+    cache = SchemaCache(ttl=0.01)
+    old = cache.load("shop", lambda: engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE invoices (id INTEGER PRIMARY KEY)"))
+    time.sleep(0.02)
+    # The stale snapshot keeps serving while it is reloaded
+    assert cache.get("shop") is old
+    deadline = time.monotonic() + 5
+    while cache.get("shop") is old and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "invoices" in cache.get("shop").tables
+
+def test_refresh_on_demand(engine):
+    cache = SchemaCache(ttl=0)
+    cache.load("shop", lambda: engine, owner="alice")
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE audit_log"))
+    assert "audit_log" in cache.get("shop").tables
+    assert "audit_log" not in cache.refresh("shop").tables
+    assert cache.stats("alice")["active_source"] == "shop"
+
+def test_active_schema_is_per_user(engine, tmp_path):
+    other = create_engine(f"sqlite:///{tmp_path / 'hr.db'}")
+    with other.begin() as conn:
+        conn.execute(text("CREATE TABLE employees (id INTEGER PRIMARY KEY)"))
+    cache = SchemaCache(ttl=0)
+    cache.load("shop-key", lambda: engine, owner="alice", label="sqlite://alice@shop")
+    cache.load("hr-key", lambda: other, owner="bob", label="sqlite://bob@hr")
+    assert cache.source_of("alice") == "shop-key"
+    assert cache.source_of("bob") == "hr-key"
+    # Users only see the databases they used themselves
+    assert list(cache.stats("alice")["sources"]) == ["sqlite://alice@shop"]
+    assert cache.stats("carol") == {"active_source": None, "sources": {}}
+    # A known database becomes active without being introspected again
+    assert cache.use("alice", "hr-key")
+    assert cache.source_of("alice") == "hr-key"
+    assert not cache.use("alice", "unknown")
+    other.dispose()
+
+def test_background_load_makes_the_schema_active(engine):
+    cache = SchemaCache(ttl=60)
+    cache.load_in_background("shop", lambda: engine, owner="alice")
+    deadline = time.monotonic() + 5
+    while cache.source_of("alice") is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert "orders" in cache.get("shop").tables
+
+def test_schema_label_has_no_password():
+    connection = DBConnection(db_type="postgresql", host="db", port=5432, database="shop",
+                              username="app", password="secret")
+    assert _schema_label("postgresql", connection) == "postgresql://app@db:5432/shop"
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_prompt_lists_only_relevant_tables(mock_openai_class, engine):
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+    assert "tables like users, orders, products" in processor._build_prompt("total of orders per customer")
+    key_without_schema = processor._cache_key("total of orders per customer")
+
+    snapshot = processor.load_schema("shop", lambda: engine, owner="alice")
+    prompt = processor._build_prompt("total of orders per customer", snapshot)
+    assert "- orders(id, customer_id, total, created_at)" in prompt
+    assert "- customers(id, name, email)" in prompt
+    assert "products" not in prompt and "audit_log" not in prompt
+    # A query that names no table still gets the real schema rather than a made-up one
+    with patch('ai.nlp.query_processor.settings.SCHEMA_PROMPT_MAX_TABLES', 2):
+        prompt = processor._schema_prompt("what happened yesterday", snapshot)
+    assert "tables like users" not in prompt
+    assert "following tables, among others" in prompt
+    assert prompt.count("\n- ") == 2
+    # Responses generated for another schema are not reused
+    assert processor._cache_key("total of orders per customer", snapshot) != key_without_schema
+    # The local tier resolves names against the introspected schema of the query's source only
+    assert processor.process("show all customers", "shop")["tier"] == "local"
+    assert processor.process("show all customers")["tier"] != "local"
+
+@patch('ai.nlp.query_processor.openai.OpenAI')
+def test_cache_is_warmed_once_per_schema(mock_openai_class, engine):
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+    processor.warm_cache = MagicMock(return_value=0)
+    processor.load_schema("shop", lambda: engine, owner="alice")
+    processor.load_schema("shop", lambda: engine, owner="bob")
+    assert processor.warm_cache.call_count == 1
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE refunds (id INTEGER PRIMARY KEY)"))
+    processor.load_schema("shop", lambda: engine, owner="alice")
+    assert processor.warm_cache.call_count == 2
+
+def test_snapshots_get_engines_from_the_registry(engine, tmp_path):
+    from backend.engine_registry import EngineRegistry
+    registry = EngineRegistry(max_engines=4, idle_timeout=0)
+    url = f"sqlite:///{tmp_path / 'shop.db'}"
+    cache = SchemaCache(ttl=60)
+    cache.load("shop", lambda: registry.get("shop", "sqlite", url))
+    registry.dispose_all()
+    # A refresh after the registry disposed the engine goes through the registry again
+    assert "orders" in cache.refresh("shop").tables
+    assert registry.created == 2
+    assert len(registry.stats()["engines"]) == 1
+    registry.dispose_all()
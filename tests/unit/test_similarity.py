@@ -0,0 +1,141 @@
+import os
+import threading
+import pytest
+
+from ai.learning.learning_engine import LearningEngine
+from ai.learning.similarity import SimilarityIndex, _Segment, normalize_query
+
+@pytest.fixture
+def index_dir(tmp_path):
+    return str(tmp_path / "similarity")
+
+def test_normalize_query():
+    assert normalize_query("  Show ALL   customers! ") == "show all customers"
+
+def test_search_ranks_by_similarity(index_dir):
+    index = SimilarityIndex(index_dir)
+    index.add("show all customers", "SELECT * FROM customers")
+    index.add("count orders by month", "SELECT month, COUNT(*) FROM orders GROUP BY month")
+    index.add("list active customers", "SELECT * FROM customers WHERE active = 1")
+
+    results = index.search("show all the customers", k=2)
+    assert [document["natural_query"] for document, _ in results] == ["show all customers", "list active customers"]
+    assert results[0][1] > results[1][1]
+    assert index.search("show all customers", threshold=0.99)[0][1] == pytest.approx(1.0, abs=1e-3)
+    assert index.search("zzz qqq", threshold=0.5) == []
+
+def test_duplicate_queries_update_in_place(index_dir):
+    index = SimilarityIndex(index_dir)
+    index.add("show all customers", "SELECT 1")
+    index.add("Show all customers!", "SELECT * FROM customers")
+    assert len(index) == 1
+    assert index.search("show all customers")[0][0]["generated_sql"] == "SELECT * FROM customers"
+
+def test_segments_match_delta_scores(index_dir):
+    sealed = SimilarityIndex(index_dir, merge_every=2, max_segments=2)
+    unsealed = SimilarityIndex(index_dir + "2")
+    queries = [f"show orders for customer {i}" for i in range(7)] + ["count products"]
+    for query in queries:
+        sealed.add(query, "SELECT 1")
+        unsealed.add(query, "SELECT 1")
+
+    sealed.sync()
+    fresh = SimilarityIndex(index_dir).open()
+    assert len(fresh._segments) <= 2
+    # Sealed segments keep the IDF of the moment they were built, so scores drift only slightly
+    expected = unsealed.search("orders for customer 3", k=3)
+    actual = fresh.search("orders for customer 3", k=3)
+    assert actual[0][0]["natural_query"] == expected[0][0]["natural_query"] == "show orders for customer 3"
+    assert [score for _, score in actual] == pytest.approx([score for _, score in expected], abs=0.01)
+    assert len(fresh) == len(queries)
+
+def test_persisted_index_is_memory_mapped(index_dir):
+    index = SimilarityIndex(index_dir, merge_every=1)
+    index.add("show all customers", "SELECT * FROM customers")
+    index.sync()
+
+    reloaded = SimilarityIndex(index_dir).open()
+    assert reloaded._segments[0].docs.__class__.__name__ == "memmap"
+    assert reloaded.search("customers")[0][0]["generated_sql"] == "SELECT * FROM customers"
+
+def test_engine_indexes_incrementally_and_persists(tmp_path):
+    storage_path = str(tmp_path / "learning_data.json")
+    engine = LearningEngine(storage_path=storage_path, storage_format="json")
+    engine.record_interaction("show all customers", "SELECT * FROM customers", True)
+    engine.record_interaction("broken query", None, False, error="boom")
+
+    assert engine.find_similar_patterns("show customers", threshold=0.3)[0]["natural_query"] == "show all customers"
+    engine.record_query_pattern("count all orders", "SELECT COUNT(*) FROM orders", True)
+    assert engine.find_similar_patterns("count orders", threshold=0.3)[0]["generated_sql"] == "SELECT COUNT(*) FROM orders"
+    assert engine.find_similar_patterns("broken query", threshold=0.5) == []
+    engine.record_query_pattern("failed pattern", "SELECT bad", False)
+    assert engine.find_similar_patterns("failed pattern", threshold=0.5) == []
+    engine.close()
+    assert os.path.exists(storage_path + ".similarity/meta.json")
+
+    reloaded = LearningEngine(storage_path=storage_path, storage_format="json")
+    matches = reloaded.find_similar_patterns("count orders", threshold=0.3)
+    assert matches[0]["natural_query"] == "count all orders"
+    assert 0.3 <= matches[0]["similarity"] <= 1.0
+
+def test_documents_are_compacted_when_a_segment_is_saved(index_dir):
+    index = SimilarityIndex(index_dir, merge_every=100)
+    index.add("show all customers", "SELECT 1")
+    index.sync()
+    for i in range(5):
+        index.add("show all customers", f"SELECT {i + 2}")
+        index.sync()
+    path = os.path.join(index_dir, "documents.jsonl")
+    with open(path) as f:
+        assert len(f.readlines()) == 6
+    index.add("count orders", "SELECT COUNT(*) FROM orders")
+    index.sync()
+    with open(path) as f:
+        assert len(f.readlines()) == 2
+    assert SimilarityIndex(index_dir).open().search("show all customers")[0][0]["generated_sql"] == "SELECT 6"
+
+def test_search_reuses_its_score_buffer(index_dir):
+    index = SimilarityIndex(index_dir, merge_every=2)
+    for i in range(5):
+        index.add(f"show orders for customer {i}", "SELECT 1")
+    buffer = index._score_buffer()
+    first = index.search("orders for customer 3", k=2)
+    assert index._score_buffer() is buffer
+    assert not buffer.any()
+    assert index.search("orders for customer 3", k=2) == first
+
+def test_sync_does_not_block_adds_and_searches(index_dir, monkeypatch):
+    index = SimilarityIndex(index_dir)
+    index.add("show all customers", "SELECT * FROM customers")
+    saving, release = threading.Event(), threading.Event()
+    save = _Segment.save
+    def slow_save(segment, directory):
+        saving.set()
+        release.wait(5)
+        save(segment, directory)
+    monkeypatch.setattr(_Segment, "save", slow_save)
+    sync = threading.Thread(target=index.sync)
+    sync.start()
+    assert saving.wait(5)
+    # The segment is being written; the index stays usable
+    index.add("count orders", "SELECT COUNT(*) FROM orders")
+    assert index.search("count orders")[0][0]["natural_query"] == "count orders"
+    assert sync.is_alive()
+    release.set()
+    sync.join()
+    # The document added during the save is written by the next sync
+    assert len(SimilarityIndex(index_dir).open()) == 1
+    index.sync()
+    assert len(SimilarityIndex(index_dir).open()) == 2
+
+def test_engine_saves_sealed_segments_in_the_background(tmp_path, monkeypatch):
+    engine = LearningEngine(storage_path=str(tmp_path / "learning_data.json"), storage_format="json")
+    engine.find_similar_patterns("warm up")
+    engine.similarity_index.merge_every = 2
+    calls = []
+    monkeypatch.setattr(engine.similarity_index, "sync", lambda source=None: calls.append(threading.current_thread().name))
+    engine.record_interaction("show all customers", "SELECT * FROM customers", True)
+    engine.record_interaction("count orders", "SELECT COUNT(*) FROM orders", True)
+    engine._similarity_sync.join()
+    assert calls == ["similarity-sync"]
+    engine.close()
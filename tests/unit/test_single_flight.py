@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock, AsyncMock
+
+from ai.nlp.query_processor import QueryProcessor
+from ai.nlp.single_flight import SingleFlight
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def slow():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return {"rows": [1]}
+
+    results = await asyncio.gather(*(flight.do("k", slow) for _ in range(5)))
+    assert calls == 1
+    assert results == [{"rows": [1]}] * 5
+    # Every caller gets its own copy
+    results[0]["rows"].append(2)
+    assert results[1] == {"rows": [1]}
+    assert flight.stats() == {"in_flight": 0, "executed": 1, "coalesced": 4}
+
+@pytest.mark.asyncio
+async def test_failure_does_not_poison_retries():
+    flight = SingleFlight()
+    attempts = 0
+
+    async def flaky():
+        nonlocal attempts
+        attempts += 1
+        await asyncio.sleep(0.01)
+        if attempts == 1:
+            raise RuntimeError("boom")
+        return "ok"
+
+    results = await asyncio.gather(flight.do("k", flaky), flight.do("k", flaky), return_exceptions=True)
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert await flight.do("k", flaky) == "ok"
+    assert attempts == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_others():
+    flight = SingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.ensure_future(flight.do("k", slow))
+    second = asyncio.ensure_future(flight.do("k", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
+
+@pytest.mark.asyncio
+@patch('ai.nlp.query_processor.openai.AsyncOpenAI')
+async def test_processor_coalesces_identical_queries(mock_async_openai_class):
+    async def create(**kwargs):
+        await asyncio.sleep(0.05)
+        response = MagicMock()
+        response.choices = [MagicMock()]
+        response.choices[0].message.content = '{"intent": "x", "sql": "SELECT 1", "entities": {}}'
+        return response
+
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=create)
+    mock_async_openai_class.return_value = mock_client
+    processor = QueryProcessor()
+    processor.learning_engine = MagicMock()
+
+    results = await asyncio.gather(*(processor.aprocess(q) for q in ["Show one", "show one?", "SHOW ONE", "other"]))
+    assert mock_client.chat.completions.create.await_count == 2
+    assert all(result["generated_sql"] == "SELECT 1" for result in results)
+    assert processor.single_flight.coalesced == 2
+    # Every caller is still recorded
+    assert processor.learning_engine.record_interaction.call_count == 4
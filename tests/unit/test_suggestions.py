@@ -0,0 +1,86 @@
+import time
+import pytest
+
+from ai.learning.learning_engine import LearningEngine
+from ai.learning.suggestions import SuggestionIndex
+
+def test_suggestions_ranked_by_frequency():
+    index = SuggestionIndex()
+    for query in ["show all customers", "show all orders", "show all orders", "count orders"]:
+        index.record(query, "2026-01-01T00:00:00")
+
+    assert index.suggest("show") == ["show all orders", "show all customers"]
+    assert index.suggest("SHOW  all c") == ["show all customers"]
+    assert index.suggest("show ") == ["show all orders", "show all customers"]
+    assert index.suggest("list") == []
+    assert index.suggest("") == ["show all orders", "show all customers", "count orders"]
+
+def test_recent_queries_outrank_old_ones():
+    index = SuggestionIndex(half_life_days=1)
+    index.record("show old report", "2026-01-01T00:00:00")
+    index.record("show old report", "2026-01-01T00:00:00")
+    index.record("show new report", "2026-01-10T00:00:00")
+    assert index.suggest("show", limit=1) == ["show new report"]
+
+def test_long_prefixes_use_sorted_keys():
+    index = SuggestionIndex(trie_depth=3)
+    index.record("show all customers")
+    index.record("show all orders")
+    assert index.suggest("show all o") == ["show all orders"]
+
+def test_prunes_lowest_scoring_entries():
+    index = SuggestionIndex(max_entries=10)
+    index.record("frequent query", "2026-01-01T00:00:00")
+    index.record("frequent query", "2026-01-01T00:00:00")
+    for i in range(20):
+        index.record(f"rare query {i}", f"2026-01-01T00:{i:02d}:00")
+    assert len(index) <= 10
+    assert index.suggest("fre") == ["frequent query"]
+    assert index.suggest("rare query 0") == []
+
+def test_recorded_ids_are_pruned_without_catch_up():
+    index = SuggestionIndex()
+    for i in range(10000):
+        index.record("show all orders", f"2026-01-01T{i // 3600:02d}:{i // 60 % 60:02d}:{i % 60:02d}", f"id-{i}")
+    # Only IDs within the catch-up overlap window are kept
+    assert len(index._recent_ids) <= 1024
+    assert "id-9999" in index._recent_ids
+    index.record("show all orders", "2026-01-01T02:46:39", "id-9999")
+    assert index._entries["show all orders"].count == 10000
+
+def test_suggest_is_fast():
+    index = SuggestionIndex()
+    for i in range(20000):
+        index.record(f"show orders for customer {i}")
+    start = time.perf_counter()
+    for _ in range(1000):
+        index.suggest("show ord")
+    assert (time.perf_counter() - start) / 1000 < 0.001
+
+def test_engine_suggestions_follow_successful_interactions(tmp_path):
+    engine = LearningEngine(storage_path=str(tmp_path / "learning_data.json"), storage_format="json")
+    engine.record_interaction("show all customers", "SELECT * FROM customers", True)
+    engine.record_interaction("show broken thing", None, False, error="boom")
+
+    assert engine.get_query_suggestions("show") == ["show all customers"]
+    engine.record_interaction("show all orders", "SELECT * FROM orders", True)
+    engine.record_interaction("show all orders", "SELECT * FROM orders", True)
+    assert engine.get_query_suggestions("show") == ["show all orders", "show all customers"]
+
+@pytest.mark.parametrize("storage_format", ["journal", "sqlite"])
+def test_engine_picks_up_other_workers_queries(tmp_path, storage_format, monkeypatch):
+    storage_path = str(tmp_path / "learning_data.json")
+    worker_a = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    worker_b = LearningEngine(storage_path=storage_path, storage_format=storage_format)
+    worker_a.store.refresh_interval = 0
+    worker_a.record_interaction("show all customers", "SELECT 1", True)
+    assert worker_a.get_query_suggestions("show") == ["show all customers"]
+
+    worker_b.record_interaction("show all orders", "SELECT 2", True)
+    from backend.config.settings import settings
+    monkeypatch.setattr(settings, "LEARNING_SUGGESTION_REFRESH_INTERVAL", 0)
+    assert sorted(worker_a.get_query_suggestions("show")) == ["show all customers", "show all orders"]
+    # The local query is not counted twice by the catch-up
+    assert worker_a.suggestion_index._entries["show all customers"].count == 1
+    worker_a.close()
+    worker_b.close()
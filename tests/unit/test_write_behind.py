@@ -0,0 +1,118 @@
+import threading
+import time
+import pytest
+
+from ai.learning.learning_engine import LearningEngine
+from ai.learning.write_behind import WriteBehindBuffer
+
+def test_flushes_on_batch_size():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, batch_size=3, flush_interval=10)
+    for i in range(3):
+        buffer.submit({"i": i})
+    buffer.flush()
+    assert batches == [[{"i": 0}, {"i": 1}, {"i": 2}]]
+    buffer.close()
+
+def test_flushes_on_interval():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, batch_size=100, flush_interval=0.05)
+    buffer.submit({"i": 0})
+    time.sleep(0.3)
+    assert batches == [[{"i": 0}]]
+    buffer.close()
+
+def test_close_flushes_pending_entries():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, batch_size=100, flush_interval=10)
+    buffer.submit({"i": 0})
+    buffer.submit({"i": 1})
+    buffer.close()
+    assert [entry for batch in batches for entry in batch] == [{"i": 0}, {"i": 1}]
+    # Late writers fall back to writing synchronously
+    buffer.submit({"i": 2})
+    assert batches[-1] == [{"i": 2}]
+
+def test_close_with_a_full_queue_does_not_deadlock():
+    release = threading.Event()
+    written = []
+
+    def slow_flush(batch):
+        release.wait()
+        written.extend(batch)
+
+    buffer = WriteBehindBuffer(slow_flush, max_queue=1, batch_size=1, flush_interval=10)
+    buffer.submit({"i": 0})
+    time.sleep(0.05)
+    buffer.submit({"i": 1})
+    closer = threading.Thread(target=buffer.close)
+    closer.start()
+    time.sleep(0.05)
+    release.set()
+    closer.join(timeout=2)
+    assert not closer.is_alive()
+    assert [entry["i"] for entry in written] == [0, 1]
+
+def test_backpressure_blocks_when_full():
+    release = threading.Event()
+    written = []
+
+    def slow_flush(batch):
+        release.wait()
+        written.extend(batch)
+
+    buffer = WriteBehindBuffer(slow_flush, max_queue=1, batch_size=1, flush_interval=10)
+    buffer.submit({"i": 0})  # taken by the flusher, which then blocks
+    time.sleep(0.05)
+    buffer.submit({"i": 1})  # fills the queue
+    producer = threading.Thread(target=buffer.submit, args=({"i": 2},))
+    producer.start()
+    time.sleep(0.05)
+    assert producer.is_alive()
+    assert buffer.metrics()["blocked_submits"] == 1
+
+    release.set()
+    producer.join(timeout=1)
+    buffer.close()
+    assert [entry["i"] for entry in written] == [0, 1, 2]
+
+def test_metrics_report_queue_and_latency():
+    buffer = WriteBehindBuffer(lambda batch: None, batch_size=2, flush_interval=10)
+    buffer.submit({"i": 0})
+    buffer.submit({"i": 1})
+    buffer.flush()
+    metrics = buffer.metrics()
+    assert metrics["queue_depth"] == 0
+    assert metrics["records_flushed"] == 2
+    assert metrics["batches_flushed"] == 1
+    assert metrics["avg_flush_ms"] >= 0
+    buffer.close()
+
+@pytest.mark.parametrize("storage_format", ["json", "journal", "sqlite"])
+def test_engine_write_behind(tmp_path, storage_format):
+    path = str(tmp_path / "learning_data.json")
+    engine = LearningEngine(storage_path=path, storage_format=storage_format, write_behind=True)
+    engine.record_interaction("query1", "sql1", True)
+    engine.record_interaction("query2", "sql2", True)
+    engine.flush()
+    engine.add_feedback_to_interaction(1, "good")
+    engine.close()
+
+    reloaded = LearningEngine(storage_path=path, storage_format=storage_format, write_behind=False)
+    interactions = reloaded.get_interactions()
+    assert [i["natural_query"] for i in interactions] == ["query1", "query2"]
+    assert interactions[1]["feedback"] == "good"
+    reloaded.close()
+
+
+def test_sqlite_write_behind_reads_its_own_writes(tmp_path):
+    engine = LearningEngine(storage_path=str(tmp_path / "learning_data.json"), storage_format="sqlite",
+                            write_behind=True)
+    engine.write_buffer.flush_interval = 10
+    for i in range(4):
+        engine.record_interaction(f"show all users {i}", "SELECT * FROM users", True)
+    assert len(engine.get_interaction_page(10)["interactions"]) == 4
+    assert engine.count_interactions() == 4
+    assert engine.get_query_suggestions("show")
+    assert engine.find_similar_patterns("show all users 1", threshold=0.5)
+    engine.close()